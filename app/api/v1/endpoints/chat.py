@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, Header
-from typing import List
-from datetime import datetime
-from pydantic import BaseModel
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Header, Query
+from typing import List, Optional
+from pydantic import BaseModel, Field
 from app.data import storage
+from app.services import messages, retention
+from app.api.v1.endpoints.websocket_chat import manager
 
 router = APIRouter()
 
@@ -18,24 +19,35 @@ class ChatMessage(BaseModel):
 class ChatMessageCreate(BaseModel):
     message: str
 
+class RetentionPolicy(BaseModel):
+    hot_days: float = Field(..., gt=0, description="Days messages stay in the main store")
+    archive: bool = Field(True, description="Archive older messages instead of deleting them")
+    retain_days: Optional[float] = Field(None, gt=0, description="Delete messages older than this; None keeps them")
+
 @router.get("/{group_id}/messages", response_model=List[ChatMessage])
-def get_group_messages(group_id: str):
+def get_group_messages(
+    group_id: str,
+    before: Optional[str] = Query(None, description="Only messages older than this message ID"),
+    after: Optional[str] = Query(None, description="Only messages newer than this message ID"),
+    limit: int = Query(50, ge=1, le=200),
+):
     """
-    Get all messages for a group.
+    Get a page of a group's messages, oldest first.
+
+    Without cursors this is the newest `limit` messages. Scroll back with
+    `before=<id of the oldest message shown>` (continuing into archived
+    history), catch up with `after=<id of the newest message shown>`.
     """
-    # Get messages for this group from storage
-    all_messages = storage.get_all("messages")
-    group_messages = [msg for msg in all_messages if msg.get("group_id") == group_id]
-    
-    # Sort by timestamp
-    group_messages.sort(key=lambda x: x.get("timestamp", ""))
-    
-    return group_messages
+    try:
+        return messages.history_page(group_id, after=after, before=before, limit=limit)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown message cursor {e.args[0]}")
 
 @router.post("/{group_id}/messages", response_model=ChatMessage)
 def post_group_message(
     group_id: str,
     message_in: ChatMessageCreate,
+    background_tasks: BackgroundTasks,
     x_user_id: str = Header(..., description="User ID of the sender")
 ):
     """
@@ -52,15 +64,39 @@ def post_group_message(
         raise HTTPException(status_code=404, detail="User not found")
     
     # Create message
-    message = {
-        "id": f"msg-{datetime.utcnow().timestamp()}",
-        "group_id": group_id,
-        "user_id": x_user_id,
-        "user_name": user["name"],
-        "message": message_in.message,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    message = messages.new_message(group_id, x_user_id, user["name"], message_in.message)
     
-    storage.add_item("messages", message)
+    # Written together with concurrent posts; returns once it is durable
+    messages.writer.submit(message).result()
+    messages.history.append(message)
+    # Live WebSocket clients get it without polling
+    background_tasks.add_task(manager.broadcast, message, group_id)
     
     return ChatMessage(**message)
+
+@router.get("/{group_id}/messages/retention", response_model=RetentionPolicy)
+def get_retention_policy(group_id: str):
+    """
+    Get the group's chat retention policy (defaults if none was set).
+    """
+    if not storage.get_item_by_id("groups", group_id):
+        raise HTTPException(status_code=404, detail="Group not found")
+    return retention.policy_for(group_id)
+
+@router.put("/{group_id}/messages/retention", response_model=RetentionPolicy)
+def set_retention_policy(
+    group_id: str,
+    policy: RetentionPolicy,
+    x_user_id: str = Header(..., description="User ID of the group admin")
+):
+    """
+    Set the group's chat retention policy (admin only).
+    """
+    group = storage.get_item_by_id("groups", group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if group.get("admin_id") != x_user_id:
+        raise HTTPException(status_code=403, detail="Only admin can change message retention")
+    if policy.retain_days is not None and policy.retain_days < policy.hot_days:
+        raise HTTPException(status_code=400, detail="retain_days must be at least hot_days")
+    return retention.set_policy(group_id, policy.dict())
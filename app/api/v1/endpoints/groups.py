@@ -1,14 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Header
-from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Header, Query
+from typing import List, Literal, Optional
 from app.models.group import Group, GroupCreate
 from app.data import storage
-from app.services import recommendation
+from app.services import batch_recommendations, geo, invalidation, recommendation, group_index, group_search
 
 router = APIRouter()
 
 @router.post("/", response_model=Group, status_code=status.HTTP_201_CREATED)
 def create_group(
     group_in: GroupCreate,
+    background_tasks: BackgroundTasks,
     x_user_id: str = Header(..., description="User ID of the admin creating the group")
 ):
     """
@@ -25,21 +26,76 @@ def create_group(
         members=[x_user_id] # Admin is automatically a member
     )
     storage.add_item("groups", group.dict())
+    group_index.index.add_group(group.dict())
+    group_search.index.add_group(group.dict())
+    geo.index.add_group(group.dict())
+    background_tasks.add_task(invalidation.on_group_created, group.dict())
     return group
 
 @router.get("/", response_model=List[Group])
-def read_groups(skip: int = 0, limit: int = 100):
+def read_groups(skip: int = 0, limit: int = 100, admin_id: Optional[str] = None):
     """
-    Retrieve groups.
+    Retrieve groups, optionally only those administered by `admin_id`.
     """
-    groups = storage.get_all("groups")
-    return groups[skip : skip + limit]
+    where = {"admin_id": admin_id} if admin_id else None
+    return storage.query("groups", where, skip=skip, limit=limit)
 
-from app.models.group import Group, GroupCreate, GroupRecommendation
+from app.models.group import Group, GroupCreate, GroupNearby, GroupRecommendation, GroupSearchPage
+
+@router.get("/search", response_model=GroupSearchPage)
+def search_groups(
+    activity: Optional[List[str]] = Query(None, description="Activity tags the group must all have (case-insensitive)"),
+    location: Optional[str] = Query(None, description="Location (case-insensitive)"),
+    age: Optional[int] = Query(None, ge=0, description="Only groups whose age group includes this age"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Search groups by activity, location and age, in creation order.
+    """
+    try:
+        ids, next_cursor = group_search.index.search(activity, location, age, cursor or None, limit)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    groups = [g for g in (storage.get_item_by_id("groups", gid) for gid in ids) if g]
+    return {"items": groups, "next_cursor": next_cursor}
+
+@router.get("/nearby", response_model=List[GroupNearby])
+def get_nearby_groups(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, description="Only groups within this distance"),
+    limit: int = Query(20, ge=1, le=100),
+    x_user_id: Optional[str] = Header(None, description="Use this user's coordinates if lat/lon are omitted")
+):
+    """
+    Groups nearest to a point (or to the user), nearest first.
+    """
+    if lat is None or lon is None:
+        user = storage.get_item_by_id("users", x_user_id) if x_user_id else None
+        point = geo.coordinates(user) if user else None
+        if point is None:
+            raise HTTPException(status_code=400, detail="Give lat and lon, or an X-User-ID of a user with coordinates")
+        lat, lon = point
+
+    if radius_km is None:
+        hits = geo.index.nearest(lat, lon, limit)
+    else:
+        hits = geo.index.within(lat, lon, radius_km)[:limit]
+
+    nearby = []
+    for group_id, km in hits:
+        group = storage.get_item_by_id("groups", group_id)
+        if group:
+            nearby.append({**group, "distance_km": round(km, 3)})
+    return nearby
 
 @router.get("/recommended", response_model=List[GroupRecommendation])
 def get_recommendations(
     limit: int = 10,
+    nprobe: Optional[int] = Query(
+        None, ge=1, description="Clusters probed by the approximate search; higher = better recall, slower"
+    ),
     x_user_id: str = Header(..., description="User to get recommendations for")
 ):
     """
@@ -50,75 +106,86 @@ def get_recommendations(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    # 2. Get All Groups
-    all_groups = storage.get_all("groups")
-    
-    # 3. Run Algorithm
-    recommended = recommendation.get_recommended_groups(user, all_groups, limit)
+    # 2. Serve the batch job's list if it is fresh, else retrieve and rank online
+    recommended = batch_recommendations.get_fresh(user, limit)
+    if recommended is None:
+        recommended = recommendation.recommend_groups(user, limit, nprobe)
     
     return recommended
 
 @router.post("/{group_id}/join", response_model=Group)
 def join_group(
     group_id: str,
+    background_tasks: BackgroundTasks,
     x_user_id: str = Header(..., description="User ID of the user joining")
 ):
     """
     Join a group.
     """
-    group_data = storage.get_item_by_id("groups", group_id)
-    if not group_data:
+    # Checks and the append run under the group's lock, so concurrent joins
+    # can neither lose each other's update nor overfill the group.
+    try:
+        with storage.transaction("groups", group_id) as group_data:
+            if not group_data:
+                raise HTTPException(status_code=404, detail="Group not found")
+        
+            user = storage.get_item_by_id("users", x_user_id)
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+        
+            # Check if already a member
+            if x_user_id in group_data["members"]:
+                raise HTTPException(status_code=400, detail="User already in group")
+        
+            # Check max members
+            if len(group_data["members"]) >= group_data["max_members"]:
+                raise HTTPException(status_code=400, detail="Group is full")
+        
+            group_data["members"].append(x_user_id)
+    except storage.ItemDeletedError:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    user = storage.get_item_by_id("users", x_user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check if already a member
-    if x_user_id in group_data["members"]:
-        raise HTTPException(status_code=400, detail="User already in group")
-    
-    # Check max members
-    if len(group_data["members"]) >= group_data["max_members"]:
-        raise HTTPException(status_code=400, detail="Group is full")
-    
-    group_data["members"].append(x_user_id)
-    storage.update_item("groups", group_id, {"members": group_data["members"]})
-    
+    background_tasks.add_task(invalidation.on_member_joined, group_id, x_user_id)
     return group_data
 
 @router.post("/{group_id}/leave", response_model=Group)
 def leave_group(
     group_id: str,
+    background_tasks: BackgroundTasks,
     x_user_id: str = Header(..., description="User ID of the user leaving")
 ):
     """
     Leave a group.
     """
-    group_data = storage.get_item_by_id("groups", group_id)
-    if not group_data:
+    try:
+        with storage.transaction("groups", group_id) as group_data:
+            if not group_data:
+                raise HTTPException(status_code=404, detail="Group not found")
+        
+            user = storage.get_item_by_id("users", x_user_id)
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+        
+            # Check if already a member
+            if x_user_id not in group_data["members"]:
+                raise HTTPException(status_code=400, detail="User not in group")
+        
+            # Check if admin
+            if group_data["admin_id"] == x_user_id:
+                raise HTTPException(status_code=400, detail="Admin cannot leave group")
+        
+            was_full = len(group_data["members"]) >= group_data["max_members"]
+            group_data["members"].remove(x_user_id)
+    except storage.ItemDeletedError:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    user = storage.get_item_by_id("users", x_user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check if already a member
-    if x_user_id not in group_data["members"]:
-        raise HTTPException(status_code=400, detail="User not in group")
-    
-    # Check if admin
-    if group_data["admin_id"] == x_user_id:
-        raise HTTPException(status_code=400, detail="Admin cannot leave group")
-    
-    group_data["members"].remove(x_user_id)
-    storage.update_item("groups", group_id, {"members": group_data["members"]})
-    
+    background_tasks.add_task(invalidation.on_member_left, group_data, x_user_id, reopened=was_full)
     return group_data
 
 @router.delete("/{group_id}")
 def delete_group(
     group_id: str,
+    background_tasks: BackgroundTasks,
     x_user_id: str = Header(..., description="User ID of the admin deleting the group")
 ):
     """
@@ -134,6 +201,10 @@ def delete_group(
     
     # Delete the group
     storage.delete_item("groups", group_id)
+    group_index.index.remove_group(group_id)
+    group_search.index.remove_group(group_id)
+    geo.index.remove_group(group_id)
+    background_tasks.add_task(invalidation.on_group_deleted, group_id)
     
     return {"message": "Group deleted successfully", "group_id": group_id}
 
@@ -141,15 +212,13 @@ def delete_group(
 def read_groups_not_full(
     skip: int = 0,
     limit: int = 100,
+    sort: Literal["created", "fewest_slots"] = Query(
+        "created", description="fewest_slots: groups closest to full first"
+    ),
+    max_slots: Optional[int] = Query(None, ge=1, description="Only groups with at most this many open slots"),
     x_user_id: str = Header(..., description="User ID of the user")
 ):
     """
     Get groups that are looking for members (not full).
     """
-    groups = storage.get_all("groups")[skip : skip + limit]
-    groups_lf = []
-    for group in groups:
-        if len(group["members"]) < group["max_members"]:
-            groups_lf.append(group)
-
-    return groups_lf
\ No newline at end of file
+    return storage.open_groups(skip, limit, fewest_first=sort == "fewest_slots", max_slots=max_slots)
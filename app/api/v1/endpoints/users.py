@@ -1,37 +1,49 @@
-from fastapi import APIRouter, HTTPException, status, Header
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, status, Header
 from typing import List, Optional
-from app.models.user import User, UserCreate
+from app.models.user import LikePage, User, UserCreate, UserRecommendation, UserUpdate
 from app.data import storage
+from app.services import embeddings, invalidation, likes, recommendation, user_index
 
 router = APIRouter()
 
+def _require_user(user_id: str) -> None:
+    if not storage.get_item_by_id("users", user_id):
+        raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
+
 @router.post("/", response_model=User, status_code=status.HTTP_201_CREATED)
 def create_user(user_in: UserCreate):
     """
     Create a new user.
     """
-    # Check if email already exists (simple linear search for now)
-    users = storage.get_all("users")
-    for user in users:
-        if user["email"] == user_in.email:
-            raise HTTPException(
-                status_code=400,
-                detail="The user with this email already exists in the system.",
-            )
+    # Check if email already exists (users.email is a unique index)
+    if storage.find_one("users", "email", user_in.email):
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system.",
+        )
     
     # Check if ID already exists (if provided)
     if user_in.id:
         existing_user = storage.get_item_by_id("users", user_in.id)
         if existing_user:
              # If user exists, return it (idempotency for demo)
-            return User(**existing_user)
+            return User(**likes.with_likes(existing_user))
 
     user_data = user_in.dict()
     if user_data.get("id") is None:
         del user_data["id"]
         
     user = User(**user_data)
-    storage.add_item("users", user.dict())
+    try:
+        # Likes live in the like graph (app.services.likes), not on the user
+        storage.add_item("users", user.dict(exclude={"likes", "liked_by"}))
+    except storage.DuplicateKeyError:
+        # Lost a race against a concurrent signup with the same email
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system.",
+        )
+    user_index.index.add_user(user.dict())
     return user
 
 @router.get("/", response_model=List[User])
@@ -39,8 +51,7 @@ def read_users(skip: int = 0, limit: int = 100):
     """
     Retrieve users.
     """
-    users = storage.get_all("users")
-    return users[skip : skip + limit]
+    return [likes.with_likes(user) for user in storage.query("users", skip=skip, limit=limit)]
 
 @router.get("/{user_id}", response_model=User)
 def read_user_by_id(user_id: str):
@@ -53,7 +64,60 @@ def read_user_by_id(user_id: str):
             status_code=404,
             detail=f"User '{user_id}' not found",
         )
-    return user
+    return likes.with_likes(user)
+
+@router.get("/{user_id}/similar", response_model=List[UserRecommendation])
+def get_similar_users(
+    user_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    nprobe: Optional[int] = Query(
+        None, ge=1, description="Clusters probed by the approximate search; higher = better recall, slower"
+    ),
+):
+    """
+    Users with similar interests in the same area.
+    """
+    user = storage.get_item_by_id("users", user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
+    if not embeddings.is_ready():
+        raise HTTPException(status_code=503, detail="The recommendation model is still loading")
+    similar = recommendation.recommend_users(user, limit, nprobe)
+    return [likes.with_likes(match) for match in similar]
+
+@router.patch("/{user_id}", response_model=User)
+def update_user(
+    user_id: str,
+    user_in: UserUpdate,
+    background_tasks: BackgroundTasks,
+    x_user_id: str = Header(..., description="User ID of the user making the change")
+):
+    """
+    Update a user's profile (own profile only).
+    """
+    if user_id != x_user_id:
+        raise HTTPException(status_code=403, detail="Cannot edit another user's profile")
+
+    updates = user_in.dict(exclude_unset=True)
+    try:
+        with storage.transaction("users", user_id) as user:
+            if not user:
+                raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
+            changed = [field for field, value in updates.items() if user.get(field) != value]
+            user.update(updates)
+    except storage.ItemDeletedError:
+        raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
+    except storage.DuplicateKeyError:
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system.",
+        )
+
+    # Precomputed recommendations depend on interests, location and age
+    background_tasks.add_task(invalidation.on_user_updated, user, changed)
+    if "interests" in changed:
+        user_index.index.add_user(user)
+    return likes.with_likes(user)
 
 @router.post("/{user_id}/like", response_model=User)
 def like_user(
@@ -63,41 +127,69 @@ def like_user(
     """
     Like a user.
     """
-    # Target user
     target_user = storage.get_item_by_id("users", user_id)
     if not target_user:
         raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
-        
+
     # Validation: Actor exists
-    actor_user = storage.get_item_by_id("users", x_user_id)
-    if not actor_user:
+    if not storage.get_item_by_id("users", x_user_id):
         raise HTTPException(status_code=404, detail="Actor user not found")
-        
+
     # Validation: Self-like
     if user_id == x_user_id:
         raise HTTPException(status_code=400, detail="Cannot like yourself")
-        
-    # Logic: Add specific unique like
-    if x_user_id not in target_user.get("liked_by", []):
-         # Ensure liked_by exists (migration-safe-ish for json)
-        if "liked_by" not in target_user:
-            target_user["liked_by"] = []
-            
-        target_user["liked_by"].append(x_user_id)
-        storage.update_item("users", user_id, {"liked_by": target_user["liked_by"]})
-        
-    return target_user
+
+    # Liking twice is a no-op
+    likes.like(x_user_id, user_id)
+    return likes.with_likes(target_user)
 
 @router.get("/{user_id}/likes", response_model=int)
 def get_user_likes(user_id: str):
     """
     Get the number of likes a user has.
     """
-    user = storage.get_item_by_id("users", user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
-    
-    return len(user.get("liked_by", []))
+    _require_user(user_id)
+    return likes.counts(user_id)["received"]
+
+@router.get("/{user_id}/liked_by", response_model=LikePage)
+def get_liked_by(user_id: str, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Users who liked this user, oldest like first.
+    """
+    _require_user(user_id)
+    return LikePage(
+        total=likes.counts(user_id)["received"],
+        user_ids=likes.liked_by(user_id, skip=skip, limit=limit),
+    )
+
+@router.get("/{user_id}/likes_given", response_model=LikePage)
+def get_likes_given(user_id: str, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Users this user liked, oldest like first.
+    """
+    _require_user(user_id)
+    return LikePage(
+        total=likes.counts(user_id)["given"],
+        user_ids=likes.likes_given(user_id, skip=skip, limit=limit),
+    )
+
+@router.get("/{user_id}/likes_given/{target_id}", response_model=bool)
+def has_liked(user_id: str, target_id: str):
+    """
+    Whether this user liked the target user.
+    """
+    _require_user(user_id)
+    _require_user(target_id)
+    return likes.has_liked(user_id, target_id)
+
+@router.get("/{user_id}/mutuals", response_model=LikePage)
+def get_mutuals(user_id: str, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Users who liked this user and were liked back.
+    """
+    _require_user(user_id)
+    ids = likes.mutuals(user_id)
+    return LikePage(total=len(ids), user_ids=ids[skip : skip + limit])
 
 @router.post("/{user_id}/unlike", response_model=User)
 def unlike_user(
@@ -107,19 +199,14 @@ def unlike_user(
     """
     Unlike a user.
     """
-    # Target user
     target_user = storage.get_item_by_id("users", user_id)
     if not target_user:
         raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
-        
+
     # Validation: Actor exists
-    actor_user = storage.get_item_by_id("users", x_user_id)
-    if not actor_user:
+    if not storage.get_item_by_id("users", x_user_id):
         raise HTTPException(status_code=404, detail="Actor user not found")
-        
+
     # Logic: Remove like if exists
-    if "liked_by" in target_user and x_user_id in target_user["liked_by"]:
-        target_user["liked_by"].remove(x_user_id)
-        storage.update_item("users", user_id, {"liked_by": target_user["liked_by"]})
-        
-    return target_user
+    likes.unlike(x_user_id, user_id)
+    return likes.with_likes(target_user)
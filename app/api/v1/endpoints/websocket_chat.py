@@ -1,86 +1,276 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
-from datetime import datetime
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from typing import Dict, Any, Optional, Tuple
+import asyncio
 import json
+import os
+import time
+from app.data import storage
+from app.services import messages, pubsub
 
 router = APIRouter()
 
+# Frames buffered per connection; a connection whose queue is full is slow
+OUTBOUND_QUEUE = int(os.environ.get("CHAT_OUTBOUND_QUEUE", 64))
+# A slow connection that has missed more messages than this is closed
+MAX_MISSED = int(os.environ.get("CHAT_MAX_MISSED", 256))
+
+
+class FanoutStats:
+    """Counters and latencies of WebSocket fan-out."""
+
+    def __init__(self):
+        self.broadcasts = 0
+        self.queued = 0
+        self.sent = 0
+        self.skipped = 0
+        self.resyncs = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+        self.fanout_seconds = 0.0
+        self.fanout_max_seconds = 0.0
+        self.delivery_seconds = 0.0
+        self.delivery_max_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "broadcasts": self.broadcasts,
+            "queued": self.queued,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "resyncs": self.resyncs,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+            # Time to hand one message to every queue
+            "fanout_avg_ms": 1000 * self.fanout_seconds / self.broadcasts if self.broadcasts else 0.0,
+            "fanout_max_ms": 1000 * self.fanout_max_seconds,
+            # Queue wait plus send, per frame
+            "delivery_avg_ms": 1000 * self.delivery_seconds / self.sent if self.sent else 0.0,
+            "delivery_max_ms": 1000 * self.delivery_max_seconds,
+        }
+
+
+class Connection:
+    """
+    One socket with a bounded outbound queue drained by its own task, so a
+    slow client only ever holds up itself.
+
+    When the queue is full the connection is downgraded: messages are
+    skipped (and counted) until the queue has drained, then it gets one
+    {"type": "resync"} frame naming the last message it received, from
+    which it can page the gap over REST. A connection that misses more than
+    MAX_MISSED messages is closed.
+    """
+
+    def __init__(self, websocket: WebSocket, group_id: str, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.group_id = group_id
+        self.manager = manager
+        self.queue: "asyncio.Queue[Tuple[str, float]]" = asyncio.Queue(OUTBOUND_QUEUE)
+        self.missed = 0
+        self.last_id: Optional[str] = None
+        self.task = asyncio.create_task(self._drain())
+
+    def offer(self, frame: str, message_id: Optional[str] = None) -> None:
+        """Queues a serialized frame without waiting."""
+        stats = self.manager.stats
+        if not self.missed:
+            try:
+                self.queue.put_nowait((frame, time.perf_counter()))
+                stats.queued += 1
+                if message_id is not None:
+                    self.last_id = message_id
+                return
+            except asyncio.QueueFull:
+                pass
+        self.missed += 1
+        stats.skipped += 1
+        if self.missed > MAX_MISSED:
+            stats.slow_disconnects += 1
+            self.manager.disconnect(self.websocket, self.group_id)
+            asyncio.create_task(self._close(status.WS_1013_TRY_AGAIN_LATER))
+
+    async def _drain(self) -> None:
+        stats = self.manager.stats
+        try:
+            while True:
+                frame, queued_at = await self.queue.get()
+                await self.websocket.send_text(frame)
+                elapsed = time.perf_counter() - queued_at
+                stats.sent += 1
+                stats.delivery_seconds += elapsed
+                stats.delivery_max_seconds = max(stats.delivery_max_seconds, elapsed)
+                if self.missed and self.queue.empty():
+                    await self.websocket.send_text(
+                        json.dumps({"type": "resync", "missed": self.missed, "after": self.last_id})
+                    )
+                    stats.resyncs += 1
+                    self.missed = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Closed or broken socket: stop sending to it
+            stats.send_errors += 1
+            print(f"WebSocket send failed in group {self.group_id}: {type(e).__name__}: {e}")
+            self.manager.disconnect(self.websocket, self.group_id)
+
+    async def _close(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # already gone
+
+    def stop(self) -> None:
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
 # Connection manager to handle multiple WebSocket connections per group
 class ConnectionManager:
-    def __init__(self):
-        # group_id -> list of WebSocket connections
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-        # group_id -> list of recent messages (last 50)
-        self.message_history: Dict[str, List[dict]] = {}
+    """
+    Local connections per group. Messages go through the pub/sub backend
+    (see app.services.pubsub), with one topic per group that this process
+    subscribes to while it has connections in the group, so with several
+    workers each one fans out to its own sockets.
+    """
+
+    def __init__(self, bus: Optional[pubsub.InProcessPubSub] = None):
+        # group_id -> {WebSocket: Connection}
+        self.active_connections: Dict[str, Dict[WebSocket, Connection]] = {}
+        self.stats = FanoutStats()
+        self._bus = bus
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def bus(self) -> pubsub.InProcessPubSub:
+        if self._bus is None:
+            self._bus = pubsub.get_pubsub()
+        return self._bus
 
     async def connect(self, websocket: WebSocket, group_id: str):
         await websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        connection = Connection(websocket, group_id, self)
+
+        # Recent message history (hot cache, backed by storage) goes out first
+        history = messages.history.recent(group_id)
+        if history:
+            connection.offer(json.dumps({"type": "history", "messages": history}), history[-1].get("id"))
         if group_id not in self.active_connections:
-            self.active_connections[group_id] = []
-            self.message_history[group_id] = []
-        self.active_connections[group_id].append(websocket)
-        
-        # Send recent message history to the new connection
-        if self.message_history[group_id]:
-            await websocket.send_json({
-                "type": "history",
-                "messages": self.message_history[group_id]
-            })
+            self.active_connections[group_id] = {}
+            self.bus.subscribe(group_id, self._on_published)
+        self.active_connections[group_id][websocket] = connection
 
     def disconnect(self, websocket: WebSocket, group_id: str):
-        if group_id in self.active_connections:
-            self.active_connections[group_id].remove(websocket)
-            # Clean up empty group lists
-            if not self.active_connections[group_id]:
-                del self.active_connections[group_id]
+        connections = self.active_connections.get(group_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if connection is not None:
+            connection.stop()
+        # Clean up empty groups
+        if not connections:
+            del self.active_connections[group_id]
+            self.bus.unsubscribe(group_id, self._on_published)
+
+    def send_to(self, websocket: WebSocket, group_id: str, payload: dict):
+        """Queues a frame for one connection (behind what is already queued for it)."""
+        connection = self.active_connections.get(group_id, {}).get(websocket)
+        if connection is not None:
+            connection.offer(json.dumps(payload))
 
     async def broadcast(self, message: dict, group_id: str):
-        # Store message in history (keep last 50)
-        if group_id not in self.message_history:
-            self.message_history[group_id] = []
-        self.message_history[group_id].append(message)
-        if len(self.message_history[group_id]) > 50:
-            self.message_history[group_id].pop(0)
-        
-        # Broadcast to all connected clients in the group
-        if group_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[group_id]:
-                try:
-                    await connection.send_json({
-                        "type": "message",
-                        "data": message
-                    })
-                except:
-                    # Mark for removal if send fails
-                    disconnected.append(connection)
-            
-            # Remove disconnected clients
-            for conn in disconnected:
-                if conn in self.active_connections[group_id]:
-                    self.active_connections[group_id].remove(conn)
+        """
+        Publishes an already stored (or queued) message to the group's
+        topic. Serialized once; never waits on a client.
+        """
+        frame = json.dumps({"type": "message", "data": message})
+        # "<message id>\t<frame>": the id is needed for resync, the frame is sent as-is
+        self.bus.publish(group_id, f"{message.get('id') or ''}\t{frame}".encode())
+
+    def _on_published(self, group_id: str, payload: bytes) -> None:
+        """Pub/sub callback; may run on the broker reader thread."""
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                self._deliver(group_id, payload)
+                return
+        except RuntimeError:
+            pass  # not on a loop thread
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, group_id, payload)
+            except RuntimeError:
+                pass  # loop shut down meanwhile
+
+    def _deliver(self, group_id: str, payload: bytes) -> None:
+        """Queues a published frame for every local connection of the group."""
+        started = time.perf_counter()
+        message_id, frame = payload.decode().split("\t", 1)
+        for connection in list(self.active_connections.get(group_id, {}).values()):
+            connection.offer(frame, message_id or None)
+        elapsed = time.perf_counter() - started
+        self.stats.broadcasts += 1
+        self.stats.fanout_seconds += elapsed
+        self.stats.fanout_max_seconds = max(self.stats.fanout_max_seconds, elapsed)
+
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
 
 manager = ConnectionManager()
 
+@router.get("/ws/stats")
+def websocket_stats():
+    """Fan-out counters and latencies, plus live connections and message writer metrics."""
+    return {
+        "connections": manager.connection_count(),
+        **manager.stats.as_dict(),
+        "writer": messages.writer.stats.as_dict(),
+    }
+
+def _check_message(group_id: str, data: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(sender, None) for a valid chat frame from a group member, else (None, error detail)."""
+    if not isinstance(data, dict):
+        return None, "Expected a JSON object"
+    user_id = data.get("user_id")
+    user = storage.get_item_by_id("users", user_id) if isinstance(user_id, str) else None
+    if user is None:
+        return None, "User not found"
+    group = storage.get_item_by_id("groups", group_id)
+    if group is None:
+        return None, "Group not found"
+    if user_id not in group.get("members", []):
+        return None, "User is not a member of this group"
+    text = data.get("message")
+    if not isinstance(text, str) or not text.strip():
+        return None, "Message must be a non-empty string"
+    return user, None
+
 @router.websocket("/ws/groups/{group_id}")
 async def websocket_endpoint(websocket: WebSocket, group_id: str):
+    if storage.get_item_by_id("groups", group_id) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     await manager.connect(websocket, group_id)
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_json()
-            
-            # Create message object with timestamp
-            message = {
-                "user_id": data.get("user_id"),
-                "user_name": data.get("user_name"),
-                "message": data.get("message"),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # Broadcast to all clients in this group
+            user, error = _check_message(group_id, data)
+            if error is not None:
+                manager.send_to(websocket, group_id, {"type": "error", "detail": error})
+                continue
+
+            # Create message object with id and timestamp; the name comes from the profile
+            message = messages.new_message(group_id, user["id"], user["name"], data["message"])
+
+            # Broadcast to all clients in this group once the message is stored
+            try:
+                await asyncio.wrap_future(messages.writer.submit(message))
+            except Exception as e:
+                manager.send_to(websocket, group_id, {"type": "error", "detail": f"Message not stored: {e}"})
+                continue
+            messages.history.append(message)
             await manager.broadcast(message, group_id)
-            
+
     except WebSocketDisconnect:
         manager.disconnect(websocket, group_id)
     except Exception as e:
@@ -0,0 +1,30 @@
+class StorageError(Exception):
+    """Base class for storage errors."""
+
+
+class ItemDeletedError(StorageError, KeyError):
+    """Raised when the item of a transaction was deleted before it could be written back."""
+
+    def __init__(self, collection: str, item_id: str):
+        self.collection = collection
+        self.item_id = item_id
+        super().__init__(f"{collection} '{item_id}' was deleted during the transaction")
+
+
+class DuplicateKeyError(StorageError):
+    """Raised when a write would break a unique index."""
+
+    def __init__(self, collection: str, field: str, value):
+        self.collection = collection
+        self.field = field
+        self.value = value
+        super().__init__(f"Duplicate value for {collection}.{field}: {value!r}")
+
+
+class MigrationError(StorageError):
+    """Raised when imported data breaks a unique index; lists every offending item."""
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        lines = "\n".join(f"  {collection} '{item_id}': {error}" for collection, item_id, error in duplicates)
+        super().__init__(f"{len(duplicates)} item(s) could not be imported:\n{lines}")
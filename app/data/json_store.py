@@ -0,0 +1,698 @@
+import copy
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from app.data.errors import DuplicateKeyError, ItemDeletedError
+from app.data.locks import FileLock, StripedLock
+
+EMPTY_DB = {"users": [], "groups": []}
+
+# collection -> {field: unique}
+IndexSpec = Dict[str, Dict[str, bool]]
+# collection -> (partition field, sort field), e.g. messages by group_id then timestamp
+OrderedSpec = Dict[str, Tuple[str, str]]
+# Position of an item in an ordered index: (sort value, id)
+OrderKey = Tuple[str, str]
+
+
+class Collection:
+    """
+    Items of one collection keyed by id, plus secondary hash indexes.
+
+    Unique indexes map value -> id, the others map value -> ordered set of
+    ids (a dict with None values, so iteration follows insertion order).
+    An optional ordered index maps a partition value -> sorted list of
+    (sort value, id) keys, for range pages within the partition.
+    """
+
+    def __init__(
+        self, name: str, indexes: Dict[str, bool] | None = None, ordered: Tuple[str, str] | None = None
+    ):
+        self.name = name
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.unique: Dict[str, Dict[Any, str]] = {}
+        self.multi: Dict[str, Dict[Any, Dict[str, None]]] = {}
+        for field, is_unique in (indexes or {}).items():
+            if is_unique:
+                self.unique[field] = {}
+            else:
+                self.multi[field] = {}
+        self.ordered = ordered
+        self.sorted: Dict[Any, List[OrderKey]] = {}
+
+    def check(self, item_id: str, item: Dict[str, Any]) -> None:
+        """Raises DuplicateKeyError if `item` would clash with another item."""
+        for field, index in self.unique.items():
+            owner = index.get(_key(item.get(field)))
+            if owner is not None and owner != item_id:
+                raise DuplicateKeyError(self.name, field, item.get(field))
+
+    def insert(self, item: Dict[str, Any], enforce: bool = True) -> None:
+        item_id = item.get("id")
+        if enforce:
+            if item_id in self.items:
+                raise DuplicateKeyError(self.name, "id", item_id)
+            self.check(item_id, item)
+        self.items[item_id] = item
+        self._index(item_id, item)
+
+    def replace(self, item_id: str, new_item: Dict[str, Any], enforce: bool = True) -> None:
+        if enforce:
+            self.check(item_id, new_item)
+        self._unindex(item_id, self.items[item_id])
+        self.items[item_id] = new_item
+        self._index(item_id, new_item)
+
+    def remove(self, item_id: str) -> Dict[str, Any] | None:
+        item = self.items.pop(item_id, None)
+        if item is not None:
+            self._unindex(item_id, item)
+        return item
+
+    def is_indexed(self, field: str) -> bool:
+        return field == "id" or field in self.unique or field in self.multi
+
+    def find(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        if field == "id":
+            item = self.items.get(value)
+            return [item] if item is not None else []
+        if field in self.unique:
+            item_id = self.unique[field].get(_key(value))
+            return [self.items[item_id]] if item_id is not None else []
+        # Readers don't take the lock: copy the views first (a single C call,
+        # atomic under the GIL) so concurrent writers can't break iteration.
+        if field in self.multi:
+            ids = list(self.multi[field].get(_key(value), ()))
+            items = [self.items.get(item_id) for item_id in ids]
+            return [item for item in items if item is not None]
+        # Not indexed: fall back to a scan
+        return [item for item in list(self.items.values()) if item.get(field) == value]
+
+    def order_key(self, item: Dict[str, Any]) -> OrderKey:
+        return (sort_value(item.get(self.ordered[1])), item.get("id"))
+
+    def page(
+        self, value: Any, after: OrderKey | None = None, before: OrderKey | None = None, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Items of one partition between the `after` and `before` keys
+        (exclusive), in sort order: the first `limit` after `after` if it is
+        given, else the last `limit` before `before` (or the end).
+        """
+        keys = self.sorted.get(_key(value), [])
+        low = 0 if after is None else bisect_right(keys, after)
+        high = len(keys) if before is None else bisect_left(keys, before)
+        if after is not None:
+            window = keys[low : min(high, low + limit)]
+        else:
+            window = keys[max(low, high - limit) : high]
+        items = [self.items.get(item_id) for _, item_id in window]
+        return [item for item in items if item is not None]
+
+    def _index(self, item_id: str, item: Dict[str, Any]) -> None:
+        for field, index in self.unique.items():
+            value = _key(item.get(field))
+            if value is not None:
+                index[value] = item_id
+        for field, index in self.multi.items():
+            value = _key(item.get(field))
+            if value is not None:
+                index.setdefault(value, {})[item_id] = None
+        if self.ordered is not None:
+            value = _key(item.get(self.ordered[0]))
+            if value is not None:
+                insort(self.sorted.setdefault(value, []), self.order_key(item))
+
+    def _unindex(self, item_id: str, item: Dict[str, Any]) -> None:
+        for field, index in self.unique.items():
+            value = _key(item.get(field))
+            if value is not None and index.get(value) == item_id:
+                del index[value]
+        for field, index in self.multi.items():
+            value = _key(item.get(field))
+            ids = index.get(value)
+            if ids is not None:
+                ids.pop(item_id, None)
+                if not ids:
+                    del index[value]
+        if self.ordered is not None:
+            value = _key(item.get(self.ordered[0]))
+            keys = self.sorted.get(value)
+            if keys is not None:
+                key = self.order_key(item)
+                position = bisect_left(keys, key)
+                if position < len(keys) and keys[position] == key:
+                    del keys[position]
+                if not keys:
+                    del self.sorted[value]
+
+
+def _key(value: Any) -> Any:
+    """Index key for a field value; unhashable values are not indexed."""
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return value
+
+
+def _temp_file(path: str) -> Tuple[int, str]:
+    """(fd, path) of a new, uniquely named file next to `path`, to be renamed over it."""
+    directory, name = os.path.split(path)
+    return tempfile.mkstemp(dir=directory or ".", prefix=name + ".", suffix=".tmp")
+
+
+def sort_value(value: Any) -> str:
+    """Sort value in an ordered index; missing values sort first."""
+    return "" if value is None else str(value)
+
+
+class JsonStore:
+    """
+    In-memory view of a JSON database file.
+
+    Collections are parsed once and served from memory. Before serving a read
+    the files are stat'ed, and if they were changed by someone else (e.g. a
+    seeding script like generate_mock_chats.py) the cache is dropped and the
+    database re-read.
+
+    Writes are persisted straight away. In journal mode a mutation appends
+    one small record to `<path>.journal` instead of rewriting the whole file;
+    the journal is replayed on load and folded into the snapshot by a
+    background compaction once it grows past `compact_bytes` or gets older
+    than `compact_seconds`. Snapshots are written to a temp file and renamed
+    into place, so a crash never leaves a truncated db.json behind.
+
+    Several processes may share the files (uvicorn workers, the batch job,
+    the retention command). Appends, compaction and reloads hold an flock
+    on `<path>.lock`, and the journal is reopened when another process
+    replaced it. Each process only knows its own writes, though: a write by
+    any other process makes the next read reparse db.json, replay the
+    journal and bump `epoch`, so every derived index rebuilds too. That is
+    fine for a few workers with light write traffic; for anything busier
+    use the SQLite backend, whose change log (SqliteStore.changes) avoids
+    the rebuilds. Read-modify-write transactions are only atomic within
+    one process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        indexes: IndexSpec | None = None,
+        journal: bool = True,
+        compact_bytes: int = 1 << 20,
+        compact_seconds: float = 300.0,
+        fsync: bool = True,
+        ordered: OrderedSpec | None = None,
+    ):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.indexes = indexes or {}
+        self.ordered = ordered or {}
+        self.journal = journal
+        self.compact_bytes = compact_bytes
+        self.compact_seconds = compact_seconds
+        self.fsync = fsync
+        self._collections: Optional[Dict[str, Collection]] = None
+        # Bumped whenever the data is (re)loaded wholesale, so derived
+        # structures kept outside the store know to rebuild themselves.
+        self.epoch = 0
+        self._stamp: Optional[Tuple[Any, int]] = None
+        self._journal_file = None
+        self._journal_size = 0
+        self._last_compaction = time.monotonic()
+        self._compacting = False
+        # Short structural lock for the in-memory collections and the files,
+        # plus per-item locks held for a whole read-modify-write.
+        self._lock = threading.RLock()
+        self._item_locks = StripedLock()
+        self._compact_lock = threading.Lock()
+        # Taken after self._lock, never before it
+        self._file_lock = FileLock(path + ".lock")
+
+    # --- File handling ---
+
+    def _file_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _journal_file_size(self) -> int:
+        try:
+            return os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _current_stamp(self) -> Tuple[Any, int]:
+        return (self._file_stamp(), self._journal_file_size() if self.journal else 0)
+
+    def _read_file(self) -> Dict[str, List[Any]]:
+        if not os.path.exists(self.path):
+            # Initialize if not exists
+            data = copy.deepcopy(EMPTY_DB)
+            self._write_file(data)
+            return data
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return copy.deepcopy(EMPTY_DB)
+
+    def _write_file(self, data: Dict[str, List[Any]]) -> None:
+        """Atomically replaces the snapshot file with `data`."""
+        os.replace(self._write_temp(data), self.path)
+
+    def _write_temp(self, data: Dict[str, List[Any]]) -> str:
+        """Writes `data` to a fresh temp file next to the snapshot and returns its path."""
+        fd, tmp_path = _temp_file(self.path)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path
+
+    def _flush(self) -> None:
+        self._write_file(self._snapshot())
+        self._stamp = self._current_stamp()
+
+    def _snapshot(self) -> Dict[str, List[Any]]:
+        return {name: list(coll.items.values()) for name, coll in list(self._db().items())}
+
+    def _build(self, data: Dict[str, List[Any]]) -> Dict[str, Collection]:
+        collections = {}
+        for name, items in data.items():
+            coll = self._new_collection(name)
+            for item in items:
+                # Existing data is indexed as-is, uniqueness applies to new writes
+                coll.insert(item, enforce=False)
+            collections[name] = coll
+        return collections
+
+    def _new_collection(self, name: str) -> Collection:
+        return Collection(name, self.indexes.get(name), self.ordered.get(name))
+
+    def _collection(self, name: str) -> Collection:
+        db = self._db()
+        if name not in db:
+            db[name] = self._new_collection(name)
+        return db[name]
+
+    def _db(self) -> Dict[str, Collection]:
+        """Returns the cached collections, reloading them if the files changed."""
+        collections = self._collections
+        if collections is not None and self._current_stamp() == self._stamp:
+            return collections
+
+        with self._lock, self._file_lock:
+            if self._collections is None or self._current_stamp() != self._stamp:
+                collections = self._build(self._read_file())
+                if self.journal:
+                    self._replay(collections)
+                    self._journal_size = self._journal_file_size()
+                self._collections = collections
+                self._stamp = self._current_stamp()
+                self.epoch += 1
+            return self._collections
+
+    def refresh(self) -> None:
+        """Reloads now if the files were changed from outside."""
+        self._db()
+
+    def changes(self, collection: str, after: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        """
+        Change log contract of SqliteStore.changes(). Every item write goes
+        through this process (outside edits show up as an epoch change), so
+        there is never anything to catch up on.
+        """
+        return 0, None if after is None else []
+
+    def invalidate(self) -> None:
+        """Drops the cache so the next read goes back to disk."""
+        with self._lock:
+            self._collections = None
+            self._stamp = None
+
+    # --- Journal ---
+
+    def _replay(self, collections: Dict[str, Collection]) -> None:
+        """Applies journal records on top of the snapshot.
+
+        Records carry whole items, so replaying ones that are already part of
+        the snapshot (a crash between compaction steps) is harmless. A torn
+        last line from a crash mid-append was never acknowledged: it is cut
+        off the file, so records appended from now on aren't stuck behind it.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        end = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn record")
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                end += len(line)
+                self._apply_record(collections, record)
+        if end < self._journal_file_size():
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(end)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    def _apply_record(self, collections: Dict[str, Collection], record: Dict[str, Any]) -> None:
+        if record["op"] == "batch":
+            # Several writes in one line: replayed all together or not at all
+            for sub in record["records"]:
+                self._apply_record(collections, sub)
+            return
+        name = record["c"]
+        if name not in collections:
+            collections[name] = self._new_collection(name)
+        coll = collections[name]
+        if record["op"] == "put":
+            item = record["item"]
+            if item.get("id") in coll.items:
+                coll.replace(item["id"], item, enforce=False)
+            else:
+                coll.insert(item, enforce=False)
+        elif record["op"] == "del":
+            coll.remove(record["id"])
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        """Appends records to the journal and makes them durable with one write and fsync."""
+        lines = b"".join(json.dumps(r, separators=(",", ":")).encode("utf-8") + b"\n" for r in records)
+        with self._file_lock:
+            up_to_date = self._current_stamp() == self._stamp
+            if self._journal_file is not None and not self._journal_is_current():
+                # Another process compacted: don't append to the replaced file
+                self._journal_file.close()
+                self._journal_file = None
+            if self._journal_file is None:
+                self._journal_file = open(self.journal_path, "ab")
+            self._journal_file.write(lines)
+            self._journal_file.flush()
+            if self.fsync:
+                os.fsync(self._journal_file.fileno())
+            self._journal_size = self._journal_file.tell()
+            # If another process wrote since our last look, the stamp stays
+            # stale and the next read reloads (our records included).
+            if up_to_date:
+                self._stamp = self._current_stamp()
+
+        if self._should_compact():
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _journal_is_current(self) -> bool:
+        """Whether the open journal file is still the one at journal_path."""
+        try:
+            return os.stat(self.journal_path).st_ino == os.fstat(self._journal_file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _should_compact(self) -> bool:
+        if self._compacting or not self._journal_size:
+            return False
+        if self._journal_size >= self.compact_bytes:
+            return True
+        return time.monotonic() - self._last_compaction >= self.compact_seconds
+
+    def _persist(self, *records: Dict[str, Any]) -> None:
+        if self.journal:
+            self._append(list(records))
+        else:
+            self._flush()
+
+    def compact(self) -> None:
+        """Folds the journal into a fresh snapshot."""
+        with self._compact_lock:
+            try:
+                with self._lock, self._file_lock:
+                    # Items are never mutated in place, so the snapshot only
+                    # needs the lists; serialisation can happen outside the
+                    # locks. Records appended meanwhile (by any process) stay
+                    # in the journal past `offset`.
+                    data = self._snapshot()
+                    offset = self._journal_size
+                    snapshot_stamp = self._file_stamp()
+                tmp_path = self._write_temp(data)
+
+                with self._lock, self._file_lock:
+                    if self._file_stamp() != snapshot_stamp or self._journal_file_size() < offset:
+                        # save() or another process's compaction got there first
+                        os.unlink(tmp_path)
+                        return
+                    up_to_date = self._current_stamp() == self._stamp
+                    os.replace(tmp_path, self.path)
+                    self._truncate_journal(offset)
+                    self._stamp = self._current_stamp() if up_to_date else None
+                    self._last_compaction = time.monotonic()
+            finally:
+                self._compacting = False
+
+    def _truncate_journal(self, offset: int) -> None:
+        """Drops the first `offset` bytes of the journal (already in the snapshot)."""
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        tail = b""
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+        if not tail:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_size = 0
+            return
+        fd, tmp_path = _temp_file(self.journal_path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(tail)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._journal_size = len(tail)
+
+    def close(self) -> None:
+        """Compacts any pending journal records and releases the journal file."""
+        if self.journal and self._collections is not None and self._journal_file_size():
+            self.compact()
+        with self._lock:
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+
+    # --- Whole database ---
+
+    def load(self) -> Dict[str, List[Any]]:
+        return self._snapshot()
+
+    def save(self, data: Dict[str, List[Any]]) -> None:
+        with self._lock, self._file_lock:
+            self._collections = self._build(data)
+            self.epoch += 1
+            self._write_file(data)
+            if self.journal:
+                self._truncate_journal(self._journal_file_size())
+            self._stamp = self._current_stamp()
+
+    # --- Collections ---
+
+    def get_all(self, collection: str) -> List[Any]:
+        # The items are shared with the cache and must not be mutated
+        coll = self._db().get(collection)
+        return list(coll.items.values()) if coll else []
+
+    def get_item_by_id(self, collection: str, item_id: str) -> Dict[str, Any] | None:
+        coll = self._db().get(collection)
+        item = coll.items.get(item_id) if coll else None
+        # Callers mutate what they get back before calling update_item
+        return copy.deepcopy(item) if item is not None else None
+
+    def find_by(self, collection: str, field: str, value: Any) -> List[Dict[str, Any]]:
+        coll = self._db().get(collection)
+        return [copy.deepcopy(item) for item in coll.find(field, value)] if coll else []
+
+    def query(
+        self,
+        collection: str,
+        where: Dict[str, Any] | None = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Equality filter plus pagination, without materialising the whole collection."""
+        coll = self._db().get(collection)
+        if coll is None:
+            return []
+        where = dict(where or {})
+        # Narrow down through an index when one of the fields has one
+        indexed = next((field for field in where if coll.is_indexed(field)), None)
+        stop = None if limit is None else skip + limit
+        if indexed is not None and len(where) == 1 and indexed in coll.multi:
+            # Page the index itself: only skip + limit ids are walked and only
+            # the returned items are looked up
+            posting = coll.multi[indexed].get(_key(where[indexed]), {})
+            try:
+                ids = list(itertools.islice(posting, skip, stop))
+            except RuntimeError:
+                # A writer changed the posting list mid-walk: copy it (atomic) instead
+                ids = list(posting)[skip:stop]
+            items = [coll.items.get(item_id) for item_id in ids]
+            return [item for item in items if item is not None]
+        if indexed is not None:
+            items = coll.find(indexed, where.pop(indexed))
+        else:
+            items = coll.items.values()
+        if where:
+            items = [i for i in list(items) if all(i.get(f) == v for f, v in where.items())]
+        return list(itertools.islice(items, skip, stop))
+
+    def ordered_page(
+        self,
+        collection: str,
+        value: Any,
+        after: OrderKey | None = None,
+        before: OrderKey | None = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """A page of one partition of an ordered collection (see Collection.page)."""
+        coll = self._db().get(collection)
+        if coll is None:
+            return []
+        return [copy.deepcopy(item) for item in coll.page(value, after, before, limit)]
+
+    def add_item(self, collection: str, item: Dict[str, Any]) -> None:
+        with self._lock:
+            item = copy.deepcopy(item)
+            self._collection(collection).insert(item)
+            self._persist({"op": "put", "c": collection, "item": item})
+
+    def add_items(self, collection: str, items: List[Dict[str, Any]]) -> None:
+        """
+        Adds several items with a single journal write (or snapshot flush).
+        All or nothing: raises DuplicateKeyError before anything is written
+        if one of them clashes with stored items or another one of them.
+        """
+        with self._lock:
+            items = copy.deepcopy(items)
+            coll = self._collection(collection)
+            batch = Collection(collection, self.indexes.get(collection))
+            for item in items:
+                if item.get("id") in coll.items:
+                    raise DuplicateKeyError(collection, "id", item.get("id"))
+                coll.check(item.get("id"), item)
+                batch.insert(item)
+            for item in items:
+                coll.insert(item, enforce=False)
+            self._persist(*({"op": "put", "c": collection, "item": item} for item in items))
+
+    def update_item(self, collection: str, item_id: str, updates: Dict[str, Any]) -> bool:
+        with self._item_locks.lock_for((collection, item_id)), self._lock:
+            coll = self._collection(collection)
+            item = coll.items.get(item_id)
+            if item is None:
+                return False
+            new_item = {**item, **copy.deepcopy(updates)}
+            coll.replace(item_id, new_item)
+            self._persist({"op": "put", "c": collection, "item": new_item})
+            return True
+
+    def delete_item(self, collection: str, item_id: str) -> bool:
+        with self._item_locks.lock_for((collection, item_id)), self._lock:
+            if self._collection(collection).remove(item_id) is None:
+                return False
+            self._persist({"op": "del", "c": collection, "id": item_id})
+            return True
+
+    def delete_items(self, collection: str, item_ids: List[str]) -> int:
+        """Deletes several items with a single journal write. Returns how many existed."""
+        with self._lock:
+            coll = self._collection(collection)
+            removed = [item_id for item_id in item_ids if coll.remove(item_id) is not None]
+            if removed:
+                self._persist(*({"op": "del", "c": collection, "id": item_id} for item_id in removed))
+            return len(removed)
+
+    @contextmanager
+    def transaction(self, collection: str, item_id: str) -> Iterator[Dict[str, Any] | None]:
+        """
+        Atomic read-modify-write of one item.
+
+        Yields a private copy of the item (None if missing) while holding the
+        item's lock; changes made to it are written back when the block exits
+        without an exception. Readers are never blocked. Raises
+        ItemDeletedError if the item was removed in the meantime by a write
+        that doesn't take item locks (delete_items, save, a reload).
+        """
+        with self._item_locks.lock_for((collection, item_id)):
+            item = self.get_item_by_id(collection, item_id)
+            original = copy.deepcopy(item)
+            yield item
+            if item is None or item == original:
+                return
+            with self._lock:
+                coll = self._collection(collection)
+                if item_id not in coll.items:
+                    raise ItemDeletedError(collection, item_id)
+                coll.replace(item_id, item)
+                self._persist({"op": "put", "c": collection, "item": item})
+
+    @contextmanager
+    def transaction_many(self, keys: List[Tuple[str, str]]) -> Iterator[Dict[Tuple[str, str], Dict[str, Any] | None]]:
+        """
+        Atomic read-modify-write of several items, possibly in different
+        collections.
+
+        Yields {(collection, id): private copy or None} while holding all
+        their locks. Set an entry to a new item to create it, or to None to
+        delete it. Changed entries are checked against the unique indexes
+        and then written as one journal record, so a crash keeps all of
+        them or none.
+        """
+        with ExitStack() as stack:
+            for lock in self._item_locks.locks_for(keys):
+                stack.enter_context(lock)
+            items = {key: self.get_item_by_id(*key) for key in keys}
+            original = copy.deepcopy(items)
+            yield items
+            changed = [(key, item) for key, item in items.items() if item != original[key]]
+            if not changed:
+                return
+            with self._lock:
+                for (collection, item_id), item in changed:
+                    if item is not None:
+                        self._collection(collection).check(item_id, item)
+                records = []
+                for (collection, item_id), item in changed:
+                    coll = self._collection(collection)
+                    if item is None:
+                        if coll.remove(item_id) is not None:
+                            records.append({"op": "del", "c": collection, "id": item_id})
+                        continue
+                    item = {**item, "id": item_id}
+                    if item_id in coll.items:
+                        coll.replace(item_id, item, enforce=False)
+                    else:
+                        coll.insert(item, enforce=False)
+                    records.append({"op": "put", "c": collection, "item": item})
+                if records:
+                    self._persist({"op": "batch", "records": records})
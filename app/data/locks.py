@@ -0,0 +1,71 @@
+import os
+import threading
+import zlib
+from typing import Any, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the thread lock alone (one process per file)
+    fcntl = None
+
+
+class StripedLock:
+    """
+    A fixed pool of re-entrant locks, picked by hashing a key.
+
+    Gives per-item locking without keeping a lock object for every item:
+    two items only contend if they happen to share a stripe.
+    """
+
+    def __init__(self, stripes: int = 256):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def _stripe(self, key: Tuple[Any, ...]) -> int:
+        # crc32 instead of hash() so the stripe is stable across runs
+        return zlib.crc32(repr(key).encode("utf-8")) % len(self._locks)
+
+    def lock_for(self, key: Tuple[Any, ...]) -> threading.RLock:
+        return self._locks[self._stripe(key)]
+
+    def locks_for(self, keys: Iterable[Tuple[Any, ...]]) -> List[threading.RLock]:
+        """The locks of several keys, each once and in stripe order, so
+        threads taking them in this order can't deadlock."""
+        return [self._locks[stripe] for stripe in sorted({self._stripe(key) for key in keys})]
+
+
+class FileLock:
+    """
+    Exclusive lock shared by every process using the same lock file (flock),
+    and by the threads of this process. Reentrant.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._fd: Optional[int] = None
+        self._depth = 0
+
+    def __enter__(self) -> "FileLock":
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
@@ -0,0 +1,401 @@
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+from app.data.json_store import OrderKey, sort_value
+
+try:
+    import fcntl
+except ImportError:  # Windows: the thread lock alone (one process per archive)
+    fcntl = None
+
+# Segments hold one time bucket of one group
+BUCKET_SECONDS = 24 * 3600
+# Messages per compressed block; a read decompresses one block at a time
+BLOCK_MESSAGES = 256
+# Open segment maps and decoded blocks kept around for scrolling back
+OPEN_SEGMENTS = 64
+CACHED_BLOCKS = 128
+# Parsed block and id indexes of segments
+CACHED_INDEXES = 64
+# Message id -> key of messages served from the archive, to resolve cursors
+CACHED_KEYS = 10_000
+
+
+def message_key(message: Dict[str, Any]) -> OrderKey:
+    """(timestamp, id): the order of messages within a group, as in the storage index."""
+    return (sort_value(message.get("timestamp")), message.get("id"))
+
+
+def _id_hashes(ids: List[str]) -> np.ndarray:
+    """64-bit hashes of message ids, for the per-segment id lookup files."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(i.encode("utf-8"), digest_size=8).digest(), "little") for i in ids),
+        dtype=np.uint64,
+        count=len(ids),
+    )
+
+
+def _bucket(timestamp: str, bucket_seconds: int) -> int:
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return 0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp()) // bucket_seconds * bucket_seconds
+
+
+def _write_atomically(path: str, data: bytes) -> None:
+    # A temp name of its own, so concurrent writers never share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _LRU(OrderedDict):
+    def __init__(self, size: int):
+        super().__init__()
+        self.size = size
+
+    def put(self, key, value, on_evict=None) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.size:
+            _, evicted = self.popitem(last=False)
+            if on_evict is not None:
+                on_evict(evicted)
+
+
+class MessageArchive:
+    """
+    Old chat messages in immutable, compressed, time-bucketed segment files.
+
+    Layout per group (directory named after the quoted group id):
+
+    - `<bucket>-<n>.seg`: zlib-compressed JSON blocks of up to BLOCK_MESSAGES
+      messages each, in (timestamp, id) order.
+    - `<bucket>-<n>.idx`: JSON list of the blocks' [first key, last key,
+      offset, length], for seeking to a timestamp without decompressing.
+    - `<bucket>-<n>.ids`: sorted 64-bit hashes of the message ids followed
+      by the block number of each, so resolving a message id as a cursor
+      decompresses at most the block it is in (none for unknown ids).
+    - `manifest.json`: the group's segments in key order with their first
+      and last keys and message counts.
+
+    Segments are written to a temp file, fsynced and renamed, and only then
+    listed in the manifest, so a crash leaves at most an unlisted file.
+    Reads map the segment with mmap and decompress just the blocks a page
+    needs. Nothing is loaded until someone reads the group.
+
+    Several processes (uvicorn workers) can share an archive: writes hold
+    locked(), an flock on `<root>/.lock`, and a manifest is re-read
+    whenever its file changed.
+    """
+
+    def __init__(self, root: str, bucket_seconds: int = BUCKET_SECONDS, block_messages: int = BLOCK_MESSAGES):
+        self.root = root
+        self.bucket_seconds = bucket_seconds
+        self.block_messages = block_messages
+        self._lock = threading.RLock()
+        self._write_lock = threading.RLock()
+        self._lock_fd: Optional[int] = None
+        self._lock_depth = 0
+        self._manifests: Dict[str, Tuple[Any, List[Dict[str, Any]]]] = {}
+        self._indexes = _LRU(CACHED_INDEXES)
+        self._id_indexes = _LRU(CACHED_INDEXES)
+        self._maps = _LRU(OPEN_SEGMENTS)
+        self._blocks = _LRU(CACHED_BLOCKS)
+        self._keys = _LRU(CACHED_KEYS)
+
+    # --- Files ---
+
+    def _dir(self, group_id: str) -> str:
+        return os.path.join(self.root, quote(group_id, safe=""))
+
+    def _manifest_stamp(self, group_id: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(os.path.join(self._dir(group_id), "manifest.json"))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _manifest(self, group_id: str) -> List[Dict[str, Any]]:
+        """The group's segments; re-read when another process replaced the file."""
+        stamp = self._manifest_stamp(group_id)
+        cached = self._manifests.get(group_id)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        manifest = []
+        if stamp is not None:
+            with open(os.path.join(self._dir(group_id), "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)["segments"]
+            for segment in manifest:
+                segment["first"], segment["last"] = tuple(segment["first"]), tuple(segment["last"])
+        self._manifests[group_id] = (stamp, manifest)
+        return manifest
+
+    def _save_manifest(self, group_id: str, manifest: List[Dict[str, Any]]) -> None:
+        data = json.dumps({"segments": manifest}).encode("utf-8")
+        _write_atomically(os.path.join(self._dir(group_id), "manifest.json"), data)
+        self._manifests[group_id] = (self._manifest_stamp(group_id), manifest)
+
+    @contextmanager
+    def locked(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        Holds the archive's write lock, shared by every process using the
+        same root. Reentrant. With blocking=False yields False right away
+        if someone else holds it.
+        """
+        if not self._write_lock.acquire(blocking=blocking):
+            yield False
+            return
+        try:
+            if self._lock_depth == 0 and fcntl is not None:
+                os.makedirs(self.root, exist_ok=True)
+                fd = os.open(os.path.join(self.root, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    os.close(fd)
+                    yield False
+                    return
+                self._lock_fd = fd
+            self._lock_depth += 1
+            try:
+                yield True
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_fd is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+        finally:
+            self._write_lock.release()
+
+    def _index(self, group_id: str, name: str) -> List[list]:
+        path = os.path.join(self._dir(group_id), name + ".idx")
+        index = self._indexes.get(path)
+        if index is None:
+            with open(path, "r", encoding="utf-8") as f:
+                index = [[tuple(first), tuple(last), offset, length] for first, last, offset, length in json.load(f)]
+            self._indexes.put(path, index)
+        return index
+
+    def _ids(self, group_id: str, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(sorted id hashes, block numbers) of a segment."""
+        path = os.path.join(self._dir(group_id), name + ".ids")
+        ids = self._id_indexes.get(path)
+        if ids is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            n = len(data) // 12
+            ids = (np.frombuffer(data, dtype=np.uint64, count=n), np.frombuffer(data, dtype=np.uint32, offset=8 * n))
+            self._id_indexes.put(path, ids)
+        return ids
+
+    @staticmethod
+    def _ids_file(blocks: List[List[str]]) -> bytes:
+        hashes = _id_hashes([i for ids in blocks for i in ids])
+        numbers = np.repeat(np.arange(len(blocks), dtype=np.uint32), [len(ids) for ids in blocks])
+        order = np.argsort(hashes, kind="stable")
+        return hashes[order].tobytes() + numbers[order].tobytes()
+
+    def _block(self, group_id: str, name: str, block: list) -> List[Dict[str, Any]]:
+        path = os.path.join(self._dir(group_id), name + ".seg")
+        cache_key = (path, block[2])
+        messages = self._blocks.get(cache_key)
+        if messages is None:
+            mapped = self._maps.get(path)
+            if mapped is None:
+                with open(path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.put(path, mapped, on_evict=lambda m: m.close())
+            offset, length = block[2], block[3]
+            messages = json.loads(zlib.decompress(mapped[offset : offset + length]))
+            self._blocks.put(cache_key, messages)
+            for message in messages:
+                self._keys.put((group_id, message["id"]), message_key(message))
+        return messages
+
+    # --- Writes ---
+
+    def add(self, group_id: str, messages: List[Dict[str, Any]]) -> int:
+        """
+        Archives messages of one group (one new segment per time bucket they
+        span). Durable when this returns. Returns the number archived.
+        """
+        if not messages:
+            return 0
+        messages = sorted(messages, key=message_key)
+        by_bucket: Dict[int, List[Dict[str, Any]]] = {}
+        for message in messages:
+            by_bucket.setdefault(_bucket(message.get("timestamp") or "", self.bucket_seconds), []).append(message)
+
+        with self.locked(), self._lock:
+            os.makedirs(self._dir(group_id), exist_ok=True)
+            manifest = list(self._manifest(group_id))
+            for bucket, chunk in by_bucket.items():
+                manifest.append(self._write_segment(group_id, bucket, chunk))
+            manifest.sort(key=lambda segment: segment["first"])
+            self._save_manifest(group_id, manifest)
+        return len(messages)
+
+    def _write_segment(self, group_id: str, bucket: int, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        label = datetime.fromtimestamp(bucket, timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"{label}-{uuid.uuid4().hex[:8]}"
+        data, index, ids = bytearray(), [], []
+        for start in range(0, len(messages), self.block_messages):
+            block = messages[start : start + self.block_messages]
+            compressed = zlib.compress(json.dumps(block, separators=(",", ":")).encode("utf-8"), 6)
+            index.append([message_key(block[0]), message_key(block[-1]), len(data), len(compressed)])
+            ids.append([m["id"] for m in block])
+            data += compressed
+        directory = self._dir(group_id)
+        _write_atomically(os.path.join(directory, name + ".seg"), bytes(data))
+        _write_atomically(os.path.join(directory, name + ".idx"), json.dumps(index).encode("utf-8"))
+        _write_atomically(os.path.join(directory, name + ".ids"), self._ids_file(ids))
+        return {
+            "name": name,
+            "first": message_key(messages[0]),
+            "last": message_key(messages[-1]),
+            "count": len(messages),
+        }
+
+    def drop_before(self, group_id: str, timestamp: str) -> int:
+        """Deletes segments whose newest message is older than `timestamp`. Returns messages dropped."""
+        with self.locked(), self._lock:
+            manifest = self._manifest(group_id)
+            expired = [s for s in manifest if s["last"][0] < timestamp]
+            if not expired:
+                return 0
+            self._save_manifest(group_id, [s for s in manifest if s["last"][0] >= timestamp])
+            for segment in expired:
+                for suffix in (".seg", ".idx", ".ids"):
+                    path = os.path.join(self._dir(group_id), segment["name"] + suffix)
+                    mapped = self._maps.pop(path, None)
+                    if mapped is not None:
+                        mapped.close()
+                    self._indexes.pop(path, None)
+                    self._id_indexes.pop(path, None)
+                    if os.path.exists(path):
+                        os.remove(path)
+            return sum(s["count"] for s in expired)
+
+    # --- Reads ---
+
+    def count(self, group_id: str) -> int:
+        with self._lock:
+            return sum(s["count"] for s in self._manifest(group_id))
+
+    def _segment_messages(
+        self,
+        group_id: str,
+        segment: Dict[str, Any],
+        after: Optional[OrderKey],
+        before: Optional[OrderKey],
+        reverse: bool,
+    ) -> Iterator[Dict[str, Any]]:
+        """Messages of one segment between the bounds, decompressing only the blocks needed."""
+        index = self._index(group_id, segment["name"])
+        low = 0 if after is None else bisect_right([block[1] for block in index], after)
+        high = len(index) if before is None else bisect_left([block[0] for block in index], before)
+        blocks = index[low:high]
+        for block in reversed(blocks) if reverse else blocks:
+            messages = self._block(group_id, segment["name"], block)
+            for message in reversed(messages) if reverse else messages:
+                key = message_key(message)
+                if (after is None or key > after) and (before is None or key < before):
+                    yield message
+
+    def _messages_between(
+        self, group_id: str, after: Optional[OrderKey], before: Optional[OrderKey], reverse: bool
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Archived messages between the bounds, in key order (or reversed).
+
+        Segments written by successive retention runs don't overlap and are
+        read one after the other. Overlapping ones (e.g. late messages
+        archived after their bucket) are split into non-overlapping chains
+        that are merged, so the order holds either way.
+        """
+        segments = [
+            s for s in self._manifest(group_id)
+            if (after is None or s["last"] > after) and (before is None or s["first"] < before)
+        ]
+        chains: List[List[Dict[str, Any]]] = []
+        for segment in segments:
+            chain = next((c for c in chains if c[-1]["last"] < segment["first"]), None)
+            if chain is None:
+                chains.append([segment])
+            else:
+                chain.append(segment)
+
+        def read(chain):
+            for segment in reversed(chain) if reverse else chain:
+                yield from self._segment_messages(group_id, segment, after, before, reverse)
+
+        if len(chains) == 1:
+            return read(chains[0])
+        return heapq.merge(*(read(chain) for chain in chains), key=message_key, reverse=reverse)
+
+    def page(
+        self, group_id: str, after: Optional[OrderKey] = None, before: Optional[OrderKey] = None, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """Same contract as JsonStore.ordered_page, over the archived messages of a group."""
+        with self._lock:
+            reverse = after is None
+            found = list(islice(self._messages_between(group_id, after, before, reverse), limit))
+            return found[::-1] if reverse else found
+
+    def locate(self, group_id: str, message_id: str) -> Optional[OrderKey]:
+        """
+        Key of an archived message, for using it as a cursor. Messages
+        recently served from the archive are found at once; otherwise each
+        segment's id file says which block (if any) to decompress.
+        """
+        with self._lock:
+            key = self._keys.get((group_id, message_id))
+            if key is not None:
+                return key
+            wanted = _id_hashes([message_id])[0]
+            for segment in reversed(self._manifest(group_id)):
+                hashes, blocks = self._ids(group_id, segment["name"])
+                i = int(np.searchsorted(hashes, wanted))
+                while i < len(hashes) and hashes[i] == wanted:
+                    block = self._index(group_id, segment["name"])[int(blocks[i])]
+                    for message in self._block(group_id, segment["name"], block):
+                        if message.get("id") == message_id:
+                            return message_key(message)
+                    i += 1
+            return None
+
+    def close(self) -> None:
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._blocks.clear()
@@ -0,0 +1,37 @@
+"""
+One-shot migration of db.json into the SQLite backend.
+
+Usage: python -m app.data.migrate [--json PATH] [--sqlite PATH] [--force]
+"""
+import argparse
+import sys
+
+from app.data import storage
+from app.data.errors import MigrationError
+from app.data.sqlite_store import SqliteStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import db.json into SQLite")
+    parser.add_argument("--json", default=storage.DB_PATH, help="source db.json")
+    parser.add_argument("--sqlite", default=storage.SQLITE_PATH, help="target SQLite file")
+    parser.add_argument("--force", action="store_true", help="re-import even if already migrated")
+    args = parser.parse_args()
+
+    store = SqliteStore(args.sqlite, storage.INDEXES, ordered=storage.ORDERED)
+    try:
+        migrated = store.migrate_from_json(args.json, force=args.force)
+    except MigrationError as e:
+        store.close()
+        print(f"Migration failed, nothing imported. Fix these in {args.json} and retry:\n{e}")
+        sys.exit(1)
+    if migrated:
+        counts = {name: len(items) for name, items in store.load().items()}
+        print(f"Migrated {args.json} -> {args.sqlite}: {counts}")
+    else:
+        print("Nothing to do (already migrated or no source file). Use --force to re-import.")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
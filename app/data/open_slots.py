@@ -0,0 +1,140 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class OpenSlotsIndex:
+    """
+    Remaining capacity (max_members - len(members)) of every group that is
+    not full, kept in step with group writes by the storage facade.
+
+    Capacities live in a dict (O(1) per write). For paging, open groups are
+    also kept as sorted creation sequence numbers, once overall and once per
+    remaining-capacity bucket, so a page is a slice rather than a scan. A
+    write only moves a group between buckets, which is a bisect.
+    Groups without max_members are never listed.
+
+    `epoch` and `seq` record the storage epoch and change-log position
+    (see SqliteStore.changes) the index is current with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.epoch = None
+        self.seq: Optional[int] = None
+        self._clear()
+
+    def _clear(self) -> None:
+        self._next_seq = 0
+        self._seq: Dict[str, int] = {}
+        self._ids: Dict[int, str] = {}
+        self._remaining: Dict[str, int] = {}
+        self._open: List[int] = []
+        self._by_remaining: Dict[int, List[int]] = {}
+
+    def rebuild(self, groups: Iterable[Dict[str, Any]], epoch: Any = None, seq: Optional[int] = None) -> None:
+        with self._lock:
+            self._clear()
+            for group in groups:
+                self._put(group)
+            self.epoch = epoch
+            self.seq = seq
+
+    def remaining(self, group_id: str) -> Optional[int]:
+        """Open slots of a group; None if it is full, unknown or unbounded."""
+        return self._remaining.get(group_id)
+
+    def sync(self, group_id: str, load: Callable[[str, str], Optional[Dict[str, Any]]]) -> None:
+        """
+        Re-reads a group after a write (`load` is storage.get_item_by_id).
+        Reading under the index lock means concurrent writers' syncs can't
+        apply an older state over a newer one.
+        """
+        with self._lock:
+            self._sync(group_id, load)
+
+    def catch_up(
+        self, group_ids: Iterable[str], seq: int, load: Callable[[str, str], Optional[Dict[str, Any]]]
+    ) -> None:
+        """Syncs groups written elsewhere (e.g. by other worker processes) up to change `seq`."""
+        with self._lock:
+            for group_id in group_ids:
+                self._sync(group_id, load)
+            self.seq = seq
+
+    def _sync(self, group_id: str, load: Callable[[str, str], Optional[Dict[str, Any]]]) -> None:
+        group = load("groups", group_id)
+        if group is None:
+            self._remove(group_id)
+        else:
+            self._put(group)
+
+    def _remove(self, group_id: str) -> None:
+        self._close(group_id)
+        seq = self._seq.pop(group_id, None)
+        if seq is not None:
+            del self._ids[seq]
+
+    def _put(self, group: Dict[str, Any]) -> None:
+        group_id = group.get("id")
+        if group_id not in self._seq:
+            self._seq[group_id] = self._next_seq
+            self._ids[self._next_seq] = group_id
+            self._next_seq += 1
+
+        max_members = group.get("max_members")
+        remaining = None if max_members is None else max_members - len(group.get("members", []))
+        if remaining is not None and remaining <= 0:
+            remaining = None
+        if remaining == self._remaining.get(group_id):
+            return
+
+        self._close(group_id)
+        if remaining is not None:
+            seq = self._seq[group_id]
+            self._remaining[group_id] = remaining
+            insort(self._open, seq)
+            insort(self._by_remaining.setdefault(remaining, []), seq)
+
+    def _close(self, group_id: str) -> None:
+        remaining = self._remaining.pop(group_id, None)
+        if remaining is None:
+            return
+        seq = self._seq[group_id]
+        del self._open[bisect_left(self._open, seq)]
+        bucket = self._by_remaining[remaining]
+        del bucket[bisect_left(bucket, seq)]
+        if not bucket:
+            del self._by_remaining[remaining]
+
+    def page(
+        self, skip: int = 0, limit: int = 100, fewest_first: bool = False, max_slots: Optional[int] = None
+    ) -> List[str]:
+        """
+        Ids of open groups, in creation order or (`fewest_first`) by
+        remaining slots ascending then creation order, optionally only
+        those with at most `max_slots` slots left.
+        """
+        with self._lock:
+            buckets = [
+                self._by_remaining[r] for r in sorted(self._by_remaining) if max_slots is None or r <= max_slots
+            ]
+            if not fewest_first:
+                if max_slots is None:
+                    seqs = self._open[skip : skip + limit]
+                else:
+                    seqs = list(islice(heapq.merge(*buckets), skip, skip + limit))
+                return [self._ids[seq] for seq in seqs]
+
+            seqs = []
+            for bucket in buckets:
+                if skip >= len(bucket):
+                    skip -= len(bucket)
+                    continue
+                seqs.extend(bucket[skip : skip + limit - len(seqs)])
+                skip = 0
+                if len(seqs) == limit:
+                    break
+            return [self._ids[seq] for seq in seqs]
@@ -0,0 +1,474 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from app.data.errors import DuplicateKeyError, MigrationError
+from app.data.json_store import IndexSpec, JsonStore, OrderKey, OrderedSpec
+from app.data.locks import StripedLock
+
+# Rows of the change log kept for other processes to catch up from
+CHANGE_LOG_ROWS = 10_000
+
+
+class SqliteStore:
+    """
+    SQLite implementation of the storage contract.
+
+    Every collection declared in `indexes` gets its own table with an `id`
+    primary key, one real column (and SQL index) per declared field and the
+    full item as JSON in `data`. Other collections share a generic `items`
+    table keyed by (collection, id). The database runs in WAL mode so readers
+    never block the writer; connections are kept per thread.
+
+    Triggers append every written (collection, id) to a `changes` log, so
+    in-memory indexes of one process can pick up writes made by other
+    processes (see changes()).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        indexes: IndexSpec | None = None,
+        migrate_from: str | None = None,
+        ordered: OrderedSpec | None = None,
+    ):
+        self.path = path
+        self.indexes = indexes or {}
+        self.ordered = ordered or {}
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.RLock()
+        self._item_locks = StripedLock()
+        # Bumped on wholesale replacement (see JsonStore.epoch)
+        self.epoch = 0
+        self._create_schema()
+        if migrate_from:
+            self.migrate_from_json(migrate_from)
+
+    # --- Connections & schema ---
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _create_schema(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (collection, id))"
+            )
+            for name, fields in self.indexes.items():
+                columns = "".join(f", {_q(field)}" for field in fields)
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {_q(name)} "
+                    f"(id TEXT PRIMARY KEY{columns}, data TEXT NOT NULL)"
+                )
+                for field, unique in fields.items():
+                    kind = "UNIQUE INDEX" if unique else "INDEX"
+                    conn.execute(
+                        f"CREATE {kind} IF NOT EXISTS {_q(f'ix_{name}_{field}')} "
+                        f"ON {_q(name)} ({_q(field)})"
+                    )
+            for name, (field, order_by) in self.ordered.items():
+                if name in self.indexes:
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {_q(f'ix_{name}_{field}_{order_by}')} "
+                        f"ON {_q(name)} ({self._field_expr(name, field)}, {self._sort_expr(name)}, id)"
+                    )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, id TEXT NOT NULL)"
+            )
+            tables = [("items", None)] + [(name, _literal(name)) for name in self.indexes]
+            for table, collection in tables:
+                for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                    conn.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS {_q(f'log_{table}_{event.lower()}')} "
+                        f"AFTER {event} ON {_q(table)} BEGIN "
+                        f"INSERT INTO changes (collection, id) VALUES ({collection or row + '.collection'}, {row}.id); "
+                        "END"
+                    )
+
+    def _table(self, collection: str) -> Tuple[str, str, List[Any]]:
+        """Returns (table, base WHERE clause, params) for a collection."""
+        if collection in self.indexes:
+            return _q(collection), "1", []
+        return "items", "collection = ?", [collection]
+
+    def _field_expr(self, collection: str, field: str) -> str:
+        if field == "id" or field in self.indexes.get(collection, {}):
+            return _q(field)
+        return f"json_extract(data, '$.{field}')"
+
+    def _sort_expr(self, collection: str) -> str:
+        # Same expression as the index, so SQLite can use it; matches json_store.sort_value
+        return f"COALESCE({self._field_expr(collection, self.ordered[collection][1])}, '')"
+
+    # --- Reads ---
+
+    def query(
+        self,
+        collection: str,
+        where: Dict[str, Any] | None = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        table, clause, params = self._table(collection)
+        for field, value in (where or {}).items():
+            clause += f" AND {self._field_expr(collection, field)} = ?"
+            params.append(value)
+        sql = f"SELECT data FROM {table} WHERE {clause} ORDER BY rowid LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, skip]
+        rows = self._conn().execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def ordered_page(
+        self,
+        collection: str,
+        value: Any,
+        after: OrderKey | None = None,
+        before: OrderKey | None = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """A page of one partition of an ordered collection (see JsonStore.ordered_page)."""
+        if collection not in self.ordered:
+            return []
+        table, clause, params = self._table(collection)
+        key = f"({self._sort_expr(collection)}, id)"
+        clause += f" AND {self._field_expr(collection, self.ordered[collection][0])} = ?"
+        params.append(value)
+        if after is not None:
+            clause += f" AND {key} > (?, ?)"
+            params += list(after)
+        if before is not None:
+            clause += f" AND {key} < (?, ?)"
+            params += list(before)
+        # From the `after` side if given, else back from `before` / the end
+        direction = "ASC" if after is not None else "DESC"
+        sql = (
+            f"SELECT data FROM {table} WHERE {clause} "
+            f"ORDER BY {self._sort_expr(collection)} {direction}, id {direction} LIMIT ?"
+        )
+        rows = self._conn().execute(sql, params + [limit]).fetchall()
+        items = [json.loads(row[0]) for row in rows]
+        return items if after is not None else items[::-1]
+
+    def get_all(self, collection: str) -> List[Any]:
+        return self.query(collection)
+
+    def get_item_by_id(self, collection: str, item_id: str) -> Dict[str, Any] | None:
+        table, clause, params = self._table(collection)
+        row = self._conn().execute(
+            f"SELECT data FROM {table} WHERE {clause} AND id = ?", params + [item_id]
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by(self, collection: str, field: str, value: Any) -> List[Dict[str, Any]]:
+        return self.query(collection, {field: value})
+
+    # --- Writes ---
+
+    def _write(self, conn: sqlite3.Connection, collection: str, item: Dict[str, Any], replace: bool) -> None:
+        data = json.dumps(item)
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        try:
+            if collection in self.indexes:
+                fields = list(self.indexes[collection])
+                columns = ", ".join(["id"] + [_q(f) for f in fields] + ["data"])
+                marks = ", ".join("?" * (len(fields) + 2))
+                values = [item.get("id")] + [_column_value(item.get(f)) for f in fields] + [data]
+                conn.execute(f"{verb} INTO {_q(collection)} ({columns}) VALUES ({marks})", values)
+            else:
+                conn.execute(
+                    f"{verb} INTO items (collection, id, data) VALUES (?, ?, ?)",
+                    (collection, item.get("id"), data),
+                )
+        except sqlite3.IntegrityError as e:
+            raise _duplicate(collection, item, e) from None
+
+    def add_item(self, collection: str, item: Dict[str, Any]) -> None:
+        conn = self._conn()
+        with conn:
+            self._write(conn, collection, item, replace=False)
+
+    def add_items(self, collection: str, items: List[Dict[str, Any]]) -> None:
+        """Adds several items in one transaction (one commit); all or nothing."""
+        conn = self._conn()
+        with conn:
+            for item in items:
+                self._write(conn, collection, item, replace=False)
+
+    def update_item(self, collection: str, item_id: str, updates: Dict[str, Any]) -> bool:
+        with self.transaction(collection, item_id) as item:
+            if item is None:
+                return False
+            item.update(updates)
+        return True
+
+    @contextmanager
+    def transaction(self, collection: str, item_id: str) -> Iterator[Dict[str, Any] | None]:
+        """
+        Atomic read-modify-write of one item.
+
+        The item lock serialises threads of this process, BEGIN IMMEDIATE
+        serialises writers across processes. Yields the item (None if
+        missing); changes are written back if the block exits cleanly.
+        Other storage writes must not be issued inside the block.
+        """
+        conn = self._conn()
+        with self._item_locks.lock_for((collection, item_id)):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                item = self.get_item_by_id(collection, item_id)
+                original = copy.deepcopy(item)
+                yield item
+                if item is not None and item != original:
+                    self._update(conn, collection, item_id, item)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def transaction_many(self, keys: List[Tuple[str, str]]) -> Iterator[Dict[Tuple[str, str], Dict[str, Any] | None]]:
+        """
+        Atomic read-modify-write of several items (see JsonStore.transaction_many),
+        in one BEGIN IMMEDIATE transaction.
+        """
+        conn = self._conn()
+        with ExitStack() as stack:
+            for lock in self._item_locks.locks_for(keys):
+                stack.enter_context(lock)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                items = {key: self.get_item_by_id(*key) for key in keys}
+                original = copy.deepcopy(items)
+                yield items
+                for (collection, item_id), item in items.items():
+                    if item == original[(collection, item_id)]:
+                        continue
+                    if item is None:
+                        table, clause, params = self._table(collection)
+                        conn.execute(f"DELETE FROM {table} WHERE {clause} AND id = ?", params + [item_id])
+                    elif original[(collection, item_id)] is None:
+                        self._write(conn, collection, {**item, "id": item_id}, replace=False)
+                    else:
+                        self._update(conn, collection, item_id, {**item, "id": item_id})
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def _update(self, conn: sqlite3.Connection, collection: str, item_id: str, item: Dict[str, Any]) -> None:
+        table, clause, params = self._table(collection)
+        data = json.dumps(item)
+        try:
+            if collection in self.indexes:
+                fields = list(self.indexes[collection])
+                assignments = "".join(f", {_q(f)} = ?" for f in fields)
+                values = [_column_value(item.get(f)) for f in fields]
+                conn.execute(
+                    f"UPDATE {table} SET data = ?{assignments} WHERE {clause} AND id = ?",
+                    [data] + values + params + [item_id],
+                )
+            else:
+                conn.execute(
+                    f"UPDATE {table} SET data = ? WHERE {clause} AND id = ?",
+                    [data] + params + [item_id],
+                )
+        except sqlite3.IntegrityError as e:
+            raise _duplicate(collection, item, e) from None
+
+    def delete_item(self, collection: str, item_id: str) -> bool:
+        table, clause, params = self._table(collection)
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(f"DELETE FROM {table} WHERE {clause} AND id = ?", params + [item_id])
+            return cur.rowcount > 0
+
+    def delete_items(self, collection: str, item_ids: List[str]) -> int:
+        """Deletes several items in one transaction. Returns how many existed."""
+        table, clause, params = self._table(collection)
+        conn = self._conn()
+        with conn:
+            cur = conn.executemany(
+                f"DELETE FROM {table} WHERE {clause} AND id = ?", [params + [item_id] for item_id in item_ids]
+            )
+            return cur.rowcount
+
+    # --- Change log ---
+
+    def changes(self, collection: str, after: Optional[int]) -> Tuple[int, Optional[List[str]]]:
+        """
+        (latest change number, ids of `collection` items written since change
+        `after`), by any process. The ids are None if `after` is None or the
+        log was trimmed past it; the caller then has to rebuild from scratch.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            floor = self._changes_floor(conn)
+            latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or floor
+            ids = None
+            if after is not None and after >= floor:
+                rows = conn.execute(
+                    "SELECT DISTINCT id FROM changes WHERE seq > ? AND collection = ?", (after, collection)
+                )
+                ids = [row[0] for row in rows]
+        finally:
+            conn.commit()
+        if latest - floor > 2 * CHANGE_LOG_ROWS:
+            self._trim_changes(latest - CHANGE_LOG_ROWS)
+        return latest, ids
+
+    def _changes_floor(self, conn: sqlite3.Connection) -> int:
+        """Change number up to which the log was trimmed."""
+        row = conn.execute("SELECT value FROM meta WHERE key = 'changes_floor'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _trim_changes(self, upto: int) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if upto > self._changes_floor(conn):
+                conn.execute("DELETE FROM changes WHERE seq <= ?", (upto,))
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('changes_floor', ?)", (str(upto),))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    # --- Whole database ---
+
+    def _collections(self) -> List[str]:
+        conn = self._conn()
+        names = list(self.indexes)
+        names += [row[0] for row in conn.execute("SELECT DISTINCT collection FROM items")]
+        return names
+
+    def load(self) -> Dict[str, List[Any]]:
+        return {name: self.get_all(name) for name in self._collections()}
+
+    def save(self, data: Dict[str, List[Any]]) -> None:
+        conn = self._conn()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._replace_all(conn, data)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            self.epoch += 1
+
+    def _replace_all(self, conn: sqlite3.Connection, data: Dict[str, List[Any]]) -> None:
+        for name in self.indexes:
+            conn.execute(f"DELETE FROM {_q(name)}")
+        conn.execute("DELETE FROM items")
+        # Plain INSERT: a duplicate id or email must not silently replace an
+        # earlier row. Keep going to report every conflict, then fail.
+        duplicates = []
+        for name, items in data.items():
+            for item in items:
+                try:
+                    self._write(conn, name, item, replace=False)
+                except DuplicateKeyError as e:
+                    duplicates.append((name, item.get("id"), e))
+        if duplicates:
+            raise MigrationError(duplicates)
+        # Everything changed: readers of the log rebuild instead
+        latest = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        conn.execute("DELETE FROM changes")
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('changes_floor', ?)",
+            (str(latest[0] if latest else 0),),
+        )
+
+    def migrate_from_json(self, json_path: str, force: bool = False) -> bool:
+        """
+        One-shot import of a db.json file. Skipped if a migration already ran
+        (unless `force`) or the JSON file does not exist. Returns True if
+        data was imported. Raises MigrationError, importing nothing, if
+        items share an id or a unique field (e.g. two users with one email).
+
+        The check and the import are one BEGIN IMMEDIATE transaction, so of
+        several workers starting on a fresh database only the first imports;
+        the others see its marker and leave the data (and any writes made
+        since) alone.
+        """
+        if not os.path.exists(json_path):
+            return False
+        done = self._conn().execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+        if done and not force:
+            return False
+
+        # Goes through JsonStore to also pick up writes still in its journal
+        data = JsonStore(json_path).load()
+        conn = self._conn()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+                if done and not force:
+                    conn.rollback()
+                    return False  # another process got there first
+                self._replace_all(conn, data)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                    (os.path.abspath(json_path),),
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            self.epoch += 1
+        return True
+
+    def refresh(self) -> None:
+        """Nothing is cached outside SQLite itself."""
+
+    def invalidate(self) -> None:
+        """Nothing is cached outside SQLite itself."""
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+def _q(name: str) -> str:
+    """Quotes an SQL identifier ("groups" is a keyword in recent SQLite)."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    """Quotes an SQL string literal (for trigger bodies, which take no parameters)."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _duplicate(collection: str, item: Dict[str, Any], error: sqlite3.IntegrityError) -> DuplicateKeyError:
+    # "UNIQUE constraint failed: users.email"
+    field = str(error).rsplit(".", 1)[-1]
+    return DuplicateKeyError(collection, field, item.get(field))
+
+
+def _column_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value)
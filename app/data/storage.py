@@ -1,74 +1,291 @@
-import json
 import os
-from typing import Dict, Any, List
+import threading
+from contextlib import contextmanager
+from typing import ContextManager, Dict, Any, Iterator, List, Optional, Tuple
+
+from app.data.errors import DuplicateKeyError, ItemDeletedError, MigrationError, StorageError
+from app.data.json_store import JsonStore, sort_value
+from app.data.open_slots import OpenSlotsIndex
+from app.data.sqlite_store import SqliteStore
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "db.json")
 
+# "json" (db.json + journal) or "sqlite"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_PATH = os.environ.get("STORAGE_SQLITE_PATH", os.path.join(os.path.dirname(__file__), "db.sqlite3"))
+
+# Write-ahead journal: mutations append to db.json.journal, which is folded
+# back into db.json once it passes a size or age threshold.
+JOURNAL_ENABLED = os.environ.get("STORAGE_JOURNAL", "1") != "0"
+JOURNAL_COMPACT_BYTES = int(os.environ.get("STORAGE_JOURNAL_COMPACT_BYTES", 1 << 20))
+JOURNAL_COMPACT_SECONDS = float(os.environ.get("STORAGE_JOURNAL_COMPACT_SECONDS", 300))
+
+# Secondary indexes per collection: field -> unique
+INDEXES = {
+    "users": {"email": True},
+    "groups": {"admin_id": False},
+    "messages": {"group_id": False},
+    # Like graph edges (app.services.likes): forward and reverse adjacency
+    "user_likes": {"from": False, "to": False},
+}
+
+# Collections kept sorted within a partition: collection -> (partition field, sort field)
+ORDERED = {
+    "messages": ("group_id", "timestamp"),
+}
+
+_store: JsonStore | SqliteStore | None = None
+_store_generation = 0
+_store_lock = threading.Lock()
+
+# Open slots per group, maintained by the group writes below
+_open_slots = OpenSlotsIndex()
+
+def create_store() -> JsonStore | SqliteStore:
+    """Builds the store selected by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == "sqlite":
+        # The first start on an empty SQLite file imports db.json once
+        return SqliteStore(SQLITE_PATH, INDEXES, migrate_from=DB_PATH, ordered=ORDERED)
+    if STORAGE_BACKEND != "json":
+        raise StorageError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'")
+    return JsonStore(
+        DB_PATH,
+        INDEXES,
+        journal=JOURNAL_ENABLED,
+        compact_bytes=JOURNAL_COMPACT_BYTES,
+        compact_seconds=JOURNAL_COMPACT_SECONDS,
+        ordered=ORDERED,
+    )
+
+def get_store() -> JsonStore | SqliteStore:
+    """Returns the process-wide store, creating it on first use."""
+    global _store, _store_generation
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+                _store_generation += 1
+    return _store
+
+def reset_store() -> None:
+    """Closes and forgets the current store (e.g. after DB_PATH or the backend changed)."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+        _store = None
+
+def close() -> None:
+    """Flushes pending journal records / closes connections. Called on shutdown."""
+    if _store is not None:
+        _store.close()
+
+def epoch() -> tuple:
+    """
+    Changes whenever the data may have been replaced wholesale (new store,
+    external edit of db.json, save_db). In-memory indexes built on top of
+    storage compare it to know when to rebuild.
+    """
+    store = get_store()
+    store.refresh()
+    return (_store_generation, store.epoch)
+
+def invalidate_cache() -> None:
+    """Forces the next read to go back to the database file."""
+    get_store().invalidate()
+
 def load_db() -> Dict[str, List[Any]]:
-    """Loads the database from the JSON file."""
-    if not os.path.exists(DB_PATH):
-        # Initialize if not exists
-        initial_data = {"users": [], "groups": []}
-        save_db(initial_data)
-        return initial_data
-    
-    with open(DB_PATH, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {"users": [], "groups": []}
+    """Loads the whole database as {collection: [items]}."""
+    return get_store().load()
 
 def save_db(data: Dict[str, List[Any]]) -> None:
-    """Saves the database to the JSON file."""
-    with open(DB_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+    """Replaces the whole database."""
+    get_store().save(data)
 
 def get_all(collection: str) -> List[Any]:
     """Retrieve all items from a collection (users or groups)."""
-    db = load_db()
-    return db.get(collection, [])
+    return get_store().get_all(collection)
+
+def query(
+    collection: str,
+    where: Dict[str, Any] | None = None,
+    skip: int = 0,
+    limit: int | None = None,
+) -> List[Dict[str, Any]]:
+    """Retrieve a page of items matching all `where` equalities, in insertion order.
+
+    Filtering and pagination run inside the backend (indexes / SQL), so the
+    collection is never materialised as a whole.
+    """
+    return get_store().query(collection, where, skip, limit)
+
+def ordered_key(collection: str, value: Any, item_id: str) -> Tuple[str, str] | None:
+    """
+    Position (sort value, id) of an item in partition `value` of an ordered
+    collection (see ORDERED), or None if it is not there.
+    """
+    partition, order_by = ORDERED[collection]
+    item = get_item_by_id(collection, item_id)
+    if item is None or item.get(partition) != value:
+        return None
+    return (sort_value(item.get(order_by)), item_id)
+
+def ordered_page(
+    collection: str,
+    value: Any,
+    after: str | None = None,
+    before: str | None = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """
+    A page of the items whose partition field (see ORDERED) equals `value`,
+    in sort order, e.g. a group's messages by timestamp. `after`/`before`
+    are ids of items in the partition (exclusive bounds): with `after` the
+    page holds the first `limit` items after it, otherwise the last `limit`
+    before `before` (or the newest). Served from an ordered index, so the
+    cost depends on the page size, not the partition or collection size.
+
+    Raises KeyError if a cursor id does not exist.
+    """
+    bounds = []
+    for cursor in (after, before):
+        key = None if cursor is None else ordered_key(collection, value, cursor)
+        if cursor is not None and key is None:
+            raise KeyError(cursor)
+        bounds.append(key)
+    return ordered_page_by_key(collection, value, bounds[0], bounds[1], limit)
+
+def ordered_page_by_key(
+    collection: str,
+    value: Any,
+    after: Tuple[str, str] | None = None,
+    before: Tuple[str, str] | None = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """
+    ordered_page() with (sort value, id) bounds instead of item ids, e.g.
+    (timestamp, "") to cut at a point in time.
+    """
+    return get_store().ordered_page(collection, value, after, before, limit)
 
 def add_item(collection: str, item: Dict[str, Any]) -> None:
-    """Add an item to a collection."""
-    db = load_db()
-    if collection not in db:
-        db[collection] = []
-    
-    db[collection].append(item)
-    save_db(db)
+    """Add an item to a collection. Raises DuplicateKeyError on a unique clash."""
+    get_store().add_item(collection, item)
+    _written(collection, item.get("id"))
+
+def add_items(collection: str, items: List[Dict[str, Any]]) -> None:
+    """
+    Add several items with one durable write. All or nothing: raises
+    DuplicateKeyError, and stores none of them, on a unique clash.
+    """
+    if not items:
+        return
+    get_store().add_items(collection, items)
+    for item in items:
+        _written(collection, item.get("id"))
 
 def get_item_by_id(collection: str, item_id: str) -> Dict[str, Any] | None:
     """Retrieve an item by its ID."""
-    items = get_all(collection)
-    for item in items:
-        if item.get("id") == item_id:
-            return item
-    return None
+    return get_store().get_item_by_id(collection, item_id)
+
+def find_by(collection: str, field: str, value: Any) -> List[Dict[str, Any]]:
+    """Retrieve all items whose `field` equals `value` (indexed if declared in INDEXES)."""
+    return get_store().find_by(collection, field, value)
+
+def find_one(collection: str, field: str, value: Any) -> Dict[str, Any] | None:
+    """Retrieve the first item whose `field` equals `value`."""
+    items = find_by(collection, field, value)
+    return items[0] if items else None
 
 def update_item(collection: str, item_id: str, updates: Dict[str, Any]) -> bool:
-    """Update an item in a collection. Returns True if found."""
-    db = load_db()
-    items = db.get(collection, [])
-    
-    for i, item in enumerate(items):
-        if item.get("id") == item_id:
-            items[i].update(updates)
-            db[collection] = items
-            save_db(db)
-            return True
-            
-    return False
+    """Update an item in a collection. Returns True if found.
+
+    Raises DuplicateKeyError if the update clashes with a unique index.
+    """
+    found = get_store().update_item(collection, item_id, updates)
+    if found:
+        _written(collection, item_id)
+    return found
 
 def delete_item(collection: str, item_id: str) -> bool:
     """Delete an item from a collection. Returns True if found."""
-    db = load_db()
-    items = db.get(collection, [])
-    
-    for i, item in enumerate(items):
-        if item.get("id") == item_id:
-            del items[i]
-            db[collection] = items
-            save_db(db)
-            return True
-            
-    return False
+    found = get_store().delete_item(collection, item_id)
+    if found:
+        _written(collection, item_id)
+    return found
+
+def delete_items(collection: str, item_ids: List[str]) -> int:
+    """Delete several items with one durable write. Returns how many existed."""
+    if not item_ids:
+        return 0
+    removed = get_store().delete_items(collection, item_ids)
+    for item_id in item_ids:
+        _written(collection, item_id)
+    return removed
+
+def transaction(collection: str, item_id: str) -> ContextManager[Dict[str, Any] | None]:
+    """
+    Atomic read-modify-write of a single item.
+
+        with storage.transaction("groups", group_id) as group:
+            if group is None:
+                ...
+            group["members"].append(user_id)
+
+    The block gets a private copy of the item (None if it does not exist)
+    and holds that item's lock; the modified item is saved when the block
+    exits without an exception, and discarded otherwise. Raises
+    ItemDeletedError if the item was deleted before the changes could be
+    saved. Don't issue other storage writes or nest transactions inside the
+    block.
+    """
+    if collection != "groups":
+        return get_store().transaction(collection, item_id)
+    return _group_transaction(item_id)
+
+def transaction_many(keys: List[Tuple[str, str]]) -> ContextManager[Dict[Tuple[str, str], Dict[str, Any] | None]]:
+    """
+    Atomic read-modify-write of several items, saved all together or not
+    at all (also across a crash).
+
+        with storage.transaction_many([("a", id1), ("b", id2)]) as items:
+            items[("a", id1)] = {"id": id1, ...}   # create or replace
+            items[("b", id2)] = None                # delete
+
+    Same rules as transaction(). Not for groups, whose writes also update
+    the open-slots index.
+    """
+    if any(collection == "groups" for collection, _ in keys):
+        raise ValueError("Use transaction() for groups")
+    return get_store().transaction_many(keys)
+
+@contextmanager
+def _group_transaction(item_id: str) -> Iterator[Dict[str, Any] | None]:
+    with get_store().transaction("groups", item_id) as item:
+        yield item
+    _written("groups", item_id)
+
+# --- Derived indexes ---
+
+def _written(collection: str, item_id: str) -> None:
+    """Keeps derived indexes in step with a write that just happened."""
+    if collection == "groups" and _open_slots.epoch == epoch():
+        _open_slots.sync(item_id, get_item_by_id)
+
+def open_groups(
+    skip: int = 0, limit: int = 100, fewest_first: bool = False, max_slots: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    A page of groups that still have room (see OpenSlotsIndex.page for the
+    ordering options), served from the open-slots index. Groups other
+    processes wrote since the last call are re-read from the store's change
+    log first.
+    """
+    current = epoch()
+    seq, changed = get_store().changes("groups", _open_slots.seq)
+    if _open_slots.epoch != current or changed is None:
+        _open_slots.rebuild(get_all("groups"), current, seq)
+    elif seq != _open_slots.seq:
+        _open_slots.catch_up(changed, seq, get_item_by_id)
+    ids = _open_slots.page(skip, limit, fewest_first, max_slots)
+    return [g for g in (get_item_by_id("groups", gid) for gid in ids) if g]
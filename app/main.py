@@ -1,11 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
+from app.data import storage
+from app.services import embeddings, group_index, messages, retention, user_index
+
+def _build_indexes():
+    group_index.index.rebuild()
+    user_index.index.rebuild()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the model (and embed all groups and users) without holding up
+    # startup; recommendations use lexical scoring until it's ready
+    if embeddings.WARMUP_ENABLED:
+        embeddings.start_warmup(then=_build_indexes)
+    # Move old chat messages to the archive periodically
+    retention.start_background()
+    yield
+    retention.stop_background()
+    # Write out queued chat messages
+    messages.writer.close()
+    # Fold the storage journal back into db.json
+    storage.close()
+    # Keep encoded vocabulary across restarts (if EMBEDDING_CACHE_PATH is set)
+    embeddings.cache.save()
 
 app = FastAPI(
     title="CommunityCompass API",
     description="Backend API for CommunityCompass",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -21,4 +46,11 @@ app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/")
 def root():
-    return {"message": "Welcome to CommunityCompass API", "docs": "/docs"}
\ No newline at end of file
+    return {"message": "Welcome to CommunityCompass API", "docs": "/docs"}
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: the API always serves, but recommendations are only
+    semantic once the model is loaded."""
+    model = embeddings.model_status()
+    return {"ready": model["state"] == "ready", "model": model}
\ No newline at end of file
@@ -1,7 +1,33 @@
-from pydantic import BaseModel, Field
-from typing import List
+from functools import lru_cache
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Tuple
 from uuid import uuid4
 
+@lru_cache(maxsize=4096)
+def parse_age_group(age_group: Optional[str]) -> Tuple[int, Optional[int]]:
+    """
+    (min, max) ages of an age group string:
+    - "All Ages" -> (0, None)   (None: no upper limit)
+    - "21+"      -> (21, None)
+    - "18-25"    -> (18, 25)
+    - "30"       -> (30, 30)
+    Strings that match no age give (0, -1).
+    """
+    if not age_group or age_group == "All Ages":
+        return (0, None)
+    try:
+        if "+" in age_group:
+            return (int(age_group.replace("+", "").strip()), None)
+        if "-" in age_group:
+            parts = age_group.split("-")
+            return (int(parts[0].strip()), int(parts[1].strip()))
+    except ValueError:
+        return (0, -1)
+    # A single number is an exact age (compared as written, so "030" never matches)
+    if age_group.isdigit() and str(int(age_group)) == age_group:
+        return (int(age_group), int(age_group))
+    return (0, -1)
+
 class GroupBase(BaseModel):
     name: str
     description: str
@@ -9,6 +35,9 @@ class GroupBase(BaseModel):
     location: str
     max_members: int
     age_group: str = "All Ages"
+    # Optional coordinates for distance-based matching and /groups/nearby
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class GroupCreate(GroupBase):
     pass
@@ -17,7 +46,22 @@ class Group(GroupBase):
     id: str = Field(default_factory=lambda: str(uuid4()))
     members: List[str] = []  # List of User IDs
     admin_id: str
+    # Parsed from age_group, so scoring never parses strings
+    age_min: int = 0
+    age_max: Optional[int] = None  # None: no upper limit
+
+    @model_validator(mode="after")
+    def _parse_age_group(self):
+        self.age_min, self.age_max = parse_age_group(self.age_group)
+        return self
 
 class GroupRecommendation(Group):
     relevance_score: int
     score_breakdown: dict = {}
+
+class GroupSearchPage(BaseModel):
+    items: List[Group]
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
+
+class GroupNearby(Group):
+    distance_km: float
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
 from uuid import uuid4
 
@@ -8,10 +8,40 @@ class UserBase(BaseModel):
     age: int
     interests: List[str] = []
     location: str
+    # Optional coordinates for distance-based group matching
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class UserCreate(UserBase):
     id: Optional[str] = None
 
+class UserUpdate(BaseModel):
+    name: Optional[str] = None
+    email: Optional[str] = None
+    age: Optional[int] = None
+    interests: Optional[List[str]] = None
+    location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def _reject_nulls(self):
+        # Only the coordinates can be cleared; None elsewhere would be saved as-is
+        nulls = [f for f in self.model_fields_set if getattr(self, f) is None and f not in ("latitude", "longitude")]
+        if nulls:
+            raise ValueError(f"{', '.join(sorted(nulls))} cannot be null")
+        return self
+
 class User(UserBase):
     id: str = Field(default_factory=lambda: str(uuid4()))
-    liked_by: List[str] = [] # List of user_ids who liked this user
+    likes: int = 0  # Likes received
+    # Who they are; kept for older clients, page /users/{id}/liked_by instead
+    liked_by: List[str] = Field(default_factory=list, deprecated="Use likes and /users/{id}/liked_by")
+
+class UserRecommendation(User):
+    relevance_score: int
+    score_breakdown: dict = {}
+
+class LikePage(BaseModel):
+    total: int
+    user_ids: List[str]
@@ -0,0 +1,164 @@
+import math
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# Rows per chunk when assigning many vectors to centroids (bounds memory)
+_CHUNK = 65536
+
+
+class IVFIndex:
+    """
+    Inverted-file index for approximate maximum-inner-product search over
+    unit vectors, in pure NumPy.
+
+    Training runs spherical k-means on (a sample of) the vectors to get
+    `nlist` centroids; every row is filed under its nearest centroid. A query
+    only scores the rows filed under its `nprobe` closest centroids, so
+    recall and latency both grow with `nprobe` (nprobe == nlist is exact).
+
+    The index stores row numbers only; the caller owns the vectors.
+    """
+
+    def __init__(self, nlist: int, iterations: int = 10, sample_size: int = 50_000, seed: int = 0):
+        self.nlist = nlist
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_rows = 0
+        self._lists: List[List[int]] = []
+        self._arrays: List[Optional[np.ndarray]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Learns centroids from `vectors` and files all of them (rows 0..n-1)."""
+        rng = np.random.default_rng(self.seed)
+        n = len(vectors)
+        nlist = max(1, min(self.nlist, n))
+        sample = vectors if n <= self.sample_size else vectors[rng.choice(n, self.sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Empty clusters keep their previous centroid
+            sums[empty] = centroids[empty]
+            norms[empty] = 1
+            centroids = (sums / norms).astype(np.float32)
+
+        with self._lock:
+            self.centroids = centroids
+            self.trained_rows = n
+            self._lists = [[] for _ in range(nlist)]
+            self._arrays = [None] * nlist
+        self.add(np.arange(n), vectors)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Files new rows under their nearest centroid."""
+        if not len(rows):
+            return
+        assign = self._nearest(vectors, self.centroids)
+        with self._lock:
+            for row, list_id in zip(rows.tolist(), assign.tolist()):
+                self._lists[list_id].append(row)
+                self._arrays[list_id] = None
+
+    def search(self, queries: np.ndarray, nprobe: int) -> np.ndarray:
+        """Candidate row numbers for `queries` (union over all query vectors)."""
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        closeness = queries @ self.centroids.T
+        probed = np.unique(np.argpartition(-closeness, nprobe - 1, axis=1)[:, :nprobe])
+        with self._lock:
+            parts = [self._list_array(list_id) for list_id in probed.tolist()]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _list_array(self, list_id: int) -> np.ndarray:
+        array = self._arrays[list_id]
+        if array is None:
+            array = np.asarray(self._lists[list_id], dtype=np.int64)
+            self._arrays[list_id] = array
+        return array
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _CHUNK):
+            chunk = vectors[start : start + _CHUNK]
+            out[start : start + len(chunk)] = (chunk @ centroids.T).argmax(axis=1)
+        return out
+
+
+class BackgroundIVF:
+    """
+    The IVFIndex of an owner's growing row matrix (GroupEmbeddingIndex,
+    UserInterestIndex), trained on a background thread so no request waits
+    for k-means.
+
+    All methods are called with the owner's `lock` held. get() hands out the
+    current index, which may be stale (trained on fewer rows, new rows filed
+    under the old centroids) or None until the first training finishes;
+    callers score exactly in that case. A training is started when there is
+    no index or the row count has doubled since the last one. reset() drops
+    the index when row numbers change; trainings that started before are
+    thrown away.
+    """
+
+    def __init__(self, lock: threading.RLock, rows: Callable[[], np.ndarray]):
+        self._lock = lock
+        self._rows = rows  # the owner's live rows, vectors[:n_rows]
+        self._ivf: Optional[IVFIndex] = None
+        self._generation = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ivf is not None
+
+    def get(self, min_rows: int) -> Optional[IVFIndex]:
+        """The index to query (None: score exactly); starts a training if due."""
+        n = len(self._rows())
+        if n < min_rows:
+            return None
+        if (self._ivf is None or n > 2 * self._ivf.trained_rows) and self._thread is None:
+            self._thread = threading.Thread(target=self._train, args=(self._generation, self._rows()), daemon=True)
+            self._thread.start()
+        return self._ivf
+
+    def add(self, first: int, vectors: np.ndarray) -> None:
+        """Files rows appended at `first` (a running training catches up on its own)."""
+        if self._ivf is not None:
+            self._ivf.add(np.arange(first, first + len(vectors)), vectors)
+
+    def reset(self) -> None:
+        self._ivf = None
+        self._generation += 1
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Waits for a running training to finish (warm-up, tests)."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _train(self, generation: int, vectors: np.ndarray) -> None:
+        ivf = None
+        try:
+            ivf = IVFIndex(nlist=int(4 * math.sqrt(len(vectors))))
+            ivf.train(vectors)
+        except Exception as e:
+            print(f"IVF training failed: {e}")
+        with self._lock:
+            self._thread = None
+            if ivf is None or generation != self._generation:
+                return
+            rows = self._rows()
+            ivf.add(np.arange(len(vectors), len(rows)), rows[len(vectors) :])
+            self._ivf = ivf
@@ -0,0 +1,207 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.data import storage
+from app.services.embeddings import MODEL_NAME, embed
+from app.services import geo
+from app.services.recommendation import _is_candidate, age_bounds_arrays, location_arrays, location_scores
+
+# Where precomputed recommendations live: one item per user, id == user id
+COLLECTION = "recommendations"
+# Groups stored per user; requests for more fall back to online scoring
+TOP_K = int(os.environ.get("RECOMMENDER_PRECOMPUTED_TOP_K", 50))
+# Precomputed lists older than this are ignored
+TTL_SECONDS = float(os.environ.get("RECOMMENDER_PRECOMPUTED_TTL", 6 * 3600))
+# Users scored per task; bounds the (interests x activity tags) matrix
+CHUNK_USERS = 64
+
+# Group-side state of a pool worker, set by _init_worker
+_shared: Dict[str, Any] = {}
+
+
+def _init_worker(shared: Dict[str, Any]) -> None:
+    """Pool initializer: the group-side arrays are sent once per worker, not per task."""
+    _shared.clear()
+    _shared.update(shared)
+
+
+def _score_in_worker(users: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    return _score_chunk(users, _shared)
+
+
+def _score_chunk(users: List[Dict[str, Any]], shared: Dict[str, Any]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Scores a chunk of users against every group.
+
+    Semantic scores for the whole chunk come from one (interest rows x
+    activity tags) matmul, reduced to a max per group (over tag columns)
+    and then per user (over interest rows). Location and age bonuses and
+    the candidate filter are broadcast over the (users x groups) grid.
+    """
+    n_groups = len(shared["group_ids"])
+    semantic = np.zeros((len(users), n_groups), dtype=np.int64)
+
+    with_interests = [u for u, user in enumerate(users) if len(user["interests"])]
+    tags = shared["activity_vectors"]
+    if with_interests and len(tags):
+        rows = np.concatenate([users[u]["interests"] for u in with_interests])
+        counts = [len(users[u]["interests"]) for u in with_interests]
+        per_tag = rows @ tags.T
+        per_group = np.maximum.reduceat(per_tag, shared["tag_offsets"], axis=1)
+        per_user = np.maximum.reduceat(per_group, np.cumsum([0] + counts[:-1]), axis=0)
+        owners = shared["tag_owners"]
+        semantic[np.ix_(with_interests, owners)] = (np.maximum(per_user, 0) * 100).astype(np.int64)
+
+    results = []
+    for u, user in enumerate(users):
+        location = location_scores(user["location"], user["point"], *shared["locations"])
+        age_ok = (shared["age_min"] <= user["age"]) & (user["age"] <= shared["age_max"])
+        age = np.where(age_ok, 30, 0)
+        eligible = age_ok & ~shared["full"]
+        eligible[user["member_of"]] = False
+
+        totals = semantic[u] + location + age
+        candidates = np.flatnonzero(eligible)
+        # Stable, so ties keep storage order like the online path
+        top = candidates[np.argsort(-totals[candidates], kind="stable")[: shared["top_k"]]]
+        results.append((user["id"], [
+            {
+                "group_id": shared["group_ids"][g],
+                "semantic": int(semantic[u, g]),
+                "location": int(location[g]),
+                "age": int(age[g]),
+            }
+            for g in top.tolist()
+        ]))
+    return results
+
+
+def compute(
+    users: List[Dict[str, Any]],
+    groups: List[Dict[str, Any]],
+    top_k: int = TOP_K,
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Yields (user id, top-k entries) for every user, best first; each entry
+    holds the group id and its score breakdown. Matches what
+    get_recommended_groups returns online for the same data.
+
+    All embeddings are computed here (the model lives in this process);
+    scoring is spread over `workers` processes (default: one per CPU,
+    1 = in-process).
+    """
+    # Group side: flattened activity tags, tag_offsets[k] = first tag of group tag_owners[k]
+    tags: List[str] = []
+    tag_offsets, tag_owners = [], []
+    for g, group in enumerate(groups):
+        group_tags = [a for a in group.get("activity", []) if a]
+        if group_tags:
+            tag_offsets.append(len(tags))
+            tag_owners.append(g)
+            tags.extend(group_tags)
+
+    member_of: Dict[str, List[int]] = {}
+    for g, group in enumerate(groups):
+        for member in group.get("members", []):
+            member_of.setdefault(member, []).append(g)
+
+    age_min, age_max = age_bounds_arrays(groups)
+    shared = {
+        "group_ids": [group.get("id") for group in groups],
+        "activity_vectors": embed(tags) if tags else np.zeros((0, 0), dtype=np.float32),
+        "tag_offsets": np.asarray(tag_offsets, dtype=np.int64),
+        "tag_owners": np.asarray(tag_owners, dtype=np.int64),
+        "locations": location_arrays(groups),
+        "age_min": age_min,
+        "age_max": age_max,
+        "full": np.asarray([
+            g.get("max_members") is not None and len(g.get("members", [])) >= g["max_members"] for g in groups
+        ], dtype=bool),
+        "top_k": top_k,
+    }
+
+    # User side: interest embeddings, one batched encode for all users
+    interests = [[i for i in user.get("interests", []) if i] for user in users]
+    flat = [i for user_interests in interests for i in user_interests]
+    vectors = embed(flat) if flat else np.zeros((0, 0), dtype=np.float32)
+    prepared, start = [], 0
+    for user, user_interests in zip(users, interests):
+        prepared.append({
+            "id": user.get("id"),
+            "location": user.get("location", ""),
+            "point": geo.coordinates(user),
+            "age": user.get("age", 0),
+            "interests": vectors[start : start + len(user_interests)],
+            "member_of": member_of.get(user.get("id"), []),
+        })
+        start += len(user_interests)
+
+    chunks = [prepared[i : i + CHUNK_USERS] for i in range(0, len(prepared), CHUNK_USERS)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from _score_chunk(chunk, shared)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker, initargs=(shared,)) as pool:
+        for results in pool.map(_score_in_worker, chunks):
+            yield from results
+
+
+def run(top_k: int = TOP_K, workers: Optional[int] = None) -> int:
+    """Recomputes and stores recommendations for every user. Returns the user count."""
+    users = storage.get_all("users")
+    groups = storage.get_all("groups")
+    computed_at = time.time()
+    count = 0
+    for user_id, entries in compute(users, groups, top_k, workers):
+        save(user_id, entries, top_k, computed_at)
+        count += 1
+    return count
+
+
+def save(user_id: str, entries: List[Dict[str, Any]], top_k: int, computed_at: float) -> None:
+    """
+    Stores a user's list. `complete` means it holds every candidate group
+    (there were fewer than top_k), so a short list is still a full answer.
+    """
+    record = {
+        "id": user_id, "computed_at": computed_at, "model": MODEL_NAME,
+        "top_k": top_k, "complete": len(entries) < top_k, "groups": entries,
+    }
+    if not storage.update_item(COLLECTION, user_id, record):
+        storage.add_item(COLLECTION, record)
+
+
+def get_fresh(user: Dict[str, Any], limit: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    The user's precomputed recommendations, shaped like get_recommended_groups
+    output, or None if there is no fresh list that can answer `limit`.
+
+    Groups deleted, joined or filled since the job ran are skipped; if that
+    leaves fewer than `limit` while more candidates may exist beyond the
+    stored top-k, the caller must score online.
+    """
+    record = storage.get_item_by_id(COLLECTION, user.get("id"))
+    if record is None or record.get("model") != MODEL_NAME:
+        return None
+    if time.time() - record.get("computed_at", 0) > TTL_SECONDS:
+        return None
+
+    user_id, user_age = user.get("id"), user.get("age", 0)
+    recommended = []
+    for entry in record["groups"]:
+        group = storage.get_item_by_id("groups", entry["group_id"])
+        if group is None or not _is_candidate(user_id, user_age, group):
+            continue
+        breakdown = {"semantic": entry["semantic"], "location": entry["location"], "age": entry["age"]}
+        recommended.append({**group, "relevance_score": sum(breakdown.values()), "score_breakdown": breakdown})
+        if len(recommended) == limit:
+            return recommended
+
+    return recommended if record.get("complete") else None
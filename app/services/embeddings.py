@@ -0,0 +1,187 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Load the model on a background thread at startup (0 disables, e.g. in tests)
+WARMUP_ENABLED = os.environ.get("RECOMMENDER_WARMUP", "1") != "0"
+
+# Bounded LRU cache of text embeddings, optionally persisted between restarts
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 50_000))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH") or None
+
+# Load model once. sentence_transformers (and torch) are imported on first
+# use, not at import time, so workers start serving right away.
+_model = None
+_model_lock = threading.Lock()
+_model_error: Optional[str] = None
+_warmup_thread: Optional[threading.Thread] = None
+
+def get_model():
+    global _model, _model_error
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print("Loading SentenceTransformer model...")
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(MODEL_NAME)
+                except Exception as e:
+                    _model_error = f"{type(e).__name__}: {e}"
+                    raise
+                _model_error = None
+    return _model
+
+def is_ready() -> bool:
+    """True once the model is loaded; callers can degrade until then."""
+    return _model is not None
+
+def model_status() -> Dict[str, Optional[str]]:
+    if _model is not None:
+        state = "ready"
+    elif _warmup_thread is not None and _warmup_thread.is_alive():
+        state = "loading"
+    elif _model_error is not None:
+        state = "failed"
+    else:
+        state = "not_loaded"
+    return {"model": MODEL_NAME, "state": state, "error": _model_error}
+
+def start_warmup(then=None) -> Optional[threading.Thread]:
+    """
+    Loads the model on a daemon thread, then runs `then` (e.g. building
+    indexes that need embeddings). Returns the thread, or None if the model
+    is already loaded or loading.
+    """
+    global _warmup_thread
+    if _model is not None or (_warmup_thread is not None and _warmup_thread.is_alive()):
+        return None
+
+    def run():
+        try:
+            get_model()
+            if then is not None:
+                then()
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+
+    _warmup_thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    _warmup_thread.start()
+    return _warmup_thread
+
+def normalize_text(text: str) -> str:
+    """Cache key for a text. The model is uncased, so this loses nothing."""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """
+    LRU map of normalized text -> unit-length float32 embedding.
+
+    Interests and activity tags are short and repeat across nearly every
+    request ("hiking", "coffee"...), so each distinct string should only go
+    through the model once.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, path: Optional[str] = None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Writes the cache to an .npz file (atomically)."""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            keys = list(self._entries)
+            vectors = np.stack(list(self._entries.values())) if keys else np.zeros((0, 0), np.float32)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, model=np.array(MODEL_NAME), keys=np.array(keys, dtype=str), vectors=vectors)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        """Fills the cache from a file written by save(); ignores other models' files."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["model"]) != MODEL_NAME:
+                    return
+                keys, vectors = data["keys"], data["vectors"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring embedding cache {path}: {e}")
+            return
+        for key, vector in zip(keys[-self.max_size:], vectors[-self.max_size:]):
+            self.put(str(key), vector)
+
+
+cache = EmbeddingCache(path=EMBEDDING_CACHE_PATH)
+
+def embed(texts: List[str]) -> np.ndarray:
+    """
+    Returns a (len(texts), dim) float32 matrix of unit-length embeddings.
+
+    Cached texts are served from the LRU; the rest are encoded together in a
+    single batched model call.
+    """
+    keys = [normalize_text(t) for t in texts]
+    found: Dict[str, np.ndarray] = {}
+    missing: Dict[str, None] = {}  # ordered set
+    for key in keys:
+        if key in found or key in missing:
+            continue
+        vector = cache.get(key)
+        if vector is None:
+            missing[key] = None
+        else:
+            found[key] = vector
+
+    if missing:
+        to_encode = list(missing)
+        vectors = get_model().encode(to_encode, convert_to_numpy=True, normalize_embeddings=True)
+        for key, vector in zip(to_encode, np.asarray(vectors, dtype=np.float32)):
+            cache.put(key, vector)
+            found[key] = vector
+
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([found[key] for key in keys])
+
+def embed_one(text: str) -> np.ndarray:
+    return embed([text])[0]
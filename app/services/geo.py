@@ -0,0 +1,164 @@
+import math
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.data import storage
+
+EARTH_RADIUS_KM = 6371.0
+# Grid cell size; ~1.1 km north-south, so a city-scale radius touches tens of cells
+CELL_DEGREES = 0.01
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances (km) from one point to arrays of points."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def coordinates(item: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) of a user or group, or None if it has none."""
+    lat, lon = item.get("latitude"), item.get("longitude")
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+class GeoIndex:
+    """
+    Grid ("geohash bucket") index of points for radius and k-nearest queries.
+
+    Points are filed under the CELL_DEGREES x CELL_DEGREES cell they fall
+    in. A radius query only reads the cells overlapping the circle's
+    bounding box and computes exact distances for those points with NumPy;
+    k-nearest widens the radius until k points are inside it.
+    """
+
+    def __init__(self, cell_degrees: float = CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._points: Dict[str, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], Dict[str, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def add(self, key: str, lat: float, lon: float) -> None:
+        self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), {})[key] = None
+
+    def remove(self, key: str) -> None:
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> List[str]:
+        """Keys in the cells overlapping the bounding box of the circle."""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlon = min(180.0, dlat / cos_lat)
+        low_lat, low_lon = self._cell(lat - dlat, lon - dlon)
+        high_lat, high_lon = self._cell(lat + dlat, lon + dlon)
+
+        n_cells = (high_lat - low_lat + 1) * (high_lon - low_lon + 1)
+        if n_cells > len(self._cells):
+            # Cheaper to walk the occupied cells than the box
+            return [
+                key for (cell_lat, cell_lon), bucket in self._cells.items()
+                if low_lat <= cell_lat <= high_lat and low_lon <= cell_lon <= high_lon
+                for key in bucket
+            ]
+        keys: List[str] = []
+        for cell_lat in range(low_lat, high_lat + 1):
+            for cell_lon in range(low_lon, high_lon + 1):
+                bucket = self._cells.get((cell_lat, cell_lon))
+                if bucket:
+                    keys.extend(bucket)
+        return keys
+
+    def _distances(self, lat: float, lon: float, keys: List[str]) -> np.ndarray:
+        points = np.array([self._points[k] for k in keys], dtype=np.float64).reshape(-1, 2)
+        return haversine_km(lat, lon, points[:, 0], points[:, 1])
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[str, float]]:
+        """(key, distance km) of every point within `radius_km`, nearest first."""
+        keys = self._candidates(lat, lon, radius_km)
+        if not keys:
+            return []
+        distances = self._distances(lat, lon, keys)
+        inside = np.flatnonzero(distances <= radius_km)
+        order = inside[np.argsort(distances[inside], kind="stable")]
+        return [(keys[i], float(distances[i])) for i in order.tolist()]
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[str, float]]:
+        """(key, distance km) of the `k` nearest points, nearest first."""
+        if k <= 0 or not self._points:
+            return []
+        radius = self.cell_degrees * 111.0
+        while True:
+            found = self.within(lat, lon, radius)
+            # Done once k points are inside the circle, or the circle covers the globe
+            if len(found) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+                return found[:k]
+            radius *= 2
+
+
+class GroupGeoIndex:
+    """
+    GeoIndex over the groups that have coordinates, kept in step by
+    add_group()/remove_group() and rebuilt on storage.epoch() changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._grid = GeoIndex()
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self._epoch = storage.epoch()
+            self._grid = GeoIndex()
+            for group in storage.get_all("groups"):
+                self._add(group)
+
+    def ensure_fresh(self) -> None:
+        if self._epoch != storage.epoch():
+            self.rebuild()
+
+    def _add(self, group: Dict[str, Any]) -> None:
+        point = coordinates(group)
+        if point is not None:
+            self._grid.add(group["id"], *point)
+
+    def add_group(self, group: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._epoch is not None:
+                self._add(group)
+
+    def remove_group(self, group_id: str) -> None:
+        with self._lock:
+            self._grid.remove(group_id)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[str, float]]:
+        self.ensure_fresh()
+        with self._lock:
+            return self._grid.within(lat, lon, radius_km)
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[str, float]]:
+        self.ensure_fresh()
+        with self._lock:
+            return self._grid.nearest(lat, lon, k)
+
+
+index = GroupGeoIndex()
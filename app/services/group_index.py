@@ -0,0 +1,266 @@
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.data import storage
+from app.services.ann import BackgroundIVF, IVFIndex
+from app.services.embeddings import embed
+
+# Below this many activity rows recommendations score every group exactly;
+# above it, candidates come from an IVF index first.
+ANN_MIN_ROWS = int(os.environ.get("RECOMMENDER_ANN_MIN_ROWS", 5000))
+# Default number of IVF lists probed per query (recall vs latency)
+ANN_NPROBE = int(os.environ.get("RECOMMENDER_ANN_NPROBE", 8))
+
+
+class GroupEmbeddingIndex:
+    """
+    Activity-tag embeddings of all groups in one contiguous float32 matrix.
+
+    Each group with activity tags owns a slot and a consecutive run of rows
+    (one per tag). Tags never change after creation, so the index is only
+    touched when groups are created or deleted:
+
+    - add_group() queues the group; queued groups are embedded together on
+      the next query (no model call on the request that created the group).
+    - remove_group() marks the slot dead; dead rows are dropped by a
+      compaction once they make up a quarter of the matrix.
+
+    The whole index is rebuilt from storage on first use and whenever
+    storage.epoch() says the data was replaced wholesale.
+
+    Once the matrix has ANN_MIN_ROWS rows an IVFIndex over the rows is
+    trained on a background thread (and retrained whenever the row count
+    doubles or rows get renumbered; see BackgroundIVF), and search() can
+    return approximate top candidates without touching every row. Until
+    the first training finishes search() returns None, as for a small index.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._epoch = None
+        self._clear()
+        self._ivf = BackgroundIVF(self._lock, lambda: self._vectors[: self._n_rows])
+
+    def _clear(self) -> None:
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._n_rows = 0
+        self._row_slot = np.zeros(0, dtype=np.int32)
+        self._slot_start: List[int] = []
+        self._slot_alive: List[bool] = []
+        self._slot_ids: List[str] = []
+        self._slots: Dict[str, int] = {}
+        self._dead_rows = 0
+        self._pending: Dict[str, List[str]] = {}
+        self._bounds: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._alive_mask: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._slots) + len(self._pending)
+
+    def __contains__(self, group_id: str) -> bool:
+        return group_id in self._slots or group_id in self._pending
+
+    # --- Maintenance ---
+
+    def rebuild(self, groups: List[Dict[str, Any]] | None = None) -> None:
+        """Re-creates the index from `groups` (default: everything in storage)."""
+        with self._lock:
+            self._epoch = storage.epoch()
+            self._clear()
+            self._ivf.reset()
+            for group in storage.get_all("groups") if groups is None else groups:
+                self._queue(group)
+            self._flush()
+            self._ivf.get(ANN_MIN_ROWS)  # start training now rather than on the first query
+
+    def ensure_fresh(self) -> None:
+        if self._epoch != storage.epoch():
+            self.rebuild()
+
+    def add_group(self, group: Dict[str, Any]) -> None:
+        """Called after a group was created."""
+        with self._lock:
+            if self._epoch is None:
+                return  # not built yet; the first rebuild reads storage
+            self._queue(group)
+
+    def remove_group(self, group_id: str) -> None:
+        """Called after a group was deleted."""
+        with self._lock:
+            if self._pending.pop(group_id, None) is not None:
+                return
+            slot = self._slots.pop(group_id, None)
+            if slot is None:
+                return
+            self._slot_alive[slot] = False
+            self._alive_mask = None
+            self._dead_rows += self._slot_rows(slot)
+            if self._dead_rows * 4 > self._n_rows:
+                self._compact()
+
+    def _queue(self, group: Dict[str, Any]) -> None:
+        tags = [a for a in group.get("activity", []) if a]
+        group_id = group.get("id")
+        if tags and group_id not in self._slots:
+            self._pending[group_id] = tags
+
+    def _slot_rows(self, slot: int) -> int:
+        stop = self._slot_start[slot + 1] if slot + 1 < len(self._slot_start) else self._n_rows
+        return stop - self._slot_start[slot]
+
+    def _flush(self) -> None:
+        """Embeds all queued groups in one batch and appends their rows."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        tags = [tag for group_tags in pending.values() for tag in group_tags]
+        vectors = embed(tags)
+        self._reserve(self._n_rows + len(tags), vectors.shape[1])
+
+        first = row = self._n_rows
+        for group_id, group_tags in pending.items():
+            slot = len(self._slot_start)
+            self._slots[group_id] = slot
+            self._slot_ids.append(group_id)
+            self._slot_start.append(row)
+            self._slot_alive.append(True)
+            self._row_slot[row : row + len(group_tags)] = slot
+            row += len(group_tags)
+        self._vectors[first:row] = vectors
+        self._n_rows = row
+        self._bounds = self._alive_mask = None
+
+        self._ivf.add(first, vectors)
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Grows the backing arrays geometrically so appends stay amortised O(1)."""
+        if self._vectors.shape[1] != dim:
+            self._vectors = np.zeros((0, dim), dtype=np.float32)
+        if rows <= len(self._vectors):
+            return
+        capacity = max(rows, 2 * len(self._vectors), 64)
+        vectors = np.zeros((capacity, dim), dtype=np.float32)
+        vectors[: self._n_rows] = self._vectors[: self._n_rows]
+        row_slot = np.zeros(capacity, dtype=np.int32)
+        row_slot[: self._n_rows] = self._row_slot[: self._n_rows]
+        self._vectors, self._row_slot = vectors, row_slot
+
+    def _compact(self) -> None:
+        """Drops dead rows and renumbers slots (new arrays, so readers holding
+        the old ones are unaffected)."""
+        keep = np.zeros(self._n_rows, dtype=bool)
+        new_slots: Dict[str, int] = {}
+        new_start: List[int] = []
+        row = 0
+        for slot, start in enumerate(self._slot_start):
+            if not self._slot_alive[slot]:
+                continue
+            n = self._slot_rows(slot)
+            keep[start : start + n] = True
+            new_slots[self._slot_ids[slot]] = len(new_start)
+            new_start.append(row)
+            row += n
+
+        self._slot_ids = [group_id for group_id, alive in zip(self._slot_ids, self._slot_alive) if alive]
+        self._vectors = self._vectors[: self._n_rows][keep].copy()
+        self._row_slot = np.repeat(
+            np.arange(len(new_start), dtype=np.int32),
+            np.diff(new_start + [row]).astype(np.int64),
+        )
+        self._n_rows = row
+        self._slots = new_slots
+        self._slot_start = new_start
+        self._slot_alive = [True] * len(new_start)
+        self._dead_rows = 0
+        self._bounds = self._alive_mask = None
+        self._ivf.reset()  # row numbers changed
+
+    # --- Queries ---
+
+    def _slot_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(start row, stop row) of every slot, cached until the next mutation."""
+        if self._bounds is None:
+            starts = np.asarray(self._slot_start, dtype=np.int64)
+            self._bounds = (starts, np.append(starts[1:], self._n_rows))
+        return self._bounds
+
+    def _alive(self) -> np.ndarray:
+        if self._alive_mask is None:
+            self._alive_mask = np.asarray(self._slot_alive, dtype=bool)
+        return self._alive_mask
+
+    def semantic_scores(
+        self, interest_vectors: np.ndarray, group_ids: List[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Semantic scores (0-100) for `group_ids`.
+        Returns (scores, found) where found[i] is False for groups not in the
+        index (unknown id or no activity tags); their score is 0.
+        """
+        with self._lock:
+            self.ensure_fresh()
+            self._flush()
+            idx = np.fromiter((self._slots.get(g, -1) for g in group_ids), dtype=np.int64, count=len(group_ids))
+            found = idx >= 0
+            selected = idx[found]
+            starts, stops = self._slot_bounds()
+            if len(selected) * 2 >= len(self._slots):
+                # Most groups requested: score the whole matrix in place
+                vectors = self._vectors[: self._n_rows]
+                segments, pick = starts, selected
+            else:
+                # A few candidates: gather just their rows
+                counts = stops[selected] - starts[selected]
+                segments = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+                rows = np.repeat(starts[selected] - segments, counts) + np.arange(counts.sum())
+                vectors = self._vectors[rows]
+                pick = np.arange(len(selected))
+
+        # The matmul runs outside the lock: appends never touch rows we hold,
+        # compactions and growth swap in new arrays.
+        scores = np.zeros(len(group_ids), dtype=np.int64)
+        if len(selected) and len(interest_vectors):
+            best_per_row = (interest_vectors @ vectors.T).max(axis=0)
+            per_segment = np.maximum.reduceat(best_per_row, segments)
+            scores[found] = (np.maximum(per_segment[pick], 0) * 100).astype(np.int64)
+        return scores, found
+
+    def _ann(self) -> Optional[IVFIndex]:
+        """The IVF index over the rows (see BackgroundIVF); None while the
+        matrix is small enough for exact scoring or no training finished yet."""
+        return self._ivf.get(ANN_MIN_ROWS)
+
+    def search(
+        self, interest_vectors: np.ndarray, k: int, nprobe: Optional[int] = None
+    ) -> Optional[List[str]]:
+        """
+        Approximate top-k group ids by semantic similarity.
+
+        Returns None while the index is below ANN_MIN_ROWS; callers then
+        score every group exactly.
+        """
+        with self._lock:
+            self.ensure_fresh()
+            self._flush()
+            ivf = self._ann()
+            if ivf is None:
+                return None
+            rows = ivf.search(interest_vectors, nprobe or ANN_NPROBE)
+            if not len(rows):
+                return []
+            best = (interest_vectors @ self._vectors[rows].T).max(axis=0)
+            slots = self._row_slot[rows]
+            alive = self._alive()[slots]
+            best, slots = best[alive], slots[alive]
+
+            # Highest-scoring row per slot: sort descending, keep first occurrence
+            order = np.argsort(-best, kind="stable")
+            unique_slots, first = np.unique(slots[order], return_index=True)
+            top = unique_slots[np.argsort(first)][:k]
+            return [self._slot_ids[slot] for slot in top.tolist()]
+
+
+index = GroupEmbeddingIndex()
@@ -0,0 +1,258 @@
+import heapq
+import threading
+from collections import OrderedDict
+from itertools import chain, islice
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.data import storage
+from app.services.recommendation import NO_AGE_LIMIT, group_age_bounds
+
+
+# A query walks its driving posting list in slices: small first (cheap
+# first pages), then larger so selective intersections run mostly in C
+_FIRST_CHUNK = 64
+_MAX_CHUNK = 4096
+# Deleted groups remembered so cursors pointing at them still resolve
+_REMOVED_CURSORS = 10_000
+
+
+def _key(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+class _Postings:
+    """Sorted sequence numbers of the groups under one key, plus a set for lookups."""
+
+    __slots__ = ("seqs", "members")
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.members: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+    def add(self, seq: int) -> None:
+        # Sequence numbers only grow, so appending keeps the list sorted
+        self.seqs.append(seq)
+        self.members.add(seq)
+
+    def remove(self, seq: int) -> None:
+        if seq in self.members:
+            self.members.discard(seq)
+            del self.seqs[bisect_left(self.seqs, seq)]
+
+    def chunks_after(self, cursor: int) -> Iterator[List[int]]:
+        """Entries after `cursor` as sorted slices of growing size."""
+        seqs, start, size = self.seqs, bisect_right(self.seqs, cursor), _FIRST_CHUNK
+        while start < len(seqs):
+            yield seqs[start : start + size]
+            start += size
+            size = min(size * 2, _MAX_CHUNK)
+
+
+def _merged_chunks(postings: List[_Postings], cursor: int) -> Iterator[List[int]]:
+    """Union of several posting lists after `cursor`, as sorted chunks."""
+    merged = heapq.merge(*(chain.from_iterable(p.chunks_after(cursor)) for p in postings))
+    size = _FIRST_CHUNK
+    while True:
+        chunk = list(islice(merged, size))
+        if not chunk:
+            return
+        yield chunk
+        size = min(size * 2, _MAX_CHUNK)
+
+
+class GroupSearchIndex:
+    """
+    Inverted indexes over groups for /groups/search.
+
+    Every group gets a sequence number in storage order; posting lists hold
+    sorted sequence numbers per lowercase activity tag, per lowercase
+    location and per distinct (min, max) age range. A query walks the
+    shortest matching list from the cursor, slice by slice, intersecting
+    each slice with the other lists' sets, and stops once the page is full;
+    it never scans all groups.
+
+    Kept in step by add_group()/remove_group() and rebuilt from storage
+    whenever storage.epoch() changes (see GroupEmbeddingIndex).
+
+    Sequence numbers are renumbered on rebuild, so cursors are group ids
+    instead: the id of the last group of a page. A deleted group's id maps
+    to the live group before it, which keeps its position across rebuilds.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._epoch = None
+        # Deleted group id -> id of the group before it (None: it was first)
+        self._removed: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._clear()
+
+    def _clear(self) -> None:
+        self._next_seq = 0
+        self._seq_of: Dict[str, int] = {}
+        self._id_of: Dict[int, str] = {}
+        self._fields: Dict[int, Tuple[List[str], str, Tuple[int, Optional[int]]]] = {}
+        # Age bounds by sequence number, for vectorised checks
+        self._age_min = np.zeros(0, dtype=np.int64)
+        self._age_max = np.zeros(0, dtype=np.int64)
+        self._all = _Postings()
+        self._by_activity: Dict[str, _Postings] = {}
+        self._by_location: Dict[str, _Postings] = {}
+        self._by_age_range: Dict[Tuple[int, Optional[int]], _Postings] = {}
+
+    def __len__(self) -> int:
+        return len(self._seq_of)
+
+    # --- Maintenance ---
+
+    def rebuild(self, groups: List[Dict[str, Any]] | None = None) -> None:
+        """Re-creates the index from `groups` (default: everything in storage)."""
+        with self._lock:
+            self._epoch = storage.epoch()
+            self._clear()
+            for group in storage.get_all("groups") if groups is None else groups:
+                self._add(group)
+
+    def ensure_fresh(self) -> None:
+        if self._epoch != storage.epoch():
+            self.rebuild()
+
+    def add_group(self, group: Dict[str, Any]) -> None:
+        """Called after a group was created."""
+        with self._lock:
+            if self._epoch is not None:
+                self._add(group)
+
+    def remove_group(self, group_id: str) -> None:
+        """Called after a group was deleted."""
+        with self._lock:
+            seq = self._seq_of.pop(group_id, None)
+            if seq is None:
+                return
+            del self._id_of[seq]
+            activities, location, age_range = self._fields.pop(seq)
+            self._all.remove(seq)
+            position = bisect_left(self._all.seqs, seq)
+            self._removed[group_id] = self._id_of[self._all.seqs[position - 1]] if position else None
+            while len(self._removed) > _REMOVED_CURSORS:
+                self._removed.popitem(last=False)
+            for tag in activities:
+                self._discard(self._by_activity, tag, seq)
+            self._discard(self._by_location, location, seq)
+            self._discard(self._by_age_range, age_range, seq)
+
+    def _add(self, group: Dict[str, Any]) -> None:
+        group_id = group.get("id")
+        if group_id in self._seq_of:
+            return
+        seq = self._next_seq
+        self._next_seq += 1
+        activities = sorted({_key(a) for a in group.get("activity", []) if _key(a)})
+        location = _key(group.get("location", ""))
+        age_range = group_age_bounds(group)
+
+        self._seq_of[group_id] = seq
+        self._id_of[seq] = group_id
+        self._fields[seq] = (activities, location, age_range)
+        self._all.add(seq)
+        for tag in activities:
+            self._by_activity.setdefault(tag, _Postings()).add(seq)
+        self._by_location.setdefault(location, _Postings()).add(seq)
+        self._by_age_range.setdefault(age_range, _Postings()).add(seq)
+
+        if seq >= len(self._age_min):
+            capacity = max(64, 2 * len(self._age_min))
+            self._age_min = np.resize(self._age_min, capacity)
+            self._age_max = np.resize(self._age_max, capacity)
+        self._age_min[seq] = age_range[0]
+        self._age_max[seq] = NO_AGE_LIMIT if age_range[1] is None else age_range[1]
+
+    @staticmethod
+    def _discard(postings: Dict[Any, _Postings], key: Any, seq: int) -> None:
+        entry = postings.get(key)
+        if entry is not None:
+            entry.remove(seq)
+            if not len(entry):
+                del postings[key]
+
+    # --- Queries ---
+
+    def _position(self, cursor: str) -> int:
+        """Sequence number a page after `cursor` starts after. KeyError if unknown."""
+        group_id: Optional[str] = cursor
+        seen = set()
+        while group_id is not None and group_id not in self._seq_of:
+            if group_id in seen or group_id not in self._removed:
+                raise KeyError(cursor)
+            seen.add(group_id)
+            group_id = self._removed[group_id]
+        return -1 if group_id is None else self._seq_of[group_id]
+
+    def search(
+        self,
+        activities: Optional[List[str]] = None,
+        location: Optional[str] = None,
+        age: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> Tuple[List[str], Optional[str]]:
+        """
+        Ids of groups having every tag in `activities`, at `location`
+        (case-insensitive) and open to `age`, in storage order, starting
+        after `cursor`. Returns (ids, next cursor or None on the last page).
+        Raises KeyError for an unknown cursor.
+        """
+        with self._lock:
+            self.ensure_fresh()
+            after = -1 if cursor is None else self._position(cursor)
+
+            # Posting lists to intersect, smallest first; age ranges form a union
+            lists: List[_Postings] = []
+            keyed = [(self._by_activity, _key(tag)) for tag in activities or []]
+            if location:
+                keyed.append((self._by_location, _key(location)))
+            for postings, key in keyed:
+                entry = postings.get(key)
+                if entry is None:
+                    return [], None
+                lists.append(entry)
+            lists.sort(key=len)
+
+            check_age = False
+            if age is not None:
+                ranges = [
+                    p for (low, high), p in self._by_age_range.items() if low <= age and (high is None or age <= high)
+                ]
+                if not ranges:
+                    return [], None
+                if not lists or sum(len(p) for p in ranges) < len(lists[0]):
+                    chunks = _merged_chunks(ranges, after)
+                else:
+                    check_age = True
+                    chunks = lists.pop(0).chunks_after(after)
+            else:
+                chunks = (lists.pop(0) if lists else self._all).chunks_after(after)
+
+            page: List[int] = []
+            for chunk in chunks:
+                hits = chunk
+                for entry in lists:
+                    hits = entry.members.intersection(hits)
+                if lists:
+                    hits = sorted(hits)
+                if check_age and hits:
+                    seqs = np.asarray(hits, dtype=np.int64)
+                    hits = seqs[(self._age_min[seqs] <= age) & (age <= self._age_max[seqs])].tolist()
+                for seq in hits:
+                    if len(page) == limit:
+                        return [self._id_of[s] for s in page], self._id_of[page[-1]]
+                    page.append(seq)
+            return [self._id_of[s] for s in page], None
+
+
+index = GroupSearchIndex()
@@ -0,0 +1,106 @@
+"""
+Keeps precomputed recommendations (see batch_recommendations) in step with
+writes, touching only the cells a write can affect.
+
+A stored list for user U holds scored (U, G) cells. Each cell depends on:
+
+- U's interests, location, coordinates and age -> re-score U (on_user_updated)
+- G existing                        -> offer G to everyone / drop G (on_group_created, on_group_deleted)
+- U not being a member of G         -> drop (U, G) on join, offer G to U on leave
+- G not being full                  -> checked when the list is served; a
+                                       full group that reopens is offered
+                                       to everyone again
+
+Group activity, location and age range never change after creation.
+Users without a stored list are skipped: they are scored online anyway.
+"""
+import time
+from typing import Dict, Any, Iterable, List, Optional
+
+from app.data import storage
+from app.services import batch_recommendations
+from app.services.batch_recommendations import COLLECTION
+
+
+def _total(entry: Dict[str, Any]) -> int:
+    return entry["semantic"] + entry["location"] + entry["age"]
+
+
+def _insert(record: Dict[str, Any], entry: Dict[str, Any]) -> bool:
+    """Puts `entry` at its rank in the record if it makes the top-k. Returns True if inserted."""
+    entries = record["groups"]
+    if any(e["group_id"] == entry["group_id"] for e in entries):
+        return False
+    total = _total(entry)
+    # After equal scores, like the stable sort of a full recompute
+    position = next((i for i, e in enumerate(entries) if _total(e) < total), len(entries))
+    if position >= record["top_k"] or (position == len(entries) and not record.get("complete")):
+        return False  # there may be unstored candidates scoring higher
+    entries.insert(position, entry)
+    if len(entries) > record["top_k"]:
+        del entries[record["top_k"]:]
+        record["complete"] = False
+    return True
+
+
+def _drop(record: Dict[str, Any], group_id: str) -> None:
+    record["groups"] = [e for e in record["groups"] if e["group_id"] != group_id]
+
+
+def offer_group(group: Dict[str, Any], user_ids: Optional[Iterable[str]] = None) -> int:
+    """
+    Scores `group` for users with a stored list (all of them, or just
+    `user_ids`) and inserts it where it ranks in the top-k. The cells are
+    scored in one batch. Returns the number of lists changed.
+    """
+    if user_ids is None:
+        user_ids = [record["id"] for record in storage.get_all(COLLECTION)]
+    else:
+        user_ids = [uid for uid in user_ids if storage.get_item_by_id(COLLECTION, uid) is not None]
+    users = [u for u in (storage.get_item_by_id("users", uid) for uid in user_ids) if u]
+    if not users:
+        return 0
+
+    changed = 0
+    for user_id, entries in batch_recommendations.compute(users, [group], top_k=1, workers=1):
+        if not entries:
+            continue  # member, full or outside the age range
+        with storage.transaction(COLLECTION, user_id) as record:
+            if record is not None and _insert(record, entries[0]):
+                changed += 1
+    return changed
+
+
+def on_group_created(group: Dict[str, Any]) -> None:
+    offer_group(group)
+
+
+def on_group_deleted(group_id: str) -> None:
+    for record in storage.get_all(COLLECTION):
+        if any(e["group_id"] == group_id for e in record["groups"]):
+            with storage.transaction(COLLECTION, record["id"]) as current:
+                if current is not None:
+                    _drop(current, group_id)
+
+
+def on_member_joined(group_id: str, user_id: str) -> None:
+    with storage.transaction(COLLECTION, user_id) as record:
+        if record is not None:
+            _drop(record, group_id)
+
+
+def on_member_left(group: Dict[str, Any], user_id: str, reopened: bool = False) -> None:
+    """`reopened`: the group was full before this user left."""
+    offer_group(group, None if reopened else [user_id])
+
+
+def on_user_updated(user: Dict[str, Any], changed: Iterable[str]) -> None:
+    """Re-scores the user's list if a field that feeds scoring changed."""
+    if not {"interests", "location", "latitude", "longitude", "age"} & set(changed):
+        return
+    record = storage.get_item_by_id(COLLECTION, user["id"])
+    if record is None:
+        return
+    groups: List[Dict[str, Any]] = storage.get_all("groups")
+    for user_id, entries in batch_recommendations.compute([user], groups, record["top_k"], workers=1):
+        batch_recommendations.save(user_id, entries, record["top_k"], time.time())
@@ -0,0 +1,146 @@
+"""
+The like graph: who liked whom.
+
+Each like is an edge item in the "user_likes" collection, indexed on both
+ends, so "who liked U" and "whom did U like" are index lookups that page
+without scanning. The edge id is the JSON of [from, to] (collision-free
+whatever the user ids contain), which makes a like a set member. Per-user
+totals live in "like_counts" (id == user id). An edge and both counters
+are written in one storage transaction, so counting is a single read and
+the counters can't drift from the edges, even across a crash.
+
+User documents used to carry the likes as a "liked_by" list. Databases
+without the migration marker (older ones, hand-edited seed data) have
+those lists moved into the graph once, on first use.
+"""
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from app.data import storage
+
+EDGES = "user_likes"
+COUNTS = "like_counts"
+# Marker item, present once "liked_by" lists were moved into the graph
+MIGRATIONS = "migrations"
+MIGRATION_ID = "like_graph"
+
+_checked_epoch = None
+_migrate_lock = threading.Lock()
+
+
+def _edge_id(from_id: str, to_id: str) -> str:
+    return json.dumps([from_id, to_id])
+
+
+def _new_counts(user_id: str) -> Dict[str, Any]:
+    return {"id": user_id, "received": 0, "given": 0}
+
+
+def _write(from_id: str, to_id: str, liked: bool) -> bool:
+    """Adds (liked) or removes the edge with both counters. Returns False if nothing changed."""
+    if from_id == to_id:
+        raise ValueError("Users can't like themselves")
+    edge_key, to_key, from_key = (EDGES, _edge_id(from_id, to_id)), (COUNTS, to_id), (COUNTS, from_id)
+    with storage.transaction_many([edge_key, to_key, from_key]) as items:
+        if (items[edge_key] is not None) == liked:
+            return False
+        delta = 1 if liked else -1
+        items[edge_key] = (
+            {"id": edge_key[1], "from": from_id, "to": to_id, "created_at": datetime.utcnow().isoformat()}
+            if liked else None
+        )
+        received = items[to_key] or _new_counts(to_id)
+        given = items[from_key] or _new_counts(from_id)
+        received["received"] = max(0, received["received"] + delta)
+        given["given"] = max(0, given["given"] + delta)
+        items[to_key], items[from_key] = received, given
+    return True
+
+
+def _migrate() -> None:
+    """Moves "liked_by" lists left on user documents into the graph, once per database."""
+    global _checked_epoch
+    current = storage.epoch()
+    if _checked_epoch == current:
+        return
+    with _migrate_lock:
+        if _checked_epoch == current:
+            return
+        if storage.get_item_by_id(MIGRATIONS, MIGRATION_ID) is None:
+            for user in storage.get_all("users"):
+                if "liked_by" not in user:
+                    continue
+                for liker in user["liked_by"]:
+                    if liker != user["id"]:
+                        _write(liker, user["id"], True)
+                try:
+                    with storage.transaction("users", user["id"]) as stored:
+                        if stored is not None:
+                            stored.pop("liked_by", None)
+                except storage.ItemDeletedError:
+                    pass  # deleted meanwhile
+            try:
+                storage.add_item(MIGRATIONS, {"id": MIGRATION_ID, "done_at": datetime.utcnow().isoformat()})
+            except storage.DuplicateKeyError:
+                pass  # another process finished first
+        _checked_epoch = current
+
+
+def like(from_id: str, to_id: str) -> bool:
+    """Adds the like. Returns False if it already existed."""
+    _migrate()
+    return _write(from_id, to_id, True)
+
+
+def unlike(from_id: str, to_id: str) -> bool:
+    """Removes the like. Returns False if there was none."""
+    _migrate()
+    if from_id == to_id:
+        return False
+    return _write(from_id, to_id, False)
+
+
+def has_liked(from_id: str, to_id: str) -> bool:
+    _migrate()
+    return storage.get_item_by_id(EDGES, _edge_id(from_id, to_id)) is not None
+
+
+def counts(user_id: str) -> Dict[str, int]:
+    """{"received": likes of the user, "given": likes by the user}."""
+    _migrate()
+    stored = storage.get_item_by_id(COUNTS, user_id) or {}
+    return {"received": stored.get("received", 0), "given": stored.get("given", 0)}
+
+
+def liked_by(user_id: str, skip: int = 0, limit: Optional[int] = None) -> List[str]:
+    """Ids of users who liked `user_id`, oldest like first."""
+    _migrate()
+    return [edge["from"] for edge in storage.query(EDGES, {"to": user_id}, skip=skip, limit=limit)]
+
+
+def likes_given(user_id: str, skip: int = 0, limit: Optional[int] = None) -> List[str]:
+    """Ids of users `user_id` liked, oldest like first."""
+    _migrate()
+    return [edge["to"] for edge in storage.query(EDGES, {"from": user_id}, skip=skip, limit=limit)]
+
+
+def mutuals(user_id: str) -> List[str]:
+    """
+    Ids of users who liked `user_id` and were liked back. Walks the shorter
+    of the two adjacency lists and checks the reverse edge of each entry.
+    """
+    _migrate()
+    totals = counts(user_id)
+    if totals["given"] <= totals["received"]:
+        return [other for other in likes_given(user_id) if has_liked(other, user_id)]
+    return [other for other in liked_by(user_id) if has_liked(user_id, other)]
+
+
+def with_likes(user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The user as served by the API: with the number of likes received and,
+    for clients of the old format, the deprecated "liked_by" list.
+    """
+    return {**user, "likes": counts(user["id"])["received"], "liked_by": liked_by(user["id"])}
@@ -0,0 +1,243 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+from app.data import storage
+from app.data.message_archive import message_key
+from app.services import retention
+
+# Messages a new WebSocket connection gets as history
+HISTORY_SIZE = 50
+# Group commit: a batch is written once it has CHAT_WRITE_BATCH messages or
+# CHAT_WRITE_LINGER_MS have passed since its first one. With 0 a batch is
+# whatever queued up during the previous write; a few ms makes batches
+# bigger on disks where fsync is slow, at that much extra latency.
+WRITE_BATCH = int(os.environ.get("CHAT_WRITE_BATCH", 256))
+WRITE_LINGER_SECONDS = float(os.environ.get("CHAT_WRITE_LINGER_MS", 0)) / 1000
+
+
+def new_message(group_id: str, user_id: Optional[str], user_name: Optional[str], text: Optional[str]) -> Dict[str, Any]:
+    """A chat message as stored in the "messages" collection."""
+    return {
+        "id": f"msg-{uuid.uuid4().hex}",
+        "group_id": group_id,
+        "user_id": user_id,
+        "user_name": user_name,
+        "message": text,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+def _cursor_key(group_id: str, message_id: Optional[str]) -> Optional[Tuple[str, str]]:
+    if message_id is None:
+        return None
+    key = storage.ordered_key("messages", group_id, message_id)
+    if key is None:
+        key = retention.get_archive().locate(group_id, message_id)
+    if key is None:
+        raise KeyError(message_id)
+    return key
+
+
+def history_page(
+    group_id: str, after: Optional[str] = None, before: Optional[str] = None, limit: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    A page of a group's messages, oldest first, with the same cursors as
+    storage.ordered_page (message ids, either tier). Recent messages come
+    from the main store; the page continues into the archive when it
+    reaches past the oldest message still there. Raises KeyError for an
+    unknown cursor.
+    """
+    after_key, before_key = _cursor_key(group_id, after), _cursor_key(group_id, before)
+    archive = retention.get_archive()
+    if after_key is not None:
+        page = archive.page(group_id, after_key, before_key, limit)
+        if len(page) < limit:
+            start = message_key(page[-1]) if page else after_key
+            page += storage.ordered_page_by_key("messages", group_id, start, before_key, limit - len(page))
+    else:
+        page = storage.ordered_page_by_key("messages", group_id, None, before_key, limit)
+        if len(page) < limit:
+            end = message_key(page[0]) if page else before_key
+            page = archive.page(group_id, None, end, limit - len(page)) + page
+    return page
+
+
+class HistoryCache:
+    """
+    The last HISTORY_SIZE messages of each group that had WebSocket
+    connections, in a bounded deque. A group is loaded from the storage
+    message index on first use and then kept current by append(), so sending
+    history to a new connection doesn't touch storage. Dropped when
+    storage.epoch() changes.
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._groups: Dict[str, Deque[Dict[str, Any]]] = {}
+
+    def _check_epoch(self) -> None:
+        current = storage.epoch()
+        if self._epoch != current:
+            self._groups.clear()
+            self._epoch = current
+
+    def _group(self, group_id: str) -> Deque[Dict[str, Any]]:
+        self._check_epoch()
+        cached = self._groups.get(group_id)
+        if cached is None:
+            cached = deque(storage.ordered_page("messages", group_id, limit=self.size), maxlen=self.size)
+            self._groups[group_id] = cached
+        return cached
+
+    def recent(self, group_id: str) -> List[Dict[str, Any]]:
+        """Up to HISTORY_SIZE newest messages, oldest first."""
+        with self._lock:
+            return list(self._group(group_id))
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """Adds a new message to its group, if the group is cached."""
+        with self._lock:
+            self._check_epoch()
+            cached = self._groups.get(message["group_id"])
+            if cached is not None and not any(m["id"] == message["id"] for m in cached):
+                cached.append(message)
+
+
+class WriterStats:
+    """Batch sizes, flush times and acknowledgement latencies of a MessageWriter."""
+
+    def __init__(self):
+        self.batches = 0
+        self.messages = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.ack_seconds = 0.0
+        self.max_ack_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "failed": self.failed,
+            "avg_batch": self.messages / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            # One storage write per batch
+            "avg_flush_ms": 1000 * self.flush_seconds / self.batches if self.batches else 0.0,
+            "max_flush_ms": 1000 * self.max_flush_seconds,
+            # submit() until the message is durable
+            "avg_ack_ms": 1000 * self.ack_seconds / self.messages if self.messages else 0.0,
+            "max_ack_ms": 1000 * self.max_ack_seconds,
+        }
+
+
+class MessageWriter:
+    """
+    Group commit for chat messages. submit() queues a message and returns a
+    Future; a background thread collects messages until it has `batch_size`
+    of them or `linger` seconds have passed since the first one, stores the
+    batch with one storage.add_items() call (one journal append and fsync,
+    or one SQLite commit) and then resolves every Future of the batch, so a
+    caller is acknowledged once its message is durable.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH, linger: float = WRITE_LINGER_SECONDS):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.stats = WriterStats()
+        self._queue: "queue.Queue[Optional[Tuple[Dict[str, Any], Future, float]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, message: Dict[str, Any]) -> Future:
+        """Queues a message; the Future resolves (or fails) once it is stored."""
+        future: Future = Future()
+        self._ensure_running()
+        self._queue.put((message, future, time.perf_counter()))
+        return future
+
+    def _ensure_running(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            self._write([entry for entry in batch if entry is not None])
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: List[Tuple[Dict[str, Any], Future, float]]) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            storage.add_items("messages", [message for message, _, _ in batch])
+            errors: List[Optional[Exception]] = [None] * len(batch)
+        except Exception:
+            # Find the culprit(s): store the rest one by one
+            errors = []
+            for message, _, _ in batch:
+                try:
+                    storage.add_item("messages", message)
+                    errors.append(None)
+                except Exception as e:
+                    print(f"Failed to store message {message.get('id')}: {e}")
+                    errors.append(e)
+        done = time.perf_counter()
+
+        stats = self.stats
+        stats.batches += 1
+        stats.messages += len(batch)
+        stats.max_batch = max(stats.max_batch, len(batch))
+        stats.flush_seconds += done - started
+        stats.max_flush_seconds = max(stats.max_flush_seconds, done - started)
+        for (_, future, submitted), error in zip(batch, errors):
+            stats.ack_seconds += done - submitted
+            stats.max_ack_seconds = max(stats.max_ack_seconds, done - submitted)
+            if error is None:
+                future.set_result(None)
+            else:
+                stats.failed += 1
+                future.set_exception(error)
+
+    def flush(self) -> None:
+        """Blocks until everything submitted so far is written."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Writes what is queued and stops the thread (submit() restarts it)."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(None)
+        thread.join()
+
+
+history = HistoryCache()
+writer = MessageWriter()
@@ -0,0 +1,400 @@
+"""
+Topic pub/sub for chat fan-out across worker processes.
+
+Backends, picked by CHAT_PUBSUB:
+
+- "memory" (default): callbacks in this process only; enough for one worker.
+- "unix:<path>": a local broker process listening on a Unix socket relays
+  every publish to the processes subscribed to the topic (including the
+  publisher), so uvicorn workers see each other's messages. Start it next to
+  the workers:
+
+      python -m app.services.pubsub --socket /tmp/communitycompass-chat.sock
+
+Wire format, both directions: a header line "<VERB> <topic> <length>\\n"
+followed by <length> payload bytes. Clients send SUB/UNSUB (length 0) and
+PUB; the broker sends MSG.
+
+Socket writes never happen on the thread that publishes: every connection
+(client side and broker side) has a bounded outbox drained by its own
+writer thread. A peer that lets its outbox fill up is disconnected rather
+than allowed to stall everyone else.
+"""
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+CHAT_PUBSUB = os.environ.get("CHAT_PUBSUB", "memory")
+# Seconds between reconnect attempts to the broker
+RECONNECT_SECONDS = 1.0
+# Frames queued per connection before its peer counts as too slow
+OUTBOX_FRAMES = int(os.environ.get("CHAT_PUBSUB_OUTBOX_FRAMES", 1024))
+
+# callback(topic, payload)
+Subscriber = Callable[[str, bytes], None]
+
+
+class InProcessPubSub:
+    """Calls the topic's subscribers synchronously, in the publisher's thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+
+    def subscribe(self, topic: str, callback: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(callback)
+
+    def unsubscribe(self, topic: str, callback: Subscriber) -> None:
+        with self._lock:
+            callbacks = self._subscribers.get(topic, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(topic, None)
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        self._dispatch(topic, payload)
+
+    def _dispatch(self, topic: str, payload: bytes) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, ()))
+        for callback in callbacks:
+            try:
+                callback(topic, payload)
+            except Exception as e:
+                print(f"Subscriber of {topic} failed: {type(e).__name__}: {e}")
+
+    def close(self) -> None:
+        pass
+
+
+def _frame(verb: str, topic: str, payload: bytes = b"") -> bytes:
+    if not topic or any(c.isspace() for c in topic):
+        raise ValueError(f"Invalid topic {topic!r}")
+    return f"{verb} {topic} {len(payload)}\n".encode() + payload
+
+
+def _read_frame(stream) -> Optional[Tuple[str, str, bytes]]:
+    """(verb, topic, payload) from a binary stream, or None at EOF."""
+    header = stream.readline()
+    if not header:
+        return None
+    verb, topic, length = header.decode().split()
+    payload = stream.read(int(length)) if int(length) else b""
+    if len(payload) != int(length):
+        return None
+    return verb, topic, payload
+
+
+class _Outbox:
+    """
+    Bounded frame queue with a writer thread. put() never blocks: it returns
+    False once the queue is full or the writer failed, and the owner gives
+    up on the connection (on_error is called from the writer on failure).
+    """
+
+    def __init__(self, write: Callable[[bytes], None], on_error: Callable[[], None], name: str):
+        self._write = write
+        self._on_error = on_error
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(OUTBOX_FRAMES)
+        self._closed = False
+        threading.Thread(target=self._run, name=name, daemon=True).start()
+
+    def put(self, data: bytes) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(data)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self) -> None:
+        """Stops the writer; frames still queued are dropped."""
+        self._closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass  # the writer sees _closed after its current frame
+
+    def _run(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None or self._closed:
+                return
+            try:
+                self._write(data)
+            except OSError:
+                self._closed = True
+                self._on_error()
+                return
+
+
+def _shutdown(sock: socket.socket) -> None:
+    """Wakes up any thread blocked on the socket; reads see EOF."""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class BrokerPubSub(InProcessPubSub):
+    """
+    Client of the Unix-socket broker. Subscribes to a topic at the broker
+    while it has local subscribers; a reader thread dispatches MSG frames to
+    them. Frames to the broker go through an outbox, so publish() doesn't
+    block on the socket. If the broker goes away or stops keeping up,
+    publishes are delivered locally only and the connection (with its
+    subscriptions) is retried in the background.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._sock: Optional[socket.socket] = None
+        self._outbox: Optional[_Outbox] = None
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._connect()
+        self._reader = threading.Thread(target=self._read_loop, name="pubsub-reader", daemon=True)
+        self._reader.start()
+
+    def _connect(self) -> bool:
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+        except OSError as e:
+            print(f"Chat broker at {self.path} unavailable ({e}); delivering locally")
+            return False
+        outbox = _Outbox(sock.sendall, lambda: self._lost(sock), "pubsub-writer")
+        with self._lock:
+            topics = list(self._subscribers)
+        with self._send_lock:
+            self._sock, self._outbox = sock, outbox
+            if topics:
+                outbox.put(b"".join(_frame("SUB", topic) for topic in topics))
+        return True
+
+    def _send(self, data: bytes) -> bool:
+        with self._send_lock:
+            if self._outbox is None:
+                return False
+            if self._outbox.put(data):
+                return True
+            print(f"Chat broker at {self.path} is not keeping up; reconnecting")
+            self._drop_connection()
+            return False
+
+    def _lost(self, sock: socket.socket) -> None:
+        with self._send_lock:
+            if self._sock is sock:
+                self._drop_connection()
+
+    def _drop_connection(self) -> None:
+        if self._sock is not None:
+            self._outbox.close()
+            _shutdown(self._sock)
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = self._outbox = None
+
+    def subscribe(self, topic: str, callback: Subscriber) -> None:
+        with self._lock:
+            first = topic not in self._subscribers
+            self._subscribers.setdefault(topic, []).append(callback)
+        if first:
+            self._send(_frame("SUB", topic))
+
+    def unsubscribe(self, topic: str, callback: Subscriber) -> None:
+        super().unsubscribe(topic, callback)
+        with self._lock:
+            last = topic not in self._subscribers
+        if last:
+            self._send(_frame("UNSUB", topic))
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        if not self._send(_frame("PUB", topic, payload)):
+            self._dispatch(topic, payload)
+
+    def _read_loop(self) -> None:
+        while not self._closed:
+            sock = self._sock
+            if sock is None:
+                time.sleep(RECONNECT_SECONDS)
+                self._connect()
+                continue
+            stream = sock.makefile("rb")
+            try:
+                while True:
+                    frame = _read_frame(stream)
+                    if frame is None:
+                        break
+                    verb, topic, payload = frame
+                    if verb == "MSG":
+                        self._dispatch(topic, payload)
+            except (OSError, ValueError):
+                pass
+            finally:
+                stream.close()
+            with self._send_lock:
+                if self._sock is sock:
+                    self._drop_connection()
+
+    def close(self) -> None:
+        self._closed = True
+        with self._send_lock:
+            self._drop_connection()
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def setup(self) -> None:
+        super().setup()
+        self.topics: Set[str] = set()
+        self.outbox = _Outbox(self._write, self._abort, "pubsub-broker-writer")
+
+    def handle(self) -> None:
+        broker: "Broker" = self.server.broker
+        try:
+            while True:
+                frame = _read_frame(self.rfile)
+                if frame is None:
+                    return
+                verb, topic, payload = frame
+                if verb == "SUB":
+                    broker.subscribe(topic, self)
+                elif verb == "UNSUB":
+                    broker.unsubscribe(topic, self)
+                elif verb == "PUB":
+                    broker.relay(topic, payload)
+        except (OSError, ValueError):
+            pass
+        finally:
+            broker.drop(self)
+
+    def finish(self) -> None:
+        self.outbox.close()
+        super().finish()
+
+    def deliver(self, data: bytes) -> bool:
+        """Queues a frame; a subscriber that doesn't drain its outbox is disconnected."""
+        if self.outbox.put(data):
+            return True
+        self._abort()
+        return False
+
+    def _write(self, data: bytes) -> None:
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def _abort(self) -> None:
+        # Ends handle(), which unsubscribes the connection everywhere
+        _shutdown(self.request)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Broker:
+    """
+    Relays PUB frames to every connection subscribed to the topic, by
+    queueing them on each connection's outbox (see _Outbox).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._topics: Dict[str, Set[_BrokerHandler]] = {}
+        if os.path.exists(path):
+            os.unlink(path)  # stale socket from an earlier run
+        self._server = _Server(path, _BrokerHandler)
+        self._server.broker = self
+
+    def subscribe(self, topic: str, handler: _BrokerHandler) -> None:
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(handler)
+            handler.topics.add(topic)
+
+    def unsubscribe(self, topic: str, handler: _BrokerHandler) -> None:
+        with self._lock:
+            handlers = self._topics.get(topic)
+            if handlers is not None:
+                handlers.discard(handler)
+                if not handlers:
+                    del self._topics[topic]
+            handler.topics.discard(topic)
+
+    def drop(self, handler: _BrokerHandler) -> None:
+        for topic in list(handler.topics):
+            self.unsubscribe(topic, handler)
+
+    def relay(self, topic: str, payload: bytes) -> None:
+        data = _frame("MSG", topic, payload)
+        with self._lock:
+            handlers = list(self._topics.get(topic, ()))
+        for handler in handlers:
+            if not handler.deliver(data):
+                self.drop(handler)
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def start(self) -> threading.Thread:
+        """Serves on a background thread (tests, embedding)."""
+        thread = threading.Thread(target=self.serve_forever, name="pubsub-broker", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def create_pubsub(spec: str = CHAT_PUBSUB) -> InProcessPubSub:
+    """Builds the backend selected by CHAT_PUBSUB."""
+    if spec == "memory":
+        return InProcessPubSub()
+    if spec.startswith("unix:"):
+        return BrokerPubSub(spec[len("unix:"):])
+    raise ValueError(f"Unknown CHAT_PUBSUB '{spec}'")
+
+
+_bus: Optional[InProcessPubSub] = None
+_bus_lock = threading.Lock()
+
+def get_pubsub() -> InProcessPubSub:
+    """The process-wide backend, created on first use."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = create_pubsub()
+    return _bus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local chat pub/sub broker")
+    parser.add_argument("--socket", required=True, help="Unix socket path to listen on")
+    args = parser.parse_args()
+    broker = Broker(args.socket)
+    print(f"Chat broker listening on {args.socket}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,214 @@
-from typing import List, Dict, Any, Tuple
-from sentence_transformers import SentenceTransformer, util
+import heapq
+import os
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
+from app.data import storage
+from app.models.group import parse_age_group
+from app.services import embeddings, geo, group_index, user_index
+from app.services.embeddings import embed, normalize_text
 
-# Load model once
-_model = None
+# Stage-one candidates retrieved per requested recommendation when the
+# group index is large enough for approximate search
+CANDIDATES_PER_RESULT = 20
+MIN_CANDIDATES = 200
 
-def get_model():
-    global _model
-    if _model is None:
-        print("Loading SentenceTransformer model...")
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
-    return _model
+# Stands in for "no upper age limit" in age arrays
+NO_AGE_LIMIT = np.iinfo(np.int64).max
+
+# With coordinates on both sides the location bonus decays with distance,
+# halving every LOCATION_HALF_LIFE_KM; otherwise it needs the same location name
+LOCATION_POINTS = 50
+LOCATION_HALF_LIFE_KM = float(os.environ.get("RECOMMENDER_LOCATION_HALF_LIFE_KM", 5))
+# Nearest groups added to the ANN candidates for users with coordinates
+NEARBY_CANDIDATES = 50
+# Similar users retrieved per requested result, re-ranked with location
+SIMILAR_USER_CANDIDATES = 10
 
 def calculate_semantic_score(text1: str, text2: str) -> int:
     """Calculates semantic similarity between two texts (0-100)."""
     if not text1 or not text2:
         return 0
+    if not embeddings.is_ready():
+        return _lexical_similarity(text1, text2)
         
-    model = get_model()
-    embedding1 = model.encode(text1, convert_to_tensor=True)
-    embedding2 = model.encode(text2, convert_to_tensor=True)
-    similarity = util.cos_sim(embedding1, embedding2).item()
+    # Embeddings come from the shared cache and are unit length,
+    # so the cosine similarity is a plain dot product.
+    embedding1, embedding2 = embed([text1, text2])
+    similarity = float(np.dot(embedding1, embedding2))
     return int(max(0, similarity) * 100)
 
 def is_age_in_range(user_age: int, age_group_str: str) -> bool:
     """
-    Parses age range strings like:
+    Checks an age against an age range string like:
     - "18-25"
     - "21+"
     - "All Ages"
+    Each distinct string is only parsed once (see parse_age_group).
     """
-    if not age_group_str or age_group_str == "All Ages":
-        return True
-    
-    try:
-        # Handle "21+" format
-        if "+" in age_group_str:
-            min_age = int(age_group_str.replace("+", "").strip())
-            return user_age >= min_age
-            
-        # Handle "18-25" format
-        if "-" in age_group_str:
-            parts = age_group_str.split("-")
-            min_age = int(parts[0].strip())
-            max_age = int(parts[1].strip())
-            return min_age <= user_age <= max_age
-            
-        # Handle single number (exact match? or treated as min?)
-        # For safety, treat as exact match or loose string match
-        return str(user_age) == age_group_str
-        
-    except ValueError:
-        return False # Fallback
+    min_age, max_age = parse_age_group(age_group_str)
+    return min_age <= user_age and (max_age is None or user_age <= max_age)
+
+def group_age_bounds(group: Dict[str, Any]) -> Tuple[int, Optional[int]]:
+    """(age_min, age_max) of a group; groups stored before those fields existed get them parsed."""
+    if "age_min" in group:
+        return group["age_min"], group.get("age_max")
+    return parse_age_group(group.get("age_group", "All Ages"))
+
+def age_bounds_arrays(groups: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Minimum and maximum ages of `groups` as arrays (no upper limit -> NO_AGE_LIMIT)."""
+    bounds = [group_age_bounds(g) for g in groups]
+    mins = np.fromiter((b[0] for b in bounds), dtype=np.int64, count=len(bounds))
+    maxs = np.fromiter((NO_AGE_LIMIT if b[1] is None else b[1] for b in bounds), dtype=np.int64, count=len(bounds))
+    return mins, maxs
+
+def age_eligible(groups: List[Dict[str, Any]], user_age: int) -> np.ndarray:
+    """Boolean mask of the groups whose age range includes `user_age`."""
+    mins, maxs = age_bounds_arrays(groups)
+    return (mins <= user_age) & (user_age <= maxs)
+
+def _lexical_similarity(text1: str, text2: str) -> int:
+    """Word overlap (Jaccard, 0-100): a cheap stand-in for the model."""
+    words1, words2 = set(normalize_text(text1).split()), set(normalize_text(text2).split())
+    if not words1 or not words2:
+        return 0
+    return int(100 * len(words1 & words2) / len(words1 | words2))
+
+def lexical_scores(interests: List[str], groups: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Fallback for semantic_scores while the model is still loading: best word
+    overlap between any interest and any activity tag. Exact matches still
+    score 100, related-but-different wording scores 0.
+    """
+    interest_words = [set(normalize_text(i).split()) for i in interests if i]
+    interest_words = [w for w in interest_words if w]
+    scores = np.zeros(len(groups), dtype=np.int64)
+    if not interest_words:
+        return scores
+    for g, group in enumerate(groups):
+        best = 0.0
+        for tag in group.get("activity", []):
+            tag_words = set(normalize_text(tag or "").split())
+            if not tag_words:
+                continue
+            for words in interest_words:
+                best = max(best, len(words & tag_words) / len(words | tag_words))
+        scores[g] = int(best * 100)
+    return scores
+
+def semantic_scores(interests: List[str], groups: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Semantic score (0-100) of every group for one set of interests.
+
+    Only the interests are encoded per request: group activity embeddings
+    come from the precomputed group index, scored with one matmul and a
+    segmented max per group. Groups the index doesn't know (e.g. created by
+    another process) are embedded on the fly with the same batched approach.
+    Equivalent to taking calculate_semantic_score over every pair.
+
+    Until the model has loaded this degrades to lexical_scores instead of
+    blocking the request.
+    """
+    scores = np.zeros(len(groups), dtype=np.int64)
+    interests = [i for i in interests if i]
+    if not interests or not groups:
+        return scores
+    if not embeddings.is_ready():
+        return lexical_scores(interests, groups)
+
+    interest_vectors = embed(interests)
+    indexed, found = group_index.index.semantic_scores(interest_vectors, [g.get("id") for g in groups])
+    scores[found] = indexed[found]
+
+    missing = np.flatnonzero(~found)
+    if len(missing):
+        scores[missing] = _score_activities(interest_vectors, [groups[i] for i in missing])
+    return scores
+
+def _score_activities(interest_vectors: np.ndarray, groups: List[Dict[str, Any]]) -> np.ndarray:
+    """Embeds the groups' activity tags in one batch and scores them."""
+    scores = np.zeros(len(groups), dtype=np.int64)
+
+    # Flatten activity tags; offsets[k] is where group owners[k]'s tags start
+    activities: List[str] = []
+    offsets, owners = [], []
+    for g, group in enumerate(groups):
+        tags = [a for a in group.get("activity", []) if a]
+        if tags:
+            offsets.append(len(activities))
+            owners.append(g)
+            activities.extend(tags)
+    if not activities:
+        return scores
+
+    similarity = interest_vectors @ embed(activities).T
+    best_per_activity = similarity.max(axis=0)
+    best_per_group = np.maximum.reduceat(best_per_activity, offsets)
+    scores[owners] = (np.maximum(best_per_group, 0) * 100).astype(np.int64)
+    return scores
+
+def _score_components(user: Dict[str, Any], groups: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(semantic, location, age) score arrays, aligned with `groups`."""
+    semantic = semantic_scores(user.get("interests", []), groups)
+    user_age = user.get("age", 0)
+
+    # 2. Location: up to +50 by distance, or for an exact (case-insensitive) match
+    location = location_scores(user.get("location", ""), geo.coordinates(user), *location_arrays(groups))
+    # 3. Age Group: +30 for being in range (or All Ages)
+    age = np.where(age_eligible(groups, user_age), 30, 0)
+    return semantic, location, age
+
+def location_arrays(groups: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Lowercase location names, latitudes and longitudes (NaN if missing) of `groups`."""
+    names = np.asarray([g.get("location", "").lower() for g in groups], dtype=object)
+    points = [geo.coordinates(g) or (np.nan, np.nan) for g in groups]
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return names, coords[:, 0], coords[:, 1]
+
+def location_scores(
+    user_location: str,
+    user_point: Optional[Tuple[float, float]],
+    names: np.ndarray,
+    lats: np.ndarray,
+    lons: np.ndarray,
+) -> np.ndarray:
+    """
+    Location points per group: LOCATION_POINTS * 0.5 ** (km / LOCATION_HALF_LIFE_KM)
+    when user and group both have coordinates, else LOCATION_POINTS for the
+    same location name.
+    """
+    scores = np.where(names == user_location.lower(), LOCATION_POINTS, 0).astype(np.int64)
+    if user_point is not None:
+        located = np.flatnonzero(~np.isnan(lats))
+        if len(located):
+            km = geo.haversine_km(user_point[0], user_point[1], lats[located], lons[located])
+            scores[located] = (LOCATION_POINTS * 0.5 ** (km / LOCATION_HALF_LIFE_KM)).astype(np.int64)
+    return scores
+
+
+def score_groups(user: Dict[str, Any], groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Relevance details (see calculate_relevance_details) for many groups at once.
+    """
+    semantic, location, age = _score_components(user, groups)
+    return [
+        {"total": s + l + a, "breakdown": {"semantic": s, "location": l, "age": a}}
+        for s, l, a in zip(semantic.tolist(), location.tolist(), age.tolist())
+    ]
+
+def _has_room_for(user_id: str, group: Dict[str, Any]) -> bool:
+    """Not a member yet and not full."""
+    members = group.get("members", [])
+    if user_id in members:
+        return False
+    max_members = group.get("max_members")
+    return max_members is None or len(members) < max_members
+
+def _is_candidate(user_id: str, user_age: int, group: Dict[str, Any]) -> bool:
+    """Hard constraints, checked before any semantic work."""
+    if not _has_room_for(user_id, group):
+        return False
+    min_age, max_age = group_age_bounds(group)
+    return min_age <= user_age and (max_age is None or user_age <= max_age)
 
 def calculate_relevance_details(user: Dict[str, Any], group: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -60,73 +217,112 @@ def calculate_relevance_details(user: Dict[str, Any], group: Dict[str, Any]) ->
     
     Scoring Rules:
     - Semantic Interest: 0-100 (max similarity across all interest-activity tag pairs)
-    - Location: +50 (Exact)
+    - Location: 0-50; with coordinates on both sides 50 * 0.5 ** (km / LOCATION_HALF_LIFE_KM)
+      (truncated to an int), otherwise +50 for the same location name
     - Age Group: +30 (In Range)
     """
-    breakdown = {}
-    
-    # 1. Semantic Interest - Compare user interests against group activity tags
-    semantic_score = 0
-    user_interests = user.get("interests", [])
-    group_activities = group.get("activity", [])
-    
-    if user_interests and group_activities:
-        # Calculate similarity between all interest-activity pairs
-        max_similarity = 0
-        for interest in user_interests:
-            for activity in group_activities:
-                similarity = calculate_semantic_score(interest, activity)
-                max_similarity = max(max_similarity, similarity)
-        semantic_score = max_similarity
-    breakdown["semantic"] = semantic_score
-
-    # 2. Location
-    location_score = 0
-    if user.get("location", "").lower() == group.get("location", "").lower():
-        location_score = 50
-    breakdown["location"] = location_score
-        
-    # 3. Age Group
-    age_score = 0
-    age_group = group.get("age_group", "All Ages")
-    # Bonus for being in range (or All Ages)
-    if is_age_in_range(user.get("age", 0), age_group):
-        age_score = 30
-    breakdown["age"] = age_score
-    
-    total = semantic_score + location_score + age_score
-    
-    return {
-        "total": total,
-        "breakdown": breakdown
-    }
+    return score_groups(user, [group])[0]
 
 def get_recommended_groups(user: Dict[str, Any], all_groups: List[Dict[str, Any]], limit: int = 10) -> List[Dict[str, Any]]:
     """
     Returns list of groups with 'relevance_score' and 'score_breakdown' fields added.
     Sorted by relevance.
+
+    Groups the user can't join (already a member, full, outside the age
+    range) are dropped up front. Scores are computed as arrays and the best
+    `limit` picked with a bounded heap; only those groups are copied.
     """
     user_id = user.get("id")
-    scored_groups = []
+    user_age = user.get("age", 0)
     
-    # Pre-load model
-    get_model()
+    in_age_range = age_eligible(all_groups, user_age).tolist()
+    candidates = [g for g, ok in zip(all_groups, in_age_range) if ok and _has_room_for(user_id, g)]
+    if not candidates or limit <= 0:
+        return []
     
-    for group in all_groups:
-        # Skip if already a member
-        if user_id in group.get("members", []):
-            continue
-            
-        result = calculate_relevance_details(user, group)
-        score = result["total"]
-        
-        # Inject score data into a copy of the group dict
-        group_with_score = group.copy()
-        group_with_score["relevance_score"] = score
-        group_with_score["score_breakdown"] = result["breakdown"]
-        scored_groups.append(group_with_score)
+    # One batched scoring pass over all candidates
+    semantic, location, age = _score_components(user, candidates)
+    totals = (semantic + location + age).tolist()
     
-    # Sort by score descending
-    scored_groups.sort(key=lambda g: g["relevance_score"], reverse=True)
+    # nlargest is stable, like the full sort it replaces
+    top = heapq.nlargest(limit, range(len(candidates)), key=totals.__getitem__)
     
-    return scored_groups[:limit]
+    recommended = []
+    for i in top:
+        # Inject score data into a copy of the group dict
+        group_with_score = candidates[i].copy()
+        group_with_score["relevance_score"] = totals[i]
+        group_with_score["score_breakdown"] = {
+            "semantic": int(semantic[i]),
+            "location": int(location[i]),
+            "age": int(age[i]),
+        }
+        recommended.append(group_with_score)
+    
+    return recommended
+
+def recommend_groups(user: Dict[str, Any], limit: int = 10, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Two-stage recommendation for a user.
+
+    1. Retrieval: the top semantic matches come from the group index's ANN
+       search (`nprobe` trades recall for latency), plus the groups nearest
+       to the user if they have coordinates. Small indexes, and users
+       without interests, skip this and consider every group, as does any
+       request served before the model has loaded (lexical scoring).
+    2. Ranking: candidates are re-scored exactly by get_recommended_groups,
+       adding the location and age bonuses.
+    """
+    interests = [i for i in user.get("interests", []) if i]
+    candidate_ids = None
+    if interests and embeddings.is_ready():
+        k = max(limit * CANDIDATES_PER_RESULT, MIN_CANDIDATES)
+        candidate_ids = group_index.index.search(embed(interests), k, nprobe)
+
+    point = geo.coordinates(user)
+    if candidate_ids is not None and point is not None:
+        nearby = [gid for gid, _ in geo.index.nearest(point[0], point[1], NEARBY_CANDIDATES)]
+        candidate_ids = list(dict.fromkeys(candidate_ids + nearby))
+
+    if candidate_ids is None:
+        groups = storage.get_all("groups")
+    else:
+        groups = [g for g in (storage.get_item_by_id("groups", gid) for gid in candidate_ids) if g]
+
+    return get_recommended_groups(user, groups, limit)
+
+def recommend_users(user: Dict[str, Any], limit: int = 10, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Users with similar interests, preferably nearby.
+
+    Candidates are the nearest pooled interest vectors in the user index;
+    they are ranked by cosine similarity (0-100) plus the same location
+    points groups get. Needs the embedding model; users without interests
+    get no suggestions.
+    """
+    vector = user_index.interest_vector(user.get("interests", []))
+    if vector is None or limit <= 0:
+        return []
+    k = max(limit * SIMILAR_USER_CANDIDATES, MIN_CANDIDATES)
+    matches = user_index.index.search(vector, k, exclude=user.get("id"), nprobe=nprobe)
+    candidates, semantic = [], []
+    for user_id, similarity in matches:
+        candidate = storage.get_item_by_id("users", user_id)
+        if candidate is not None:
+            candidates.append(candidate)
+            semantic.append(int(max(similarity, 0) * 100))
+    if not candidates:
+        return []
+
+    semantic = np.asarray(semantic, dtype=np.int64)
+    location = location_scores(user.get("location", ""), geo.coordinates(user), *location_arrays(candidates))
+    totals = (semantic + location).tolist()
+    top = heapq.nlargest(limit, range(len(candidates)), key=totals.__getitem__)
+    return [
+        {
+            **candidates[i],
+            "relevance_score": totals[i],
+            "score_breakdown": {"semantic": int(semantic[i]), "location": int(location[i])},
+        }
+        for i in top
+    ]
@@ -0,0 +1,158 @@
+"""
+Chat history retention: moves each group's old messages out of the main
+store into the compressed segment archive (app.data.message_archive) and
+deletes what is past retention.
+
+Per group policy (stored in the "chat_retention" collection, id == group id;
+unset fields use the defaults below):
+
+- hot_days: messages younger than this stay in the main store
+- archive: archive older messages (False: delete them instead)
+- retain_days: delete messages older than this from the archive too
+  (None: keep forever)
+
+Runs on a background thread every CHAT_RETENTION_INTERVAL seconds (0
+disables it), or by hand: python -m app.services.retention. With several
+workers every one of them has the thread, but a run holds the archive's
+cross-process lock, so only one applies the policies at a time and the
+others skip that round.
+"""
+import argparse
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from app.data import storage
+from app.data.message_archive import MessageArchive
+
+COLLECTION = "chat_retention"
+DEFAULT_HOT_DAYS = float(os.environ.get("CHAT_HOT_DAYS", 7))
+DEFAULT_RETAIN_DAYS = float(os.environ["CHAT_RETAIN_DAYS"]) if os.environ.get("CHAT_RETAIN_DAYS") else None
+RETENTION_INTERVAL = float(os.environ.get("CHAT_RETENTION_INTERVAL", 3600))
+# Default: next to the database file
+ARCHIVE_PATH = os.environ.get("CHAT_ARCHIVE_PATH") or None
+# Messages moved per storage round trip
+MOVE_BATCH = 1000
+
+_archive: Optional[MessageArchive] = None
+_archive_lock = threading.Lock()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def get_archive() -> MessageArchive:
+    """The archive for the current database (re-created if DB_PATH changed)."""
+    global _archive
+    root = ARCHIVE_PATH or os.path.join(os.path.dirname(storage.DB_PATH), "message_archive")
+    if _archive is None or _archive.root != root:
+        with _archive_lock:
+            if _archive is None or _archive.root != root:
+                if _archive is not None:
+                    _archive.close()
+                _archive = MessageArchive(root)
+    return _archive
+
+
+def policy_for(group_id: str) -> Dict[str, Any]:
+    policy = {"hot_days": DEFAULT_HOT_DAYS, "archive": True, "retain_days": DEFAULT_RETAIN_DAYS}
+    stored = storage.get_item_by_id(COLLECTION, group_id)
+    if stored:
+        policy.update({k: v for k, v in stored.items() if k in policy})
+    return policy
+
+
+def set_policy(group_id: str, policy: Dict[str, Any]) -> Dict[str, Any]:
+    record = {"id": group_id, **policy}
+    if not storage.update_item(COLLECTION, group_id, record):
+        storage.add_item(COLLECTION, record)
+    return policy_for(group_id)
+
+
+def apply(group_id: str, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Applies the group's policy. Returns counts of archived and deleted messages."""
+    now = now or datetime.utcnow()
+    policy = policy_for(group_id)
+    hot_cutoff = (now - timedelta(days=policy["hot_days"])).isoformat()
+    retain_cutoff = None
+    if policy["retain_days"] is not None:
+        retain_cutoff = (now - timedelta(days=policy["retain_days"])).isoformat()
+    archive = get_archive()
+    with archive.locked():
+        return _apply(archive, group_id, policy, hot_cutoff, retain_cutoff)
+
+
+def _apply(
+    archive: MessageArchive,
+    group_id: str,
+    policy: Dict[str, Any],
+    hot_cutoff: str,
+    retain_cutoff: Optional[str],
+) -> Dict[str, int]:
+    archived = deleted = 0
+    while True:
+        # Oldest first, up to the hot cutoff
+        batch = storage.ordered_page_by_key("messages", group_id, ("", ""), (hot_cutoff, ""), MOVE_BATCH)
+        if not batch:
+            break
+        keep = [
+            m for m in batch
+            if policy["archive"] and (retain_cutoff is None or (m.get("timestamp") or "") >= retain_cutoff)
+        ]
+        # Archived durably before they leave the main store
+        archived += archive.add(group_id, keep)
+        deleted += len(batch) - len(keep)
+        storage.delete_items("messages", [m["id"] for m in batch])
+        if len(batch) < MOVE_BATCH:
+            break
+    if retain_cutoff is not None:
+        deleted += archive.drop_before(group_id, retain_cutoff)
+    return {"archived": archived, "deleted": deleted}
+
+
+def run(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Applies every group's policy (nothing if another process is already at it)."""
+    totals = {"groups": 0, "archived": 0, "deleted": 0}
+    with get_archive().locked(blocking=False) as acquired:
+        if not acquired:
+            return totals
+        for group in storage.get_all("groups"):
+            counts = apply(group["id"], now)
+            totals["groups"] += 1
+            totals["archived"] += counts["archived"]
+            totals["deleted"] += counts["deleted"]
+    return totals
+
+
+def start_background(interval: float = RETENTION_INTERVAL) -> None:
+    """Runs run() every `interval` seconds on a daemon thread (first run after one interval)."""
+    global _thread
+    if interval <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+
+    def loop():
+        while not _stop.wait(interval):
+            try:
+                totals = run()
+                if totals["archived"] or totals["deleted"]:
+                    print(f"Chat retention: {totals}")
+            except Exception as e:
+                print(f"Chat retention failed: {type(e).__name__}: {e}")
+
+    _thread = threading.Thread(target=loop, name="chat-retention", daemon=True)
+    _thread.start()
+
+
+def stop_background() -> None:
+    _stop.set()
+
+
+def main() -> None:
+    argparse.ArgumentParser(description="Archive and expire old chat messages").parse_args()
+    print(run())
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.data import storage
+from app.services.ann import BackgroundIVF, IVFIndex
+from app.services.embeddings import embed
+from app.services.group_index import ANN_MIN_ROWS, ANN_NPROBE
+
+
+def _unit_rows(means: np.ndarray) -> np.ndarray:
+    """float32 rows scaled to unit length; all-zero rows stay zero."""
+    norms = np.linalg.norm(means, axis=1, keepdims=True)
+    return (means / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def pool(vectors: np.ndarray) -> Optional[np.ndarray]:
+    """Unit-length mean of interest embeddings, or None if there are none."""
+    if not len(vectors):
+        return None
+    pooled = _unit_rows(vectors.mean(axis=0, keepdims=True))[0]
+    return pooled if pooled.any() else None
+
+
+def interest_vector(interests: List[str]) -> Optional[np.ndarray]:
+    """The pooled vector of one user's interests (as stored in the index)."""
+    interests = [i for i in interests if i]
+    return pool(embed(interests)) if interests else None
+
+
+class UserInterestIndex:
+    """
+    One pooled interest vector per user (see pool()) in a contiguous float32
+    matrix, so "people like you" is a nearest-neighbour query rather than a
+    comparison against every user.
+
+    - add_user() queues a new or changed user; queued users are embedded
+      together on the next query. A changed user's old row is marked dead.
+    - remove_user() marks the row dead; dead rows are dropped by a
+      compaction once they make up a quarter of the matrix.
+
+    Rebuilt from storage on first use and whenever storage.epoch() changes.
+    Like the group index, queries score every row exactly below
+    ANN_MIN_ROWS and go through an IVFIndex (trained in the background,
+    see BackgroundIVF; exact until it is ready) above it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._epoch = None
+        self._clear()
+        self._ivf = BackgroundIVF(self._lock, lambda: self._vectors[: self._n_rows])
+
+    def _clear(self) -> None:
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._n_rows = 0
+        self._row_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._interests: Dict[str, List[str]] = {}
+        self._dead_rows = 0
+        self._pending: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._pending)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._rows or user_id in self._pending
+
+    # --- Maintenance ---
+
+    def rebuild(self, users: List[Dict[str, Any]] | None = None) -> None:
+        """Re-creates the index from `users` (default: everything in storage)."""
+        with self._lock:
+            self._epoch = storage.epoch()
+            self._clear()
+            self._ivf.reset()
+            for user in storage.get_all("users") if users is None else users:
+                self._queue(user)
+            self._flush()
+            self._ivf.get(ANN_MIN_ROWS)  # start training now rather than on the first query
+
+    def ensure_fresh(self) -> None:
+        if self._epoch != storage.epoch():
+            self.rebuild()
+
+    def add_user(self, user: Dict[str, Any]) -> None:
+        """Called after a user was created or their interests changed."""
+        with self._lock:
+            if self._epoch is None:
+                return  # not built yet; the first rebuild reads storage
+            self._queue(user)
+
+    def remove_user(self, user_id: str) -> None:
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._kill(user_id)
+
+    def _queue(self, user: Dict[str, Any]) -> None:
+        user_id = user.get("id")
+        interests = [i for i in user.get("interests", []) if i]
+        if self._interests.get(user_id) == interests and user_id in self._rows:
+            return
+        self._pending.pop(user_id, None)
+        self._kill(user_id)
+        if interests:
+            self._pending[user_id] = interests
+
+    def _kill(self, user_id: str) -> None:
+        row = self._rows.pop(user_id, None)
+        self._interests.pop(user_id, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        self._dead_rows += 1
+        if self._dead_rows * 4 > self._n_rows:
+            self._compact()
+
+    def _flush(self) -> None:
+        """Embeds all queued users' interests in one batch and appends their pooled rows."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        interests = [i for user_interests in pending.values() for i in user_interests]
+        vectors = embed(interests)
+        counts = np.asarray([len(i) for i in pending.values()], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        # Same rows as pool() per user, in one pass
+        pooled = _unit_rows(np.add.reduceat(vectors, offsets, axis=0) / counts[:, None])
+        self._reserve(self._n_rows + len(pending), vectors.shape[1])
+
+        first = row = self._n_rows
+        for user_id, user_interests in pending.items():
+            self._rows[user_id] = row
+            self._interests[user_id] = user_interests
+            self._row_ids.append(user_id)
+            row += 1
+        self._vectors[first:row] = pooled
+        self._alive[first:row] = True
+        self._n_rows = row
+
+        self._ivf.add(first, pooled)
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Grows the backing arrays geometrically so appends stay amortised O(1)."""
+        if self._vectors.shape[1] != dim:
+            self._vectors = np.zeros((0, dim), dtype=np.float32)
+        if rows <= len(self._vectors):
+            return
+        capacity = max(rows, 2 * len(self._vectors), 64)
+        vectors = np.zeros((capacity, dim), dtype=np.float32)
+        vectors[: self._n_rows] = self._vectors[: self._n_rows]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._n_rows] = self._alive[: self._n_rows]
+        self._vectors, self._alive = vectors, alive
+
+    def _compact(self) -> None:
+        """Drops dead rows and renumbers the rest (new arrays)."""
+        keep = np.flatnonzero(self._alive[: self._n_rows])
+        self._row_ids = [self._row_ids[row] for row in keep.tolist()]
+        self._rows = {user_id: row for row, user_id in enumerate(self._row_ids)}
+        self._vectors = self._vectors[keep].copy()
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._n_rows = len(keep)
+        self._dead_rows = 0
+        self._ivf.reset()  # row numbers changed
+
+    # --- Queries ---
+
+    def _ann(self) -> Optional[IVFIndex]:
+        """The IVF index over the rows (see BackgroundIVF); None while the
+        matrix is small enough for exact scoring or no training finished yet."""
+        return self._ivf.get(ANN_MIN_ROWS)
+
+    def search(
+        self, vector: np.ndarray, k: int, exclude: Optional[str] = None, nprobe: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """Up to k (user id, cosine similarity) pairs closest to `vector`, best first."""
+        with self._lock:
+            self.ensure_fresh()
+            self._flush()
+            ivf = self._ann()
+            if ivf is None:
+                rows = np.flatnonzero(self._alive[: self._n_rows])
+            else:
+                rows = ivf.search(vector[None, :], nprobe or ANN_NPROBE)
+                rows = rows[self._alive[rows]]
+            excluded = self._rows.get(exclude)
+            if excluded is not None:
+                rows = rows[rows != excluded]
+            if not len(rows) or k <= 0:
+                return []
+            similarity = self._vectors[rows] @ vector
+            top = np.argpartition(-similarity, min(k, len(rows)) - 1)[:k]
+            top = top[np.argsort(-similarity[top], kind="stable")]
+            return [(self._row_ids[rows[i]], float(similarity[i])) for i in top.tolist()]
+
+
+index = UserInterestIndex()
@@ -0,0 +1,55 @@
+"""
+Latency of GroupSearchIndex.search at large group counts.
+
+Usage: python -m benchmarks.group_search_bench [N]
+"""
+import random
+import sys
+import tempfile
+import time
+
+from app.data import storage
+from app.services.group_search import GroupSearchIndex
+
+ACTIVITIES = [f"activity {i}" for i in range(200)]
+LOCATIONS = [f"district {i}" for i in range(30)]
+AGE_GROUPS = ["All Ages", "18-25", "21+", "25-35", "40+", "16-19"]
+
+QUERIES = {
+    "no filter": {},
+    "activity": {"activities": ["activity 7"]},
+    "location": {"location": "District 3"},
+    "age": {"age": 17},
+    "activity+location+age": {"activities": ["activity 7"], "location": "district 3", "age": 30},
+    "two activities": {"activities": ["activity 7", "activity 8"]},
+}
+
+
+def main(n):
+    storage.DB_PATH = tempfile.mktemp(suffix=".json")
+    rng = random.Random(1)
+    groups = [
+        {"id": f"g{i}", "activity": rng.sample(ACTIVITIES, rng.randint(1, 4)),
+         "location": rng.choice(LOCATIONS), "age_group": rng.choice(AGE_GROUPS)}
+        for i in range(n)
+    ]
+    index = GroupSearchIndex()
+    start = time.perf_counter()
+    index.rebuild(groups)
+    print(f"built index over {n} groups in {time.perf_counter() - start:.2f}s")
+
+    for name, query in QUERIES.items():
+        repeat = 200
+        start = time.perf_counter()
+        for _ in range(repeat):
+            ids, cursor = index.search(limit=20, **query)
+        first = (time.perf_counter() - start) / repeat * 1e6
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.search(cursor=cursor, limit=20, **query)
+        second = (time.perf_counter() - start) / repeat * 1e6
+        print(f"{name:>24}: page 1 {first:7.1f} us, page 2 {second:7.1f} us ({len(ids)} hits)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300_000)
@@ -0,0 +1,41 @@
+"""
+Chat write throughput: one storage.add_item per message versus the
+group-commit MessageWriter, with concurrent senders.
+
+Usage: python -m benchmarks.message_write_bench [MESSAGES] [SENDERS]
+"""
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.data import storage
+from app.services import messages
+
+
+def _fresh_store():
+    storage.DB_PATH = tempfile.mktemp(suffix=".json")
+    storage.reset_store()
+
+
+def _run(label, send, n, senders):
+    _fresh_store()
+    batch = [messages.new_message(f"g{i % 20}", "u1", "Ann", f"message {i}") for i in range(n)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(senders) as pool:
+        list(pool.map(send, batch))
+    elapsed = time.perf_counter() - start
+    print(f"{label:>14}: {n / elapsed:8.0f} msg/s ({1000 * elapsed / n:.2f} ms per message)")
+
+
+def main(n, senders):
+    _run("add_item", lambda m: storage.add_item("messages", m), n, senders)
+    writer = messages.MessageWriter()
+    _run("group commit", lambda m: writer.submit(m).result(), n, senders)
+    writer.close()
+    print(f"writer: {writer.stats.as_dict()}")
+    storage.reset_store()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, int(sys.argv[2]) if len(sys.argv) > 2 else 32)
@@ -0,0 +1,97 @@
+"""
+Latency and allocations of get_recommended_groups versus group count.
+
+Compares the current implementation (pre-filter, array scores, bounded
+heap, copy only the winners) with the previous one (score and copy every
+non-member group, then sort the whole list). Embeddings come from a
+deterministic hashing model so the numbers measure the recommender, not
+the transformer.
+
+Usage: python -m benchmarks.recommendation_bench [N ...]
+"""
+import random
+import sys
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+from app.services import embeddings, group_index, recommendation
+
+ACTIVITIES = [
+    "hiking", "coffee", "board games", "photography", "yoga", "running", "climbing",
+    "reading", "cooking", "cycling", "chess", "music", "film", "dancing", "tennis",
+]
+LOCATIONS = ["Central", "East", "West", "North", "Orchard", "Tampines"]
+AGE_GROUPS = ["All Ages", "18-25", "21+", "25-35", "40+"]
+
+
+class HashingModel:
+    dim = 384
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                vectors[row, zlib.crc32(word.encode()) % self.dim] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+def make_groups(n, rng):
+    groups = []
+    for i in range(n):
+        max_members = rng.randint(2, 20)
+        groups.append({
+            "id": f"g{i}", "name": f"Group {i}", "description": "Benchmark group",
+            "activity": rng.sample(ACTIVITIES, rng.randint(1, 3)),
+            "location": rng.choice(LOCATIONS), "age_group": rng.choice(AGE_GROUPS),
+            "max_members": max_members, "admin_id": "admin",
+            "members": [f"u{j}" for j in range(rng.randint(1, max_members))],
+        })
+    return groups
+
+
+def baseline(user, all_groups, limit):
+    """The pre-heap implementation: score, copy and sort everything."""
+    candidates = [g for g in all_groups if user["id"] not in g.get("members", [])]
+    scored = []
+    for group, result in zip(candidates, recommendation.score_groups(user, candidates)):
+        group_with_score = group.copy()
+        group_with_score["relevance_score"] = result["total"]
+        group_with_score["score_breakdown"] = result["breakdown"]
+        scored.append(group_with_score)
+    scored.sort(key=lambda g: g["relevance_score"], reverse=True)
+    return scored[:limit]
+
+
+def measure(fn, *args, repeat=5):
+    fn(*args)  # warm caches
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024
+
+
+def main(sizes):
+    embeddings._model = HashingModel()
+    rng = random.Random(42)
+    user = {"id": "bench-user", "interests": ["hiking", "coffee", "photography"], "location": "Central", "age": 27}
+
+    print(f"{'groups':>8} | {'baseline ms':>11} {'peak KiB':>9} | {'current ms':>10} {'peak KiB':>9}")
+    for n in sizes:
+        groups = make_groups(n, rng)
+        group_index.index.rebuild(groups)
+        base_ms, base_kib = measure(baseline, user, groups, 10)
+        cur_ms, cur_kib = measure(recommendation.get_recommended_groups, user, groups, 10)
+        print(f"{n:>8} | {base_ms:>11.1f} {base_kib:>9.0f} | {cur_ms:>10.1f} {cur_kib:>9.0f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 50_000])
@@ -0,0 +1,30 @@
+"""
+Precomputes group recommendations for every user and stores them in the
+"recommendations" collection, which /groups/recommended serves while fresh.
+
+Run periodically (e.g. from cron):
+    python generate_recommendations.py [--top-k 50] [--workers 4]
+"""
+import argparse
+import time
+
+from app.data import storage
+from app.services import batch_recommendations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top-k", type=int, default=batch_recommendations.TOP_K, help="groups stored per user")
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = batch_recommendations.run(top_k=args.top_k, workers=args.workers)
+    storage.close()
+
+    print(f'✅ Precomputed recommendations for {count} users in {time.perf_counter() - start:.1f}s!')
+
+
+# Worker processes re-import this module under the spawn start method
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Input } from "@/components/ui/input";
 import { Button } from "@/components/ui/button";
@@ -26,12 +26,41 @@ export default function GroupChat({ groupId, currentUser }: GroupChatProps) {
     const [messages, setMessages] = useState<Message[]>([]);
     const [inputMessage, setInputMessage] = useState("");
     const [isSending, setIsSending] = useState(false);
+    // Messages shown, read by the polling interval
+    const shown = useRef<Message[]>([]);
 
-    // Fetch messages
+    // The server returns pages of at most PAGE_SIZE messages, oldest first
+    const PAGE_SIZE = 200;
+
+    const getPage = async (params: { before?: string; after?: string }) => {
+        const res = await api.get<Message[]>(`/api/v1/groups/${groupId}/messages`, {
+            params: { ...params, limit: PAGE_SIZE },
+        });
+        return res.data;
+    };
+
+    // Fetch messages: the whole history once, then only what is newer
     const fetchMessages = async () => {
         try {
-            const res = await api.get<Message[]>(`/api/v1/groups/${groupId}/messages`);
-            setMessages(res.data);
+            let loaded = shown.current;
+            if (loaded.length === 0) {
+                let page = await getPage({});
+                loaded = page;
+                while (page.length === PAGE_SIZE) {
+                    page = await getPage({ before: loaded[0].id });
+                    loaded = [...page, ...loaded];
+                }
+            } else {
+                let page: Message[];
+                do {
+                    page = await getPage({ after: loaded[loaded.length - 1].id });
+                    loaded = [...loaded, ...page];
+                } while (page.length === PAGE_SIZE);
+            }
+            if (loaded.length !== shown.current.length) {
+                shown.current = loaded;
+                setMessages(loaded);
+            }
         } catch (error) {
             console.error("Failed to fetch messages:", error);
         }
@@ -39,6 +68,8 @@ export default function GroupChat({ groupId, currentUser }: GroupChatProps) {
 
     // Initial fetch and polling
     useEffect(() => {
+        shown.current = [];
+        setMessages([]);
         fetchMessages();
 
         // Poll for new messages every 2 seconds
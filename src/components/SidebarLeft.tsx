@@ -7,8 +7,8 @@ import { Search, ThumbsUp, User as UserIcon, Users } from "lucide-react";
 import { Link } from "wouter";
 
 import { useEffect, useState, useMemo } from "react";
-import type { User } from "@/types";
-import { api } from "@/lib/api";
+import type { LikePage, User } from "@/types";
+import { api, fetchAllLikeIds } from "@/lib/api";
 import { DEMO_USER_ID } from "@/lib/constants";
 import { toast } from "sonner";
 import { Heart } from "lucide-react";
@@ -23,6 +23,8 @@ export default function SidebarLeft() {
   const [mutualsCount, setMutualsCount] = useState<number>(0);
   const [searchQuery, setSearchQuery] = useState<string>("");
   const [likingUserId, setLikingUserId] = useState<string | null>(null);
+  // Users the demo user liked
+  const [likedIds, setLikedIds] = useState<Set<string>>(new Set());
   useEffect(() => {
     const fetchUser = async () => {
       try {
@@ -55,14 +57,13 @@ export default function SidebarLeft() {
         const response = await api.get<User[]>("/api/v1/users/");
         setAllUsers(response.data);
 
-        // Calculate mutuals count
-        const currentUserData = await api.get<User>(`/api/v1/users/${DEMO_USER_ID}`);
-        const mutuals = response.data.filter(u =>
-          u.id !== DEMO_USER_ID &&
-          u.liked_by?.includes(DEMO_USER_ID) &&
-          currentUserData.data.liked_by?.includes(u.id)
-        );
-        setMutualsCount(mutuals.length);
+        // Everyone the demo user liked (all pages), and the mutuals total from the server
+        const [given, mutuals] = await Promise.all([
+          fetchAllLikeIds(`/api/v1/users/${DEMO_USER_ID}/likes_given`),
+          api.get<LikePage>(`/api/v1/users/${DEMO_USER_ID}/mutuals`, { params: { limit: 1 } }),
+        ]);
+        setLikedIds(new Set(given));
+        setMutualsCount(mutuals.data.total);
       } catch (error) {
         console.error("Failed to fetch users:", error);
       }
@@ -95,6 +96,7 @@ export default function SidebarLeft() {
     setLikingUserId(targetId);
     try {
       await api.post(`/api/v1/users/${targetId}/like`);
+      setLikedIds(prev => new Set(prev).add(targetId));
       toast.success("Liked!");
       // Refresh users list
       const response = await api.get<User[]>("/api/v1/users/");
@@ -111,6 +113,11 @@ export default function SidebarLeft() {
     setLikingUserId(targetId);
     try {
       await api.post(`/api/v1/users/${targetId}/unlike`);
+      setLikedIds(prev => {
+        const next = new Set(prev);
+        next.delete(targetId);
+        return next;
+      });
       toast.success("Unliked");
       // Refresh users list
       const response = await api.get<User[]>("/api/v1/users/");
@@ -123,7 +130,7 @@ export default function SidebarLeft() {
   };
 
   const hasLiked = (targetUser: User): boolean => {
-    return (targetUser.liked_by || []).includes(DEMO_USER_ID);
+    return likedIds.has(targetUser.id);
   };
 
   const toggleInterest = (tag: string) => {
@@ -292,7 +299,7 @@ export default function SidebarLeft() {
           <div className="grid grid-cols-3 gap-3">
             <div className="bg-white/5 rounded-lg p-3 text-center border border-white/5 hover:border-primary/30 transition-colors">
               <div className="text-primary mb-1 flex justify-center"><ThumbsUp size={16} /></div>
-              <div className="text-xl font-bold font-rajdhani">{user.liked_by?.length || 0}</div>
+              <div className="text-xl font-bold font-rajdhani">{user.likes || 0}</div>
               <div className="text-[9px] text-muted-foreground uppercase tracking-wider">Likes</div>
             </div>
             <Link href="/mutuals">
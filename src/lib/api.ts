@@ -1,4 +1,5 @@
 import axios from "axios";
+import type { LikePage } from "@/types";
 
 // Create an axios instance with default config
 export const api = axios.create({
@@ -24,3 +25,15 @@ api.interceptors.response.use(
         return Promise.reject(error);
     }
 );
+
+// Every user id of a paged like endpoint (likes_given, liked_by, mutuals)
+export async function fetchAllLikeIds(path: string, pageSize = 1000): Promise<string[]> {
+    const ids: string[] = [];
+    for (;;) {
+        const page = await api.get<LikePage>(path, { params: { skip: ids.length, limit: pageSize } });
+        ids.push(...page.data.user_ids);
+        if (!page.data.user_ids.length || ids.length >= page.data.total) {
+            return ids;
+        }
+    }
+}
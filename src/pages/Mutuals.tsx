@@ -5,7 +5,7 @@ import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { ArrowLeft, Users, Heart } from "lucide-react";
 import { useLocation } from "wouter";
-import { api } from "@/lib/api";
+import { api, fetchAllLikeIds } from "@/lib/api";
 import type { User } from "@/types";
 import { toast } from "sonner";
 import { DEMO_USER_ID } from "@/lib/constants";
@@ -23,15 +23,11 @@ export default function Mutuals() {
                 const userRes = await api.get<User>(`/api/v1/users/${DEMO_USER_ID}`);
                 setCurrentUser(userRes.data);
 
-                // Fetch all users
-                const usersRes = await api.get<User[]>("/api/v1/users/");
-
-                // Find mutuals: users who have liked the demo user AND who the demo user has liked
-                const mutualUsers = usersRes.data.filter(user =>
-                    user.id !== DEMO_USER_ID && // Not the current user
-                    user.liked_by?.includes(DEMO_USER_ID) && // Current user has liked them
-                    userRes.data.liked_by?.includes(user.id) // They have liked current user back
-                );
+                // Mutuals: users the demo user has liked AND who have liked them back (all pages)
+                const mutualIds = await fetchAllLikeIds(`/api/v1/users/${DEMO_USER_ID}/mutuals`);
+                const mutualUsers = (
+                    await Promise.all(mutualIds.map(id => api.get<User>(`/api/v1/users/${id}`)))
+                ).map(res => res.data);
 
                 setMutuals(mutualUsers);
             } catch (error) {
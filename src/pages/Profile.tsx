@@ -30,7 +30,10 @@ export default function Profile() {
                 setUser(userRes.data);
 
                 // Check if current user has liked this user
-                setIsLiked(userRes.data.liked_by?.includes(DEMO_USER_ID) || false);
+                if (params.userId !== DEMO_USER_ID) {
+                    const likedRes = await api.get<boolean>(`/api/v1/users/${DEMO_USER_ID}/likes_given/${params.userId}`);
+                    setIsLiked(likedRes.data);
+                }
 
                 // Fetch all groups and filter by user membership
                 const groupsRes = await api.get<Group[]>("/api/v1/groups/");
@@ -56,12 +59,12 @@ export default function Profile() {
             if (isLiked) {
                 await api.post(`/api/v1/users/${user.id}/unlike`);
                 setIsLiked(false);
-                setUser({ ...user, liked_by: user.liked_by?.filter(id => id !== DEMO_USER_ID) || [] });
+                setUser({ ...user, likes: Math.max(0, (user.likes || 0) - 1) });
                 toast.success("Unliked user");
             } else {
                 await api.post(`/api/v1/users/${user.id}/like`);
                 setIsLiked(true);
-                setUser({ ...user, liked_by: [...(user.liked_by || []), DEMO_USER_ID] });
+                setUser({ ...user, likes: (user.likes || 0) + 1 });
                 toast.success("Liked user!");
             }
         } catch (error) {
@@ -148,7 +151,7 @@ export default function Profile() {
                                 <div className="grid grid-cols-2 gap-4 pt-4">
                                     <div className="bg-white/5 rounded-lg p-3 text-center border border-white/5">
                                         <div className="text-primary mb-1 flex justify-center"><ThumbsUp size={18} /></div>
-                                        <div className="text-2xl font-bold font-rajdhani">{user.liked_by?.length || 0}</div>
+                                        <div className="text-2xl font-bold font-rajdhani">{user.likes || 0}</div>
                                         <div className="text-[10px] text-muted-foreground uppercase tracking-wider">Likes Received</div>
                                     </div>
                                     <div className="bg-white/5 rounded-lg p-3 text-center border border-white/5">
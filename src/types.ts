@@ -5,9 +5,16 @@ export interface User {
     age: number;
     interests: string[];
     location: string;
+    likes?: number;  // likes received
+    /** @deprecated page /users/{id}/liked_by instead */
     liked_by?: string[];
 }
 
+export interface LikePage {
+    total: number;
+    user_ids: string[];
+}
+
 export interface Group {
     id: string;
     name: string;
@@ -1,41 +1,61 @@
+import os
+import zlib
+import numpy as np
 import pytest
 from typing import Generator
 from fastapi.testclient import TestClient
-from app.main import app
-from app.data import storage
-
-# --- Mock Storage ---
-# We will replace the storage functions to use an in-memory dict
-mock_db = {"users": [], "groups": []}
 
-def mock_load_db():
-    return mock_db
+# Never load the real model in the background during tests
+os.environ["RECOMMENDER_WARMUP"] = "0"
 
-def mock_save_db(data):
-    global mock_db
-    mock_db = data
+from app.main import app
+from app.data import storage
+from app.services import embeddings
 
 @pytest.fixture(autouse=True)
-def reset_db():
-    """Reset the mock database before each test."""
-    global mock_db
-    mock_db = {"users": [], "groups": []}
-    
-    # Patch the real storage functions
-    original_load = storage.load_db
-    original_save = storage.save_db
-    
-    storage.load_db = mock_load_db
-    storage.save_db = mock_save_db
-    
+def reset_db(tmp_path, monkeypatch):
+    """Point storage at a fresh database file before each test."""
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "db.json"))
+    storage.reset_store()
+
     yield
-    
-    # Restore (though pytest teardown usually handles process isolation, 
-    # it's good practice for local runs)
-    storage.load_db = original_load
-    storage.save_db = original_save
+
+    storage.reset_store()
 
 @pytest.fixture(scope="module")
 def client() -> Generator:
     with TestClient(app) as c:
         yield c
+
+class FakeModel:
+    """
+    Stand-in for the SentenceTransformer: a hashed bag of words, so texts
+    sharing words are similar. Counts encode calls and encoded texts.
+    """
+    dim = 64
+
+    def __init__(self):
+        self.calls = 0
+        self.encoded = []
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.calls += 1
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors[0] if single else vectors
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Replace the embedding model with FakeModel and start from an empty cache."""
+    model = FakeModel()
+    monkeypatch.setattr(embeddings, "_model", model)
+    embeddings.cache.clear()
+    yield model
+    embeddings.cache.clear()
@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+from app.services.ann import BackgroundIVF, IVFIndex
+
+def _clustered(n, dim=32, clusters=20, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def test_full_probe_is_exact_and_recall_grows_with_nprobe():
+    vectors = _clustered(4000)
+    ivf = IVFIndex(nlist=64)
+    ivf.train(vectors)
+
+    query = vectors[:1]
+    exact_top = set(np.argsort(-(vectors @ query[0]))[:20].tolist())
+
+    all_rows = ivf.search(query, nprobe=64)
+    assert sorted(all_rows.tolist()) == list(range(4000))
+
+    def recall(nprobe):
+        rows = ivf.search(query, nprobe)
+        top = rows[np.argsort(-(vectors[rows] @ query[0]))[:20]]
+        return len(exact_top & set(top.tolist())) / 20
+
+    assert recall(1) <= recall(8) <= recall(64) == 1.0
+    assert len(ivf.search(query, nprobe=1)) < 4000
+
+def test_added_rows_are_searchable():
+    vectors = _clustered(500)
+    ivf = IVFIndex(nlist=16)
+    ivf.train(vectors[:400])
+    ivf.add(np.arange(400, 500), vectors[400:])
+
+    assert 450 in ivf.search(vectors[450:451], nprobe=1).tolist()
+
+def test_background_training_serves_stale_index_until_retrained():
+    vectors = _clustered(4000)
+    lock = threading.RLock()
+    n = [1000]
+    ivf = BackgroundIVF(lock, lambda: vectors[: n[0]])
+
+    with lock:
+        assert ivf.get(2000) is None and ivf._thread is None  # too small
+        assert ivf.get(500) is None  # training started, exact until ready
+        n[0] = 1200  # rows appended while it trains
+        ivf.add(1000, vectors[1000:1200])
+    ivf.wait()
+    first = ivf.get(500)
+    assert first.trained_rows == 1000
+    assert sorted(first.search(vectors[:1], first.nlist).tolist()) == list(range(1200))
+
+    with lock:
+        n[0] = 2500  # doubled: keep serving the old index, retrain behind it
+        ivf.add(1200, vectors[1200:2500])
+        assert ivf.get(500) is first
+    ivf.wait()
+    assert ivf.get(500).trained_rows == 2500
+
+    with lock:
+        ivf.reset()
+        assert ivf.get(500) is None
+        ivf.reset()  # e.g. a compaction while training: that result is dropped
+    ivf.wait()
+    assert not ivf.ready
@@ -0,0 +1,84 @@
+import random
+import time
+
+from app.data import storage
+from app.services import batch_recommendations, recommendation
+
+WORDS = ["hiking", "coffee", "chess", "yoga", "board games", "running", "film"]
+
+def _populate(n_users=150, n_groups=60, seed=7):
+    rng = random.Random(seed)
+    users = [
+        {"id": f"u{i}", "name": f"U{i}", "email": f"u{i}@example.com", "age": rng.randint(16, 60),
+         "location": rng.choice(["Central", "East"]), "interests": rng.sample(WORDS, rng.randint(0, 3)), "liked_by": []}
+        for i in range(n_users)
+    ]
+    groups = [
+        {"id": f"g{i}", "name": f"G{i}", "description": "D", "activity": rng.sample(WORDS, rng.randint(0, 2)),
+         "location": rng.choice(["central", "East", "West"]), "age_group": rng.choice(["All Ages", "18-25", "30+"]),
+         "max_members": rng.randint(2, 6), "admin_id": "u0", "members": [f"u{j}" for j in rng.sample(range(n_users), 2)]}
+        for i in range(n_groups)
+    ]
+    for user in users:
+        storage.add_item("users", user)
+    for group in groups:
+        storage.add_item("groups", group)
+    return users, groups
+
+def _online(user, groups, limit):
+    return [
+        {"group_id": g["id"], **g["score_breakdown"]}
+        for g in recommendation.get_recommended_groups(user, groups, limit)
+    ]
+
+def test_batch_matches_online_scoring(fake_model):
+    users, groups = _populate()
+
+    results = dict(batch_recommendations.compute(users, groups, top_k=10, workers=1))
+
+    assert len(results) == len(users)
+    for user in users:
+        assert results[user["id"]] == _online(user, groups, 10)
+
+def test_batch_process_pool_matches_in_process(fake_model):
+    users, groups = _populate()
+
+    pooled = list(batch_recommendations.compute(users, groups, top_k=5, workers=2))
+    inline = list(batch_recommendations.compute(users, groups, top_k=5, workers=1))
+    assert pooled == inline
+
+def test_endpoint_serves_fresh_precomputed_list(client, fake_model, monkeypatch):
+    users, groups = _populate(n_users=10, n_groups=20)
+    assert batch_recommendations.run(top_k=5, workers=1) == 10
+    expected = _online(users[3], groups, 5)
+
+    def online(*args):
+        raise AssertionError("should not score online")
+    monkeypatch.setattr(recommendation, "recommend_groups", online)
+    res = client.get("/api/v1/groups/recommended?limit=5", headers={"X-User-ID": "u3"})
+    assert res.status_code == 200
+    assert [{"group_id": g["id"], **g["score_breakdown"]} for g in res.json()] == expected
+
+def test_stale_or_short_lists_fall_back_to_online(fake_model, monkeypatch):
+    users, groups = _populate(n_users=10, n_groups=20)
+    batch_recommendations.run(top_k=3, workers=1)
+    user = storage.get_item_by_id("users", "u3")
+
+    assert len(batch_recommendations.get_fresh(user, 3)) == 3
+    # More than the stored top-k
+    assert batch_recommendations.get_fresh(user, 4) is None
+    # Expired
+    monkeypatch.setattr(batch_recommendations, "TTL_SECONDS", 0)
+    time.sleep(0.01)
+    assert batch_recommendations.get_fresh(user, 3) is None
+
+def test_precomputed_list_skips_joined_groups(fake_model):
+    users, groups = _populate(n_users=10, n_groups=20)
+    batch_recommendations.run(top_k=20, workers=1)
+    user = storage.get_item_by_id("users", "u3")
+    first = batch_recommendations.get_fresh(user, 20)[0]["id"]
+
+    with storage.transaction("groups", first) as group:
+        group["members"].append("u3")
+
+    assert first not in [g["id"] for g in batch_recommendations.get_fresh(user, 20)]
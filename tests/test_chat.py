@@ -0,0 +1,173 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from app.data import storage
+from app.services import messages, pubsub
+from app.api.v1.endpoints import websocket_chat
+
+def test_message_history_pages(client: TestClient):
+    user = client.post(
+        "/api/v1/users/", json={"name": "Ann", "email": "ann@example.com", "age": 30, "location": "City"}
+    ).json()["id"]
+    group = client.post(
+        "/api/v1/groups/",
+        headers={"X-User-ID": user},
+        json={"name": "G", "description": "D", "activity": [], "location": "City", "max_members": 5},
+    ).json()["id"]
+    posted = [
+        client.post(f"/api/v1/groups/{group}/messages", headers={"X-User-ID": user}, json={"message": f"hi {i}"}).json()
+        for i in range(5)
+    ]
+    ids = [m["id"] for m in posted]
+    url = f"/api/v1/groups/{group}/messages"
+
+    assert [m["id"] for m in client.get(url).json()] == ids
+    assert [m["id"] for m in client.get(url, params={"limit": 2}).json()] == ids[3:]
+    assert [m["id"] for m in client.get(url, params={"before": ids[3], "limit": 2}).json()] == ids[1:3]
+    assert [m["id"] for m in client.get(url, params={"after": ids[3]}).json()] == ids[4:]
+    assert client.get(url, params={"before": "missing"}).status_code == 400
+
+def _setup(client: TestClient):
+    user = client.post(
+        "/api/v1/users/", json={"name": "Ben", "email": "ben@example.com", "age": 30, "location": "City"}
+    ).json()["id"]
+    group = client.post(
+        "/api/v1/groups/",
+        headers={"X-User-ID": user},
+        json={"name": "G", "description": "D", "activity": [], "location": "City", "max_members": 5},
+    ).json()["id"]
+    return user, group
+
+def test_websocket_messages_are_persisted_and_replayed(client: TestClient):
+    user, group = _setup(client)
+    with client.websocket_connect(f"/api/v1/ws/groups/{group}") as ws:
+        ws.send_json({"user_id": user, "user_name": "Ben", "message": "hello"})
+        sent = ws.receive_json()
+        assert sent["type"] == "message" and sent["data"]["message"] == "hello"
+
+        # REST posts reach connected sockets too
+        client.post(f"/api/v1/groups/{group}/messages", headers={"X-User-ID": user}, json={"message": "from rest"})
+        assert ws.receive_json()["data"]["message"] == "from rest"
+
+    messages.writer.flush()
+    stored = client.get(f"/api/v1/groups/{group}/messages").json()
+    assert [m["message"] for m in stored] == ["hello", "from rest"]
+
+    with client.websocket_connect(f"/api/v1/ws/groups/{group}") as ws:
+        history = ws.receive_json()
+        assert history["type"] == "history"
+        assert [m["id"] for m in history["messages"]] == [m["id"] for m in stored]
+
+def test_websocket_checks_sender_and_message(client: TestClient):
+    user, group = _setup(client)
+    outsider = client.post(
+        "/api/v1/users/", json={"name": "Cid", "email": "cid@example.com", "age": 30, "location": "City"}
+    ).json()["id"]
+    with client.websocket_connect(f"/api/v1/ws/groups/{group}") as ws:
+        for frame, detail in [
+            ({"user_id": "missing", "message": "hi"}, "User not found"),
+            ({"user_id": outsider, "message": "hi"}, "User is not a member of this group"),
+            ({"user_id": user, "message": None}, "Message must be a non-empty string"),
+            ({"user_id": user, "message": 42}, "Message must be a non-empty string"),
+            ({"user_id": user, "message": "  "}, "Message must be a non-empty string"),
+            (["not", "an", "object"], "Expected a JSON object"),
+        ]:
+            ws.send_json(frame)
+            assert ws.receive_json() == {"type": "error", "detail": detail}
+
+        # The sender's name comes from their profile, not the frame
+        ws.send_json({"user_id": user, "user_name": "Mallory", "message": "hello"})
+        assert ws.receive_json()["data"]["user_name"] == "Ben"
+
+    messages.writer.flush()
+    assert [m["message"] for m in client.get(f"/api/v1/groups/{group}/messages").json()] == ["hello"]
+
+def test_websocket_rejects_unknown_group(client: TestClient):
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/api/v1/ws/groups/missing") as ws:
+            ws.receive_json()
+
+def test_history_cache_is_bounded_and_loaded_from_storage():
+    for i in range(5):
+        storage.add_item("messages", {"id": f"m{i}", "group_id": "g1", "timestamp": f"2024-01-01T00:00:0{i}"})
+    cache = messages.HistoryCache(size=3)
+
+    assert [m["id"] for m in cache.recent("g1")] == ["m2", "m3", "m4"]
+    cache.append({"id": "m5", "group_id": "g1"})
+    cache.append({"id": "m5", "group_id": "g1"})
+    assert [m["id"] for m in cache.recent("g1")] == ["m3", "m4", "m5"]
+
+class FakeSocket:
+    """Records frames; while `blocked` is set, sends wait (a slow client)."""
+
+    def __init__(self, blocked: bool = False):
+        self.frames = []
+        self.closed = None
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        await self.gate.wait()
+        self.frames.append(json.loads(frame))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+def test_slow_consumer_is_downgraded_then_closed(monkeypatch):
+    monkeypatch.setattr(websocket_chat, "OUTBOUND_QUEUE", 2)
+    monkeypatch.setattr(websocket_chat, "MAX_MISSED", 5)
+    monkeypatch.setattr(messages.history, "recent", lambda group_id: [])
+
+    async def scenario():
+        manager = websocket_chat.ConnectionManager(pubsub.InProcessPubSub())
+        fast, slow, stuck = FakeSocket(), FakeSocket(blocked=True), FakeSocket(blocked=True)
+        for ws in (fast, slow, stuck):
+            await manager.connect(ws, "g1")
+
+        async def send(n):
+            for i in range(n):
+                await manager.broadcast({"id": f"m{i}"}, "g1")
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.01)
+
+        # Stuck's first frame is in flight, two wait in its queue; the rest are skipped
+        await send(4)
+        slow.gate.set()
+        await asyncio.sleep(0.01)
+        await send(6)
+        return manager, fast, slow, stuck
+
+    manager, fast, slow, stuck = asyncio.run(scenario())
+
+    assert [f["data"]["id"] for f in fast.frames] == [f"m{i}" for i in range(4)] + [f"m{i}" for i in range(6)]
+    # The slow client got what fit in its queue, then a resync pointing at the gap
+    assert slow.frames[3] == {"type": "resync", "missed": 1, "after": "m2"}
+    assert len(slow.frames) == 4 + 6
+    # The stuck one missed too many and was closed
+    assert stuck.closed == 1013
+    assert list(manager.active_connections["g1"]) == [fast, slow]
+    stats = manager.stats.as_dict()
+    assert stats["broadcasts"] == 10 and stats["resyncs"] == 1 and stats["slow_disconnects"] == 1
+
+def test_writer_commits_concurrent_messages_together():
+    writer = messages.MessageWriter(batch_size=100, linger=0.2)
+    futures = [writer.submit(messages.new_message("g1", "u1", "Ann", f"m{i}")) for i in range(10)]
+    # A duplicate id only fails its own submit
+    futures += [writer.submit({"id": "dup", "group_id": "g1"}) for _ in range(2)]
+    for future in futures[:-1]:
+        assert future.result(timeout=5) is None
+    with pytest.raises(storage.DuplicateKeyError):
+        futures[-1].result(timeout=5)
+    writer.close()
+
+    assert len(storage.find_by("messages", "group_id", "g1")) == 11
+    stats = writer.stats.as_dict()
+    assert stats["messages"] == 12 and stats["failed"] == 1
+    # One batch for everything that arrived within the linger time
+    assert stats["batches"] == 1 and stats["max_batch"] == 12
@@ -0,0 +1,69 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import BackgroundTasks, HTTPException
+from app.api.v1.endpoints import groups, users
+from app.data import storage
+from app.services import likes
+
+N_USERS = 300
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(storage, "SQLITE_PATH", str(tmp_path / "db.sqlite3"))
+    storage.reset_store()
+    for i in range(N_USERS):
+        storage.add_item("users", {"id": f"u{i}", "name": f"User {i}", "email": f"u{i}@example.com", "liked_by": []})
+    yield request.param
+    storage.reset_store()
+
+def _run_all(fn, args):
+    """Runs fn(*a) for every a on a thread pool; returns the number of successes."""
+    def attempt(a):
+        try:
+            fn(*a)
+            return True
+        except HTTPException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        return sum(pool.map(attempt, args))
+
+def test_concurrent_joins_respect_max_members(backend):
+    storage.add_item("groups", {"id": "g1", "admin_id": "u0", "members": ["u0"], "max_members": 50})
+    assert [g["id"] for g in storage.open_groups()] == ["g1"]
+
+    joined = _run_all(lambda uid: groups.join_group("g1", BackgroundTasks(), x_user_id=uid), [(f"u{i}",) for i in range(1, N_USERS)])
+
+    members = storage.get_item_by_id("groups", "g1")["members"]
+    assert joined == 49
+    assert len(members) == 50
+    assert len(set(members)) == 50
+    assert storage.open_groups() == []
+
+def test_concurrent_likes_are_not_lost(backend):
+    liked = _run_all(lambda uid: users.like_user("u0", x_user_id=uid), [(f"u{i}",) for i in range(1, N_USERS)])
+    # Every actor likes twice; the second like is a no-op
+    _run_all(lambda uid: users.like_user("u0", x_user_id=uid), [(f"u{i}",) for i in range(1, N_USERS)])
+
+    liked_by = likes.liked_by("u0")
+    assert liked == N_USERS - 1
+    assert sorted(liked_by) == sorted(f"u{i}" for i in range(1, N_USERS))
+    assert likes.counts("u0")["received"] == N_USERS - 1
+    assert all(likes.counts(f"u{i}")["given"] == 1 for i in range(1, N_USERS))
+
+def test_concurrent_join_and_leave(backend):
+    storage.add_item("groups", {"id": "g1", "admin_id": "u0", "members": ["u0"], "max_members": N_USERS})
+    storage.open_groups()  # build the index so every write below maintains it
+    _run_all(lambda uid: groups.join_group("g1", BackgroundTasks(), x_user_id=uid), [(f"u{i}",) for i in range(1, N_USERS)])
+
+    # Odd users leave while even users like each other
+    leavers = [(f"u{i}",) for i in range(1, N_USERS, 2)]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        left = pool.submit(_run_all, lambda uid: groups.leave_group("g1", BackgroundTasks(), x_user_id=uid), leavers)
+        pool.submit(_run_all, lambda uid: users.like_user("u0", x_user_id=uid), [(f"u{i}",) for i in range(2, N_USERS, 2)])
+        assert left.result() == len(leavers)
+
+    members = storage.get_item_by_id("groups", "g1")["members"]
+    assert sorted(members) == sorted(f"u{i}" for i in range(0, N_USERS, 2))
+    assert storage._open_slots.remaining("g1") == N_USERS - len(members)
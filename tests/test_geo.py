@@ -0,0 +1,79 @@
+import random
+import numpy as np
+from app.services import batch_recommendations, geo, recommendation
+
+def _points(n, seed=5):
+    # Spread over roughly Singapore
+    rng = random.Random(seed)
+    return {f"p{i}": (rng.uniform(1.25, 1.45), rng.uniform(103.65, 104.0)) for i in range(n)}
+
+def _brute_force(points, lat, lon):
+    keys = list(points)
+    coords = np.array([points[k] for k in keys])
+    distances = geo.haversine_km(lat, lon, coords[:, 0], coords[:, 1])
+    return sorted(zip(keys, distances.tolist()), key=lambda pair: pair[1])
+
+def test_grid_radius_and_nearest_match_brute_force():
+    points = _points(2000)
+    grid = geo.GeoIndex()
+    for key, (lat, lon) in points.items():
+        grid.add(key, lat, lon)
+
+    for lat, lon in [(1.30, 103.85), (1.44, 103.66), (1.0, 103.0)]:
+        expected = _brute_force(points, lat, lon)
+        assert [k for k, _ in grid.within(lat, lon, 3.0)] == [k for k, d in expected if d <= 3.0]
+        assert [k for k, _ in grid.nearest(lat, lon, 15)] == [k for k, _ in expected[:15]]
+
+    grid.remove("p0")
+    assert "p0" not in [k for k, _ in grid.nearest(*points["p0"], 1)]
+    assert len(grid) == 1999
+
+def test_location_score_decays_with_distance():
+    names = np.array(["central", "east", "east"], dtype=object)
+    lats = np.array([1.30, np.nan, 1.30 + 5 / 111.2])
+    lons = np.array([103.85, np.nan, 103.85])
+
+    scores = recommendation.location_scores("Central", (1.30, 103.85), names, lats, lons)
+    # Same point: full 50; no coordinates: name match only; 5 km away: halved
+    assert scores.tolist() == [50, 0, 25]
+    # Without user coordinates only names count
+    assert recommendation.location_scores("East", None, names, lats, lons).tolist() == [0, 50, 50]
+
+def test_batch_matches_online_with_coordinates(fake_model):
+    rng = random.Random(2)
+    points = list(_points(40).values())
+    users = [
+        {"id": f"u{i}", "age": 30, "location": "Central", "interests": ["hiking"],
+         **({"latitude": points[i][0], "longitude": points[i][1]} if i % 2 else {})}
+        for i in range(10)
+    ]
+    groups = [
+        {"id": f"g{i}", "activity": ["hiking"], "location": rng.choice(["Central", "East"]), "members": [],
+         "max_members": 5, **({"latitude": points[10 + i][0], "longitude": points[10 + i][1]} if i % 3 else {})}
+        for i in range(30)
+    ]
+    results = dict(batch_recommendations.compute(users, groups, top_k=10, workers=1))
+    for user in users:
+        online = recommendation.get_recommended_groups(user, groups, 10)
+        assert results[user["id"]] == [{"group_id": g["id"], **g["score_breakdown"]} for g in online]
+
+def test_nearby_endpoint(client):
+    admin = client.post(
+        "/api/v1/users/",
+        json={"name": "A", "email": "a@example.com", "age": 30, "location": "Central", "latitude": 1.30, "longitude": 103.85},
+    ).json()["id"]
+    for name, lat, lon in [("Far", 1.44, 103.70), ("Near", 1.301, 103.851), ("Mid", 1.32, 103.85), ("Nowhere", None, None)]:
+        body = {"name": name, "description": "D", "activity": [], "location": "L", "max_members": 3}
+        if lat is not None:
+            body.update(latitude=lat, longitude=lon)
+        assert client.post("/api/v1/groups/", headers={"X-User-ID": admin}, json=body).status_code == 201
+
+    res = client.get("/api/v1/groups/nearby", params={"lat": 1.30, "lon": 103.85, "limit": 2})
+    assert [g["name"] for g in res.json()] == ["Near", "Mid"]
+    assert res.json()[0]["distance_km"] < 0.2
+
+    res = client.get("/api/v1/groups/nearby", params={"radius_km": 5}, headers={"X-User-ID": admin})
+    assert [g["name"] for g in res.json()] == ["Near", "Mid"]
+
+    assert client.get("/api/v1/groups/nearby").status_code == 400
+    assert client.get("/api/v1/groups/nearby", params={"lat": 95, "lon": 0}).status_code == 422
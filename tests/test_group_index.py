@@ -0,0 +1,73 @@
+import numpy as np
+from app.data import storage
+from app.services import group_index, recommendation
+from app.services.embeddings import embed
+
+def _group(group_id, activity):
+    return {
+        "id": group_id, "name": group_id, "description": "D", "activity": activity,
+        "location": "L", "members": [], "max_members": 5, "admin_id": "admin",
+    }
+
+def test_index_matches_on_the_fly_scores(fake_model):
+    groups = [_group("g1", ["Hiking", "Nature"]), _group("g2", ["Coffee"]), _group("g3", [])]
+    for g in groups:
+        storage.add_item("groups", g)
+    index = group_index.GroupEmbeddingIndex()
+
+    interests = embed(["hiking", "coffee tasting"])
+    scores, found = index.semantic_scores(interests, ["g1", "g2", "g3", "unknown"])
+
+    assert found.tolist() == [True, True, False, False]
+    expected = recommendation._score_activities(interests, groups)
+    assert scores[:3].tolist() == expected.tolist()
+
+def test_recommendations_only_encode_user_interests(fake_model):
+    for i in range(5):
+        storage.add_item("groups", _group(f"g{i}", [f"activity {i}", "shared"]))
+    group_index.index.rebuild()
+    user = {"id": "u1", "interests": ["shared hobby"], "location": "L", "age": 30}
+
+    fake_model.encoded.clear()
+    recommendation.get_recommended_groups(user, storage.get_all("groups"))
+    assert fake_model.encoded == ["shared hobby"]
+
+def test_incremental_add_and_remove(fake_model):
+    index = group_index.GroupEmbeddingIndex()
+    index.rebuild([])
+    for i in range(20):
+        index.add_group(_group(f"g{i}", ["a", f"tag{i}"]))
+    assert len(index) == 20
+
+    for i in range(0, 20, 2):
+        index.remove_group(f"g{i}")
+    assert "g0" not in index and "g1" in index
+
+    interests = embed(["tag5"])
+    scores, found = index.semantic_scores(interests, [f"g{i}" for i in range(20)])
+    assert found.tolist() == [i % 2 == 1 for i in range(20)]
+    assert scores[5] == 100 or scores[5] == 99
+    assert np.all(scores[[i for i in range(20) if i % 2 == 0]] == 0)
+
+def test_two_stage_recommendations_use_ann(fake_model, monkeypatch, client):
+    monkeypatch.setattr(group_index, "ANN_MIN_ROWS", 50)
+    res = client.post(
+        "/api/v1/users/",
+        json={"name": "A", "email": "a@example.com", "age": 30, "location": "L", "interests": ["rock climbing"]}
+    )
+    user_id = res.json()["id"]
+    for i in range(200):
+        storage.add_item("groups", _group(f"g{i}", [f"topic{i}", f"theme{i % 7}"]))
+    storage.add_item("groups", _group("climb", ["rock climbing"]))
+
+    # Exhaustive probing finds the exact match first
+    res = client.get("/api/v1/groups/recommended", params={"limit": 3, "nprobe": 10_000}, headers={"X-User-ID": user_id})
+    assert res.status_code == 200
+    assert res.json()[0]["id"] == "climb"
+    # Trained in the background; the first request was scored exactly
+    group_index.index._ivf.wait()
+    assert group_index.index._ivf.ready
+    res = client.get("/api/v1/groups/recommended", params={"limit": 3, "nprobe": 10_000}, headers={"X-User-ID": user_id})
+    assert res.json()[0]["id"] == "climb"
+
+    assert client.get("/api/v1/groups/recommended", params={"nprobe": 0}, headers={"X-User-ID": user_id}).status_code == 422
@@ -0,0 +1,127 @@
+import random
+import pytest
+from app.data import storage
+from app.models.group import Group
+from app.services import group_search, recommendation
+
+ACTIVITIES = ["Hiking", "Coffee", "Chess", "Yoga", "Board Games"]
+
+@pytest.fixture
+def groups():
+    rng = random.Random(3)
+    groups = [
+        {"id": f"g{i}", "name": f"G{i}", "description": "D", "activity": rng.sample(ACTIVITIES, rng.randint(0, 3)),
+         "location": rng.choice(["Central", "central ", "East", "West"]),
+         "age_group": rng.choice(["All Ages", "18-25", "21+", "40+", "30", "unknown"]),
+         "max_members": 5, "admin_id": "admin", "members": []}
+        for i in range(300)
+    ]
+    for g in groups:
+        storage.add_item("groups", g)
+    return groups
+
+def _expected(groups, activities=(), location=None, age=None):
+    return [
+        g["id"] for g in groups
+        if all(a.lower() in [t.lower() for t in g["activity"]] for a in activities)
+        and (location is None or g["location"].strip().lower() == location.lower())
+        and (age is None or _string_is_age_in_range(age, g["age_group"]))
+    ]
+
+def _all_pages(client, params, limit=7):
+    ids, cursor = [], None
+    while True:
+        query = dict(params, limit=limit, **({"cursor": cursor} if cursor else {}))
+        page = client.get("/api/v1/groups/search", params=query).json()
+        assert len(page["items"]) <= limit
+        ids += [g["id"] for g in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+@pytest.mark.parametrize("query", [
+    {},
+    {"activity": ["hiking"]},
+    {"activity": ["Hiking", "COFFEE"]},
+    {"location": "central"},
+    {"age": 22},
+    {"age": 30, "location": "West"},
+    {"activity": ["chess"], "location": "East", "age": 45},
+    {"activity": ["surfing"]},
+])
+def test_search_matches_brute_force(client, groups, query):
+    group_search.index.rebuild()
+    expected = _expected(groups, query.get("activity", ()), query.get("location"), query.get("age"))
+    assert _all_pages(client, query) == expected
+
+def test_search_follows_creates_and_deletes(client, groups):
+    admin = client.post(
+        "/api/v1/users/", json={"name": "A", "email": "a@example.com", "age": 30, "location": "L"}
+    ).json()["id"]
+    client.get("/api/v1/groups/search", params={"activity": "surfing"})  # builds the index
+
+    created = client.post(
+        "/api/v1/groups/", headers={"X-User-ID": admin},
+        json={"name": "Surf", "description": "D", "activity": ["Surfing"], "location": "East", "max_members": 4},
+    ).json()
+    page = client.get("/api/v1/groups/search", params={"activity": "surfing", "location": "east"}).json()
+    assert [g["id"] for g in page["items"]] == [created["id"]]
+
+    client.delete(f"/api/v1/groups/{created['id']}", headers={"X-User-ID": admin})
+    assert client.get("/api/v1/groups/search", params={"activity": "surfing"}).json()["items"] == []
+    assert len(_all_pages(client, {}, limit=100)) == len(groups)
+
+def test_cursor_survives_rebuild_and_deleted_groups(client, groups):
+    expected = _expected(groups, ["hiking"])
+    first = client.get("/api/v1/groups/search", params={"activity": "hiking", "limit": 10}).json()
+    assert [g["id"] for g in first["items"]] == expected[:10]
+
+    # Groups before the cursor go away and the index is renumbered
+    for group_id in expected[:3] + [groups[0]["id"], expected[9]]:
+        group_search.index.remove_group(group_id)
+        storage.delete_item("groups", group_id)
+    group_search.index.rebuild()
+
+    rest = _all_pages(client, {"activity": "hiking", "cursor": first["next_cursor"]})
+    assert rest == expected[10:]
+
+def test_search_rejects_bad_cursor(client):
+    assert client.get("/api/v1/groups/search", params={"cursor": "abc"}).status_code == 400
+
+def _string_is_age_in_range(user_age, age_group_str):
+    """is_age_in_range as it was before age groups were pre-parsed."""
+    if not age_group_str or age_group_str == "All Ages":
+        return True
+    try:
+        if "+" in age_group_str:
+            return user_age >= int(age_group_str.replace("+", "").strip())
+        if "-" in age_group_str:
+            parts = age_group_str.split("-")
+            return int(parts[0].strip()) <= user_age <= int(parts[1].strip())
+        return str(user_age) == age_group_str
+    except ValueError:
+        return False
+
+AGE_GROUPS = ["All Ages", "", "21+", "18-25", " 18 - 25 ", "30", "030", "abc", "-5", "40+ ", "+"]
+
+def test_parsed_age_groups_match_string_parsing():
+    groups = [Group(name="G", description="D", activity=[], location="L", max_members=3, admin_id="a", age_group=text).dict()
+              for text in AGE_GROUPS]
+    for age in range(0, 90):
+        expected = [_string_is_age_in_range(age, text) for text in AGE_GROUPS]
+        assert [recommendation.is_age_in_range(age, text) for text in AGE_GROUPS] == expected
+        assert recommendation.age_eligible(groups, age).tolist() == expected
+        # Legacy groups without age_min/age_max
+        legacy = [{"age_group": text} for text in AGE_GROUPS]
+        assert recommendation.age_eligible(legacy, age).tolist() == expected
+
+def test_created_groups_store_parsed_age_range(client):
+    admin = client.post(
+        "/api/v1/users/", json={"name": "A", "email": "a@example.com", "age": 30, "location": "L"}
+    ).json()["id"]
+    res = client.post(
+        "/api/v1/groups/", headers={"X-User-ID": admin},
+        json={"name": "G", "description": "D", "activity": [], "location": "L", "max_members": 4, "age_group": "21+"},
+    )
+    stored = storage.get_item_by_id("groups", res.json()["id"])
+    assert (stored["age_min"], stored["age_max"]) == (21, None)
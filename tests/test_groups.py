@@ -1,5 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
+from app.data import storage
 
 @pytest.fixture
 def admin_user(client: TestClient):
@@ -56,6 +57,25 @@ def test_join_group(client: TestClient, admin_user, other_user):
     assert join_res.status_code == 200
     assert other_user in join_res.json()["members"]
 
+def test_join_group_deleted_meanwhile(client: TestClient, admin_user, other_user, monkeypatch):
+    g_res = client.post(
+        "/api/v1/groups/",
+        headers={"X-User-ID": admin_user},
+        json={"name": "Group 1", "description": "D", "activity": ["A"], "location": "L", "max_members": 2}
+    )
+    group_id = g_res.json()["id"]
+
+    # The group goes away while the join holds its lock
+    get_item_by_id = storage.get_item_by_id
+    def delete_then_get(collection, item_id):
+        if collection == "users":
+            storage.delete_items("groups", [group_id])
+        return get_item_by_id(collection, item_id)
+    monkeypatch.setattr(storage, "get_item_by_id", delete_then_get)
+
+    join_res = client.post(f"/api/v1/groups/{group_id}/join", headers={"X-User-ID": other_user})
+    assert join_res.status_code == 404
+
 def test_join_full_group(client: TestClient, admin_user, other_user):
     # Create group with max 1 Member (the admin)
     g_res = client.post(
@@ -132,3 +152,39 @@ def test_get_groups_looking_for_members(client: TestClient, admin_user):
     # Only "Open" group should be returned
     assert len(data) == 1
     assert data[0]["name"] == "Open"
+
+def _not_full(client, user, **params):
+    res = client.get("/api/v1/groups/groups_not_full", headers={"X-User-ID": user}, params=params)
+    assert res.status_code == 200
+    return [g["name"] for g in res.json()]
+
+def test_groups_not_full_pages_and_follows_membership(client: TestClient, admin_user, other_user):
+    # G0..G9 with capacities 1..3; those with max_members 1 are full (admin only)
+    ids = []
+    for i in range(10):
+        res = client.post(
+            "/api/v1/groups/",
+            headers={"X-User-ID": admin_user},
+            json={"name": f"G{i}", "description": "D", "activity": ["A"], "location": "L", "max_members": i % 3 + 1}
+        )
+        ids.append(res.json()["id"])
+    open_names = [f"G{i}" for i in range(10) if i % 3 != 0]
+
+    # Pages are full-length and cover every open group exactly once
+    pages = [_not_full(client, admin_user, skip=skip, limit=4) for skip in (0, 4, 8)]
+    assert [len(p) for p in pages] == [4, 2, 0]
+    assert sum(pages, []) == open_names
+
+    # Filling G1 (1/2) hides it, leaving reopens it in its original place
+    client.post(f"/api/v1/groups/{ids[1]}/join", headers={"X-User-ID": other_user})
+    assert "G1" not in _not_full(client, admin_user)
+    client.post(f"/api/v1/groups/{ids[1]}/leave", headers={"X-User-ID": other_user})
+    assert _not_full(client, admin_user) == open_names
+
+    client.delete(f"/api/v1/groups/{ids[2]}", headers={"X-User-ID": admin_user})
+    assert "G2" not in _not_full(client, admin_user)
+
+    # Closest to full first: 1 slot left (G1, G4, G7), then 2 slots (G5, G8)
+    assert _not_full(client, admin_user, sort="fewest_slots") == ["G1", "G4", "G7", "G5", "G8"]
+    assert _not_full(client, admin_user, sort="fewest_slots", skip=2, limit=2) == ["G7", "G5"]
+    assert _not_full(client, admin_user, max_slots=1) == ["G1", "G4", "G7"]
@@ -0,0 +1,91 @@
+from app.data import storage
+from app.services import batch_recommendations, recommendation
+from tests.test_batch_recommendations import _populate
+
+LIMIT = 5
+
+def _assert_lists_consistent():
+    """Every list still served must equal what online scoring returns now."""
+    served = 0
+    groups = storage.get_all("groups")
+    for user in storage.get_all("users"):
+        fresh = batch_recommendations.get_fresh(user, LIMIT)
+        if fresh is None:
+            continue
+        served += 1
+        online = recommendation.get_recommended_groups(user, groups, LIMIT)
+        assert [(g["id"], g["relevance_score"]) for g in fresh] == [(g["id"], g["relevance_score"]) for g in online]
+    return served
+
+def test_group_create_join_leave_delete_keep_lists_consistent(client, fake_model):
+    _populate(n_users=40, n_groups=30)
+    batch_recommendations.run(top_k=8, workers=1)
+    assert _assert_lists_consistent() == 40
+
+    res = client.post(
+        "/api/v1/groups/", headers={"X-User-ID": "u0"},
+        json={"name": "New", "description": "D", "activity": ["hiking", "yoga"], "location": "Central", "max_members": 3},
+    )
+    new_id = res.json()["id"]
+    assert any(
+        e["group_id"] == new_id for r in storage.get_all(batch_recommendations.COLLECTION) for e in r["groups"]
+    )
+    _assert_lists_consistent()
+
+    holders = [r["id"] for r in storage.get_all(batch_recommendations.COLLECTION) if any(e["group_id"] == new_id for e in r["groups"])]
+    joiner = next(uid for uid in holders if uid != "u0")
+    assert client.post(f"/api/v1/groups/{new_id}/join", headers={"X-User-ID": joiner}).status_code == 200
+    assert new_id not in [e["group_id"] for e in storage.get_item_by_id(batch_recommendations.COLLECTION, joiner)["groups"]]
+    _assert_lists_consistent()
+
+    assert client.post(f"/api/v1/groups/{new_id}/leave", headers={"X-User-ID": joiner}).status_code == 200
+    assert new_id in [e["group_id"] for e in storage.get_item_by_id(batch_recommendations.COLLECTION, joiner)["groups"]]
+    _assert_lists_consistent()
+
+    assert client.delete(f"/api/v1/groups/{new_id}", headers={"X-User-ID": "u0"}).status_code == 200
+    assert not any(
+        e["group_id"] == new_id for r in storage.get_all(batch_recommendations.COLLECTION) for e in r["groups"]
+    )
+    _assert_lists_consistent()
+
+def test_profile_change_rescores_only_that_user(client, fake_model):
+    _populate(n_users=10, n_groups=20)
+    batch_recommendations.run(top_k=5, workers=1)
+    before = {r["id"]: r for r in storage.get_all(batch_recommendations.COLLECTION)}
+
+    res = client.patch("/api/v1/users/u3", headers={"X-User-ID": "u3"}, json={"interests": ["chess"], "location": "West"})
+    assert res.status_code == 200
+    assert res.json()["interests"] == ["chess"]
+
+    after = {r["id"]: r for r in storage.get_all(batch_recommendations.COLLECTION)}
+    assert after["u3"]["computed_at"] > before["u3"]["computed_at"]
+    assert all(after[uid] == before[uid] for uid in before if uid != "u3")
+    _assert_lists_consistent()
+
+    # Changing an unrelated field doesn't touch the list
+    client.patch("/api/v1/users/u3", headers={"X-User-ID": "u3"}, json={"name": "Renamed"})
+    assert storage.get_item_by_id(batch_recommendations.COLLECTION, "u3") == after["u3"]
+
+def test_update_user_validation(client):
+    uid = client.post(
+        "/api/v1/users/", json={"name": "A", "email": "a@example.com", "age": 30, "location": "L"}
+    ).json()["id"]
+    client.post("/api/v1/users/", json={"name": "B", "email": "b@example.com", "age": 30, "location": "L"})
+
+    assert client.patch(f"/api/v1/users/{uid}", headers={"X-User-ID": "someone-else"}, json={"age": 31}).status_code == 403
+    assert client.patch(f"/api/v1/users/{uid}", headers={"X-User-ID": uid}, json={"email": "b@example.com"}).status_code == 400
+    assert client.patch("/api/v1/users/missing", headers={"X-User-ID": "missing"}, json={"age": 31}).status_code == 404
+
+def test_update_user_rejects_nulls(client):
+    uid = client.post(
+        "/api/v1/users/", json={"name": "A", "email": "a@example.com", "age": 30, "location": "L", "latitude": 1.0, "longitude": 2.0}
+    ).json()["id"]
+
+    assert client.patch(f"/api/v1/users/{uid}", headers={"X-User-ID": uid}, json={"name": None, "age": None}).status_code == 422
+    assert client.get(f"/api/v1/users/{uid}").json()["name"] == "A"
+
+    # Coordinates can be cleared
+    res = client.patch(f"/api/v1/users/{uid}", headers={"X-User-ID": uid}, json={"latitude": None, "longitude": None})
+    assert res.status_code == 200
+    assert res.json()["latitude"] is None
+    assert client.get("/api/v1/users/").status_code == 200
@@ -0,0 +1,95 @@
+from fastapi.testclient import TestClient
+from app.data import storage
+from app.services import likes
+
+def _add_users(n):
+    for i in range(n):
+        storage.add_item("users", {
+            "id": f"u{i}", "name": f"User {i}", "email": f"u{i}@example.com",
+            "age": 30, "interests": [], "location": "Town",
+        })
+
+def test_like_is_a_set_with_counters():
+    _add_users(3)
+    assert likes.like("u1", "u0")
+    assert not likes.like("u1", "u0")
+    assert likes.like("u2", "u0")
+    assert likes.like("u0", "u2")
+
+    assert likes.counts("u0") == {"received": 2, "given": 1}
+    assert likes.counts("u1") == {"received": 0, "given": 1}
+    assert likes.liked_by("u0") == ["u1", "u2"]
+    assert likes.likes_given("u0") == ["u2"]
+    assert likes.has_liked("u1", "u0") and not likes.has_liked("u0", "u1")
+
+    assert likes.unlike("u1", "u0")
+    assert not likes.unlike("u1", "u0")
+    assert likes.counts("u0") == {"received": 1, "given": 1}
+    assert likes.counts("u1") == {"received": 0, "given": 0}
+    assert likes.liked_by("u0") == ["u2"]
+
+def test_edge_ids_do_not_collide():
+    # "a->b" liking "c" and "a" liking "b->c" would share the id "a->b->c"
+    assert likes.like("a->b", "c")
+    assert likes.like("a", "b->c")
+    assert likes.counts("c")["received"] == 1 and likes.counts("b->c")["received"] == 1
+
+def test_edge_and_counters_are_one_journal_record():
+    likes.like("u1", "u0")
+    with open(storage.DB_PATH + ".journal", "rb") as f:
+        lines = f.read().splitlines()
+    assert sum(b'"user_likes"' in line for line in lines) == 1
+    assert all(b'"like_counts"' in line for line in lines if b'"user_likes"' in line)
+
+def test_legacy_liked_by_lists_move_into_the_graph_once():
+    _add_users(3)
+    storage.update_item("users", "u0", {"liked_by": ["u1", "u2"]})
+
+    assert likes.liked_by("u0") == ["u1", "u2"]
+    assert likes.counts("u0")["received"] == 2
+    assert likes.likes_given("u1") == ["u0"]
+    assert "liked_by" not in storage.get_item_by_id("users", "u0")
+
+    # Marked as done: later reloads don't scan the users again
+    storage.get_store().invalidate()
+    storage.update_item("users", "u1", {"liked_by": ["u2"]})
+    assert likes.liked_by("u1") == []
+
+def test_like_endpoints_page_both_directions(client: TestClient):
+    _add_users(30)
+    for i in range(1, 30):
+        assert client.post("/api/v1/users/u0/like", headers={"X-User-Id": f"u{i}"}).status_code == 200
+    response = client.post("/api/v1/users/u0/like", headers={"X-User-Id": "u1"})
+    assert response.status_code == 200
+    # Responses carry the count, plus the old list for older clients
+    assert response.json()["likes"] == 29
+    assert response.json()["liked_by"] == [f"u{i}" for i in range(1, 30)]
+    assert client.post("/api/v1/users/u0/like", headers={"X-User-Id": "u0"}).status_code == 400
+
+    assert client.get("/api/v1/users/u0/likes").json() == 29
+    page = client.get("/api/v1/users/u0/liked_by", params={"skip": 10, "limit": 5}).json()
+    assert page == {"total": 29, "user_ids": ["u11", "u12", "u13", "u14", "u15"]}
+    assert client.get("/api/v1/users/u3/likes_given").json() == {"total": 1, "user_ids": ["u0"]}
+    assert client.get("/api/v1/users/u3/likes_given/u0").json() is True
+
+    client.post("/api/v1/users/u0/unlike", headers={"X-User-Id": "u3"})
+    assert client.get("/api/v1/users/u3/likes_given").json() == {"total": 0, "user_ids": []}
+    assert client.get("/api/v1/users/u3/likes_given/u0").json() is False
+    assert client.get("/api/v1/users/u0").json()["likes"] == 28
+    assert client.get("/api/v1/users/missing/liked_by").status_code == 404
+    assert client.get("/api/v1/users/missing/likes_given/u0").status_code == 404
+    assert client.get("/api/v1/users/u0/likes_given/missing").status_code == 404
+
+def test_mutuals_page_past_a_thousand_likes(client: TestClient):
+    _add_users(1203)
+    for i in range(1, 1203):
+        likes.like(f"u{i}", "u0")
+    for i in range(1, 1203, 2):
+        likes.like("u0", f"u{i}")  # 601 liked back
+
+    page = client.get("/api/v1/users/u0/mutuals", params={"skip": 600, "limit": 5}).json()
+    assert page == {"total": 601, "user_ids": ["u1201"]}
+    assert likes.mutuals("u0") == [f"u{i}" for i in range(1, 1203, 2)]
+    assert likes.mutuals("u1") == ["u0"] and likes.mutuals("u2") == []
+    assert client.get("/api/v1/users/u2/mutuals").json() == {"total": 0, "user_ids": []}
+    assert client.get("/api/v1/users/missing/mutuals").status_code == 404
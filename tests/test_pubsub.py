@@ -0,0 +1,132 @@
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+from app.services import pubsub
+from app.api.v1.endpoints import websocket_chat
+
+# A worker process: subscribes to its topics, says "ready", publishes what it
+# reads on stdin, and after "done" prints everything it received as JSON
+WORKER = """
+import json, sys, time
+from app.services import pubsub
+bus = pubsub.BrokerPubSub(sys.argv[1])
+received = []
+for topic in sys.argv[2:]:
+    bus.subscribe(topic, lambda t, p: received.append([t, p.decode()]))
+time.sleep(0.2)
+print("ready", flush=True)
+for line in sys.stdin:
+    command = line.split()
+    if command[0] == "done":
+        break
+    bus.publish(command[1], command[2].encode())
+time.sleep(0.5)
+print(json.dumps(received), flush=True)
+"""
+
+def _worker(path, *topics):
+    process = subprocess.Popen(
+        [sys.executable, "-c", WORKER, path, *topics],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    assert process.stdout.readline().strip() == "ready"
+    return process
+
+def test_broker_delivers_across_processes(tmp_path):
+    path = str(tmp_path / "chat.sock")
+    broker = pubsub.Broker(path)
+    broker.start()
+    try:
+        a = _worker(path, "g1")
+        b = _worker(path, "g1", "g2")
+        c = _worker(path, "g3")
+        a.stdin.write("pub g1 hello\npub g2 only-b\ndone\n")
+        a.stdin.flush()
+        time.sleep(0.3)
+        received = {}
+        for name, process in (("a", a), ("b", b), ("c", c)):
+            if name != "a":
+                process.stdin.write("done\n")
+                process.stdin.flush()
+            received[name] = json.loads(process.stdout.readline())
+            process.wait(timeout=10)
+    finally:
+        broker.close()
+
+    # Per-topic subscription, publisher included
+    assert received["a"] == [["g1", "hello"]]
+    assert received["b"] == [["g1", "hello"], ["g2", "only-b"]]
+    assert received["c"] == []
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        self.frames.append(json.loads(frame))
+
+def test_managers_share_messages_through_broker(tmp_path, monkeypatch):
+    monkeypatch.setattr(websocket_chat.messages.history, "recent", lambda group_id: [])
+    path = str(tmp_path / "chat.sock")
+    broker = pubsub.Broker(path)
+    broker.start()
+    first, second = pubsub.BrokerPubSub(path), pubsub.BrokerPubSub(path)
+
+    async def scenario():
+        # Two managers with their own broker connections, like two workers
+        one, two = websocket_chat.ConnectionManager(first), websocket_chat.ConnectionManager(second)
+        ws1, ws2 = FakeSocket(), FakeSocket()
+        await one.connect(ws1, "g1")
+        await two.connect(ws2, "g1")
+        await asyncio.sleep(0.1)
+        await one.broadcast({"id": "m1", "message": "hi"}, "g1")
+        for _ in range(100):
+            if ws1.frames and ws2.frames:
+                break
+            await asyncio.sleep(0.01)
+        return ws1.frames, ws2.frames
+
+    try:
+        frames1, frames2 = asyncio.run(scenario())
+    finally:
+        first.close()
+        second.close()
+        broker.close()
+
+    assert frames1 == frames2 == [{"type": "message", "data": {"id": "m1", "message": "hi"}}]
+
+def test_slow_subscriber_is_dropped_without_stalling_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(pubsub, "OUTBOX_FRAMES", 4)
+    path = str(tmp_path / "chat.sock")
+    broker = pubsub.Broker(path)
+    broker.start()
+    # Subscribes and then never reads
+    stuck = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stuck.connect(path)
+    stuck.sendall(pubsub._frame("SUB", "g1"))
+    bus = pubsub.BrokerPubSub(path)
+    received = []
+    bus.subscribe("g1", lambda t, p: received.append(len(p)))
+    time.sleep(0.2)
+    try:
+        payload = b"x" * 65536
+        started = time.monotonic()
+        for _ in range(64):
+            bus.publish("g1", payload)
+            time.sleep(0.005)
+        assert time.monotonic() - started < 5
+        deadline = time.monotonic() + 5
+        while len(received) < 64 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert len(received) == 64
+        assert len(broker._topics["g1"]) == 1  # only the reading connection is left
+    finally:
+        bus.close()
+        stuck.close()
+        broker.close()
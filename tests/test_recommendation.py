@@ -0,0 +1,131 @@
+import subprocess
+import sys
+
+from app.services import embeddings, recommendation
+from app.services.embeddings import EmbeddingCache
+from tests.conftest import FakeModel
+
+def test_semantic_score_uses_embedding_cache(fake_model):
+    assert recommendation.calculate_semantic_score("Hiking", "hiking") == 100
+    assert recommendation.calculate_semantic_score("  HIKING ", "Coffee") < 100
+
+    # "hiking" and "coffee" were each encoded exactly once
+    assert sorted(fake_model.encoded) == ["coffee", "hiking"]
+    stats = embeddings.cache.stats()
+    assert stats["misses"] == 2
+    assert stats["hits"] == 1
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert len(cache) == 2
+
+def test_embedding_cache_persists(fake_model, tmp_path):
+    path = str(tmp_path / "embeddings.npz")
+    embeddings.embed(["hiking", "coffee"])
+    embeddings.cache.save(path)
+
+    restored = EmbeddingCache(path=path)
+    assert len(restored) == 2
+    assert (restored.get("hiking") == embeddings.cache.get("hiking")).all()
+
+GROUPS = [
+    {"id": "g1", "activity": ["Hiking", "Nature walks"], "location": "Central", "age_group": "18-30", "members": []},
+    {"id": "g2", "activity": ["Coffee"], "location": "East", "age_group": "40+", "members": []},
+    {"id": "g3", "activity": [], "location": "central", "members": []},
+    {"id": "g4", "activity": ["Board games", "Coffee tasting"], "location": "West", "members": ["u1"]},
+]
+USER = {"id": "u1", "interests": ["hiking", "coffee tasting"], "location": "Central", "age": 25}
+
+def test_batched_scores_match_pairwise_scores(fake_model):
+    batched = recommendation.semantic_scores(USER["interests"], GROUPS).tolist()
+
+    pairwise = [
+        max((recommendation.calculate_semantic_score(i, a) for i in USER["interests"] for a in g["activity"]), default=0)
+        for g in GROUPS
+    ]
+    assert batched == pairwise
+
+def test_scoring_encodes_in_batches(fake_model):
+    results = recommendation.score_groups(USER, GROUPS)
+
+    # Every distinct text is encoded once, in batches rather than per pair
+    texts = {t.lower() for t in USER["interests"]} | {a.lower() for g in GROUPS for a in g["activity"]}
+    assert sorted(fake_model.encoded) == sorted(texts)
+    assert fake_model.calls <= 2
+    assert results[0]["breakdown"] == {"semantic": results[0]["breakdown"]["semantic"], "location": 50, "age": 30}
+    assert results[1]["breakdown"]["age"] == 0
+    assert results[2] == {"total": 80, "breakdown": {"semantic": 0, "location": 50, "age": 30}}
+
+def test_recommendations_skip_member_groups_and_sort(fake_model):
+    recommended = recommendation.get_recommended_groups(USER, GROUPS, limit=10)
+
+    ids = [g["id"] for g in recommended]
+    assert "g4" not in ids
+    scores = [g["relevance_score"] for g in recommended]
+    assert scores == sorted(scores, reverse=True)
+    assert "relevance_score" not in GROUPS[0]
+
+def test_recommendations_prefilter_and_top_k(fake_model):
+    groups = [
+        {"id": "full", "activity": ["hiking"], "location": "Central", "members": ["a", "b"], "max_members": 2},
+        {"id": "too-old", "activity": ["hiking"], "location": "Central", "age_group": "40+", "members": []},
+    ] + [
+        {"id": f"g{i}", "activity": ["hiking" if i % 3 == 0 else "chess"], "location": "Central", "members": [], "max_members": 5}
+        for i in range(30)
+    ]
+
+    recommended = recommendation.get_recommended_groups(USER, groups, limit=4)
+
+    # Same result as scoring everything and sorting, minus the unjoinable groups
+    joinable = groups[2:]
+    expected = sorted(
+        zip(joinable, recommendation.score_groups(USER, joinable)),
+        key=lambda pair: pair[1]["total"], reverse=True,
+    )[:4]
+    assert [g["id"] for g in recommended] == [g["id"] for g, _ in expected]
+    assert [g["score_breakdown"] for g in recommended] == [r["breakdown"] for _, r in expected]
+
+def test_lexical_fallback_while_model_loads(monkeypatch):
+    def not_loaded():
+        raise AssertionError("model must not be loaded on the request path")
+    monkeypatch.setattr(embeddings, "_model", None)
+    monkeypatch.setattr(embeddings, "get_model", not_loaded)
+
+    scores = recommendation.semantic_scores(USER["interests"], GROUPS)
+    assert scores.tolist() == [100, 50, 0, 100]  # "coffee" vs "coffee tasting": 1/2
+
+    recommended = recommendation.get_recommended_groups(USER, GROUPS)
+    assert recommended[0]["id"] == "g1"
+
+def test_warmup_loads_model_in_background(monkeypatch):
+    built = []
+    monkeypatch.setattr(embeddings, "_model", None)
+    monkeypatch.setattr(embeddings, "get_model", lambda: setattr(embeddings, "_model", FakeModel()))
+
+    thread = embeddings.start_warmup(then=lambda: built.append(True))
+    thread.join(timeout=5)
+
+    assert embeddings.is_ready()
+    assert embeddings.model_status()["state"] == "ready"
+    assert built == [True]
+    assert embeddings.start_warmup() is None  # already loaded
+
+def test_ready_endpoint(client, monkeypatch):
+    monkeypatch.setattr(embeddings, "_model", None)
+    assert client.get("/ready").json()["ready"] is False
+
+    monkeypatch.setattr(embeddings, "_model", FakeModel())
+    body = client.get("/ready").json()
+    assert body["ready"] is True
+    assert body["model"]["state"] == "ready"
+
+def test_app_import_does_not_load_torch():
+    code = "import sys, app.main; assert 'sentence_transformers' not in sys.modules and 'torch' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
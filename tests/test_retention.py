@@ -0,0 +1,124 @@
+import os
+import random
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.data import storage
+from app.data.message_archive import MessageArchive, message_key
+from app.services import messages, retention
+
+NOW = datetime(2024, 6, 30, 12, 0, 0)
+
+def _messages(group_id, n, days, seed=3):
+    rng = random.Random(seed)
+    return [
+        {"id": f"{group_id}-m{i}", "group_id": group_id, "message": f"hello {i}",
+         "timestamp": (NOW - timedelta(seconds=rng.uniform(0, days * 86400))).isoformat()}
+        for i in range(n)
+    ]
+
+def test_archive_pages_match_sorted_messages(tmp_path):
+    archive = MessageArchive(str(tmp_path / "archive"), block_messages=16)
+    history = _messages("g1", 500, days=5)
+    archive.add("g1", history[:300])
+    archive.add("g1", history[300:])
+    expected = sorted(history, key=message_key)
+    keys = [message_key(m) for m in expected]
+
+    assert archive.count("g1") == 500
+    assert archive.page("g1", limit=20) == expected[-20:]
+    assert archive.page("g1", before=keys[100], limit=30) == expected[70:100]
+    assert archive.page("g1", after=keys[100], limit=30) == expected[101:131]
+    assert archive.page("g1", after=keys[10], before=keys[15], limit=30) == expected[11:15]
+
+    # A fresh instance reads the same files; cursors are found without a cache
+    reopened = MessageArchive(archive.root, block_messages=16)
+    assert reopened.locate("g1", "missing") is None
+    assert len(reopened._blocks) == 0  # unknown cursors decompress nothing
+    assert reopened.locate("g1", expected[42]["id"]) == keys[42]
+    assert len(reopened._blocks) == 1
+
+    assert MessageArchive(archive.root).locate("g1", expected[400]["id"]) == keys[400]
+    # Only finished files are left behind, under their own names
+    assert not [name for name in os.listdir(os.path.join(archive.root, "g1")) if name.endswith(".tmp")]
+
+    cutoff = expected[250]["timestamp"][:10]
+    dropped = reopened.drop_before("g1", cutoff)
+    assert dropped > 0 and reopened.count("g1") == 500 - dropped
+    assert all(m["timestamp"] >= cutoff[:10] for m in reopened.page("g1", limit=500))
+
+def test_old_messages_move_to_archive_and_history_pages_across_tiers():
+    history = _messages("g1", 400, days=30)
+    storage.add_items("messages", history)
+    storage.add_item("groups", {"id": "g1", "name": "G"})
+
+    totals = retention.run(NOW)
+    hot = storage.find_by("messages", "group_id", "g1")
+    cutoff = (NOW - timedelta(days=7)).isoformat()
+    assert totals["archived"] == 400 - len(hot) and totals["deleted"] == 0
+    assert hot and all(m["timestamp"] >= cutoff for m in hot)
+
+    expected = sorted(history, key=message_key)
+    # Scrolling back from the newest page reaches the oldest archived message
+    pages, before = [], None
+    while True:
+        page = messages.history_page("g1", before=before, limit=37)
+        if not page:
+            break
+        pages = page + pages
+        before = page[0]["id"]
+    assert pages == expected
+
+    # And forward from an archived cursor into the main store
+    start = len(expected) - len(hot) - 5
+    assert messages.history_page("g1", after=expected[start]["id"], limit=10) == expected[start + 1 : start + 11]
+
+def test_workers_share_one_archive():
+    storage.add_items("messages", _messages("g1", 100, days=30))
+    storage.add_item("groups", {"id": "g1"})
+    # Another worker's instance over the same directory
+    other = MessageArchive(retention.get_archive().root)
+    assert other.page("g1") == []
+
+    with other.locked():
+        # Someone else is applying retention: this worker skips the round
+        assert retention.run(NOW)["archived"] == 0
+        assert len(storage.find_by("messages", "group_id", "g1")) == 100
+
+    archived = retention.run(NOW)["archived"]
+    assert archived > 0
+    # The other worker sees the segments written here
+    assert other.count("g1") == archived
+    assert retention.run(NOW)["archived"] == 0
+
+def test_retain_days_and_delete_only_policies():
+    storage.add_items("messages", _messages("g1", 200, days=30) + _messages("g2", 200, days=30))
+    for gid in ("g1", "g2"):
+        storage.add_item("groups", {"id": gid})
+    retention.set_policy("g1", {"hot_days": 3, "retain_days": 10})
+    retention.set_policy("g2", {"hot_days": 3, "archive": False})
+
+    retention.run(NOW)
+    archive = retention.get_archive()
+    retained = messages.history_page("g1", limit=200)
+    # Whole daily segments are dropped, so a few messages just past 10 days may remain
+    assert all(m["timestamp"] >= (NOW - timedelta(days=11)).isoformat() for m in retained)
+    assert archive.count("g2") == 0
+    assert all(m["timestamp"] >= (NOW - timedelta(days=3)).isoformat() for m in messages.history_page("g2", limit=200))
+
+def test_retention_policy_endpoint(client: TestClient):
+    admin = client.post(
+        "/api/v1/users/", json={"name": "Ann", "email": "ann@example.com", "age": 30, "location": "City"}
+    ).json()["id"]
+    group = client.post(
+        "/api/v1/groups/",
+        headers={"X-User-ID": admin},
+        json={"name": "G", "description": "D", "activity": [], "location": "City", "max_members": 5},
+    ).json()["id"]
+    url = f"/api/v1/groups/{group}/messages/retention"
+
+    assert client.get(url).json()["hot_days"] == retention.DEFAULT_HOT_DAYS
+    assert client.put(url, headers={"X-User-ID": "someone"}, json={"hot_days": 1}).status_code == 403
+    assert client.put(url, headers={"X-User-ID": admin}, json={"hot_days": 5, "retain_days": 2}).status_code == 400
+    res = client.put(url, headers={"X-User-ID": admin}, json={"hot_days": 2, "retain_days": 30})
+    assert res.json() == {"hot_days": 2, "archive": True, "retain_days": 30}
+    assert client.get(url).json() == res.json()
@@ -0,0 +1,184 @@
+import json
+import sqlite3
+import sys
+import pytest
+from fastapi.testclient import TestClient
+from app.data import migrate, sqlite_store, storage
+from app.data.errors import MigrationError
+from app.data.sqlite_store import SqliteStore
+
+@pytest.fixture
+def sqlite_backend(tmp_path, monkeypatch):
+    """Switch storage to a fresh SQLite database."""
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "SQLITE_PATH", str(tmp_path / "db.sqlite3"))
+    storage.reset_store()
+    yield
+    storage.reset_store()
+
+def test_crud_contract(sqlite_backend):
+    storage.add_item("users", {"id": "u1", "email": "a@example.com", "name": "Alice"})
+    storage.add_item("likes", {"id": "l1", "from": "u1"})
+
+    assert storage.get_item_by_id("users", "u1")["name"] == "Alice"
+    assert storage.get_item_by_id("likes", "l1")["from"] == "u1"
+    assert storage.find_one("users", "email", "a@example.com")["id"] == "u1"
+
+    assert storage.update_item("users", "u1", {"name": "Alicia"})
+    assert storage.get_all("users") == [{"id": "u1", "email": "a@example.com", "name": "Alicia"}]
+    assert not storage.update_item("users", "missing", {"name": "x"})
+
+    assert storage.delete_item("users", "u1")
+    assert not storage.delete_item("users", "u1")
+    assert storage.get_all("users") == []
+
+def test_unique_email(sqlite_backend):
+    storage.add_item("users", {"id": "u1", "email": "a@example.com"})
+    with pytest.raises(storage.DuplicateKeyError) as e:
+        storage.add_item("users", {"id": "u2", "email": "a@example.com"})
+    assert e.value.field == "email"
+
+def test_query_pushes_down_filter_and_pagination(sqlite_backend):
+    for i in range(10):
+        storage.add_item("groups", {"id": f"g{i}", "admin_id": "a" if i % 2 else "b"})
+
+    page = storage.query("groups", {"admin_id": "a"}, skip=1, limit=2)
+    assert [g["id"] for g in page] == ["g3", "g5"]
+
+def test_migrates_json_once(tmp_path):
+    json_path = tmp_path / "db.json"
+    json_path.write_text(json.dumps({"users": [{"id": "u1", "email": "a@example.com"}], "groups": []}))
+    # A write still sitting in the JSON journal is migrated too
+    (tmp_path / "db.json.journal").write_text(
+        json.dumps({"op": "put", "c": "groups", "item": {"id": "g1", "admin_id": "u1"}}) + "\n"
+    )
+
+    store = SqliteStore(str(tmp_path / "db.sqlite3"), storage.INDEXES, migrate_from=str(json_path))
+    assert [u["id"] for u in store.get_all("users")] == ["u1"]
+    assert [g["id"] for g in store.get_all("groups")] == ["g1"]
+
+    store.delete_item("users", "u1")
+    assert not store.migrate_from_json(str(json_path))
+    assert store.get_all("users") == []
+    store.close()
+
+def test_concurrent_starts_migrate_once(tmp_path, monkeypatch):
+    json_path = tmp_path / "db.json"
+    json_path.write_text(json.dumps({"users": [{"id": "u1", "email": "a@example.com"}], "groups": []}))
+    sqlite_path = str(tmp_path / "db.sqlite3")
+    first, second = (SqliteStore(sqlite_path, storage.INDEXES) for _ in range(2))
+
+    # The second worker passed the quick check; the first imports and
+    # takes a write while the second is still reading db.json
+    load = sqlite_store.JsonStore.load
+    def load_meanwhile(self):
+        monkeypatch.setattr(sqlite_store.JsonStore, "load", load)
+        assert first.migrate_from_json(str(json_path))
+        first.add_item("users", {"id": "u2", "email": "b@example.com"})
+        return load(self)
+    monkeypatch.setattr(sqlite_store.JsonStore, "load", load_meanwhile)
+
+    assert not second.migrate_from_json(str(json_path))
+    assert [u["id"] for u in second.get_all("users")] == ["u1", "u2"]
+    first.close()
+    second.close()
+
+def test_migration_reports_duplicate_emails_instead_of_dropping_users(tmp_path):
+    json_path = tmp_path / "db.json"
+    json_path.write_text(json.dumps({"users": [
+        {"id": "u1", "email": "a@example.com"},
+        {"id": "u2", "email": "a@example.com"},
+        {"id": "u3", "email": "b@example.com"},
+        {"id": "u4", "email": "b@example.com"},
+    ]}))
+    store = SqliteStore(str(tmp_path / "db.sqlite3"), storage.INDEXES)
+
+    with pytest.raises(MigrationError) as e:
+        store.migrate_from_json(str(json_path))
+    assert [(c, i) for c, i, _ in e.value.duplicates] == [("users", "u2"), ("users", "u4")]
+    assert store.get_all("users") == []
+
+    # Once fixed, the import goes through
+    json_path.write_text(json.dumps({"users": [
+        {"id": "u1", "email": "a@example.com"},
+        {"id": "u2", "email": "c@example.com"},
+    ]}))
+    assert store.migrate_from_json(str(json_path))
+    assert [u["id"] for u in store.get_all("users")] == ["u1", "u2"]
+    store.close()
+
+def test_migrate_command_creates_ordered_indexes(tmp_path, monkeypatch):
+    json_path = tmp_path / "db.json"
+    json_path.write_text(json.dumps({"users": [], "groups": []}))
+    sqlite_path = str(tmp_path / "db.sqlite3")
+    monkeypatch.setattr(sys, "argv", ["migrate", "--json", str(json_path), "--sqlite", sqlite_path])
+    migrate.main()
+
+    conn = sqlite3.connect(sqlite_path)
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    conn.close()
+    assert "ix_messages_group_id_timestamp" in names
+
+def test_read_groups_endpoint_on_sqlite(sqlite_backend, client: TestClient):
+    res = client.post(
+        "/api/v1/users/",
+        json={"name": "Admin", "email": "admin@example.com", "age": 20, "location": "City", "interests": []}
+    )
+    admin_id = res.json()["id"]
+    for name in ["One", "Two", "Three"]:
+        client.post(
+            "/api/v1/groups/",
+            headers={"X-User-ID": admin_id},
+            json={"name": name, "description": "D", "activity": ["A"], "location": "L", "max_members": 3}
+        )
+
+    res = client.get("/api/v1/groups/", params={"skip": 1, "limit": 1, "admin_id": admin_id})
+    assert [g["name"] for g in res.json()] == ["Two"]
+    assert client.get("/api/v1/groups/", params={"admin_id": "nobody"}).json() == []
+
+def test_ordered_page_matches_json(sqlite_backend):
+    for i in [3, 0, 4, 1, 2]:
+        storage.add_item("messages", {"id": f"m{i}", "group_id": "g1", "timestamp": f"2024-01-01T00:00:0{i}"})
+    storage.add_item("messages", {"id": "m5", "group_id": "g1"})
+
+    def ids(**kwargs):
+        return [m["id"] for m in storage.ordered_page("messages", "g1", **kwargs)]
+
+    # Missing timestamps sort first, like JsonStore
+    assert ids() == ["m5", "m0", "m1", "m2", "m3", "m4"]
+    assert ids(before="m3", limit=2) == ["m1", "m2"]
+    assert ids(after="m1", limit=2) == ["m2", "m3"]
+
+    plan = storage.get_store()._conn().execute(
+        "EXPLAIN QUERY PLAN SELECT data FROM messages WHERE group_id = ? "
+        "ORDER BY COALESCE(json_extract(data, '$.timestamp'), '') DESC, id DESC LIMIT 5",
+        ["g1"],
+    ).fetchall()
+    assert "ix_messages_group_id_timestamp" in str(plan)
+
+def test_add_items_is_all_or_nothing(sqlite_backend):
+    storage.add_items("users", [{"id": "u1", "email": "a@example.com"}, {"id": "u2", "email": "b@example.com"}])
+    with pytest.raises(storage.DuplicateKeyError):
+        storage.add_items("users", [{"id": "u3", "email": "c@example.com"}, {"id": "u4", "email": "a@example.com"}])
+    assert [u["id"] for u in storage.get_all("users")] == ["u1", "u2"]
+
+def test_open_groups_see_other_workers_writes(sqlite_backend, monkeypatch):
+    storage.add_item("groups", {"id": "g1", "admin_id": "u0", "members": ["u0"], "max_members": 2})
+    storage.add_item("groups", {"id": "g2", "admin_id": "u0", "members": ["u0"], "max_members": 3})
+    assert [g["id"] for g in storage.open_groups()] == ["g1", "g2"]
+
+    # A second worker process writes to the same database
+    other = SqliteStore(storage.SQLITE_PATH, storage.INDEXES, ordered=storage.ORDERED)
+    other.update_item("groups", "g1", {"members": ["u0", "u1"]})
+    other.add_item("groups", {"id": "g3", "admin_id": "u0", "members": ["u0"], "max_members": 2})
+    assert [g["id"] for g in storage.open_groups()] == ["g2", "g3"]
+    assert storage._open_slots.remaining("g1") is None
+
+    # Once the log is trimmed past what this worker has seen, it rebuilds
+    monkeypatch.setattr("app.data.sqlite_store.CHANGE_LOG_ROWS", 1)
+    other.delete_item("groups", "g3")
+    other.update_item("groups", "g2", {"max_members": 5})
+    other.changes("groups", None)
+    assert [g["id"] for g in storage.open_groups()] == ["g2"]
+    assert storage._open_slots.remaining("g2") == 4
+    other.close()
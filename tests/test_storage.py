@@ -0,0 +1,211 @@
+import json
+import os
+import pytest
+from app.data import storage
+from app.data.json_store import JsonStore
+
+def test_reads_are_served_from_cache(monkeypatch):
+    storage.add_item("users", {"id": "u1", "name": "Alice"})
+    store = storage.get_store()
+
+    def fail_read():
+        raise AssertionError("database file was re-read")
+
+    monkeypatch.setattr(store, "_read_file", fail_read)
+
+    assert storage.get_item_by_id("users", "u1")["name"] == "Alice"
+    assert len(storage.get_all("users")) == 1
+
+def test_external_change_invalidates_cache():
+    storage.add_item("users", {"id": "u1", "name": "Alice"})
+    assert len(storage.get_all("users")) == 1
+
+    # Simulate a seeding script rewriting the file behind our back
+    with open(storage.DB_PATH, "w", encoding="utf-8") as f:
+        json.dump({"users": [], "groups": [{"id": "g1", "name": "Seeded"}]}, f)
+
+    assert storage.get_item_by_id("groups", "g1")["name"] == "Seeded"
+    # Journaled writes not yet folded into the snapshot are re-applied
+    assert [u["id"] for u in storage.get_all("users")] == ["u1"]
+
+def test_returned_items_do_not_alias_cache():
+    storage.add_item("groups", {"id": "g1", "members": ["a"]})
+
+    group = storage.get_item_by_id("groups", "g1")
+    group["members"].append("b")
+
+    assert storage.get_item_by_id("groups", "g1")["members"] == ["a"]
+
+def test_unique_index_rejects_duplicate_email():
+    storage.add_item("users", {"id": "u1", "email": "a@example.com"})
+
+    with pytest.raises(storage.DuplicateKeyError):
+        storage.add_item("users", {"id": "u2", "email": "a@example.com"})
+    with pytest.raises(storage.DuplicateKeyError):
+        storage.add_item("users", {"id": "u1", "email": "b@example.com"})
+
+    assert storage.find_one("users", "email", "a@example.com")["id"] == "u1"
+
+def test_secondary_index_follows_updates_and_deletes():
+    storage.add_item("messages", {"id": "m1", "group_id": "g1"})
+    storage.add_item("messages", {"id": "m2", "group_id": "g1"})
+
+    storage.update_item("messages", "m2", {"group_id": "g2"})
+    assert [m["id"] for m in storage.find_by("messages", "group_id", "g1")] == ["m1"]
+    assert [m["id"] for m in storage.find_by("messages", "group_id", "g2")] == ["m2"]
+
+    storage.delete_item("messages", "m1")
+    assert storage.find_by("messages", "group_id", "g1") == []
+    assert storage.get_item_by_id("messages", "m1") is None
+
+def test_writes_go_to_journal_and_replay_on_restart():
+    storage.get_all("users")
+    snapshot = open(storage.DB_PATH).read()
+
+    storage.add_item("users", {"id": "u1", "name": "Alice"})
+    storage.update_item("users", "u1", {"name": "Alicia"})
+    storage.add_item("users", {"id": "u2", "name": "Bob"})
+    storage.delete_item("users", "u2")
+
+    # The snapshot is untouched, the mutations live in the journal
+    assert open(storage.DB_PATH).read() == snapshot
+    assert os.path.getsize(storage.DB_PATH + ".journal") > 0
+
+    store = JsonStore(storage.DB_PATH, storage.INDEXES)
+    assert [u["name"] for u in store.get_all("users")] == ["Alicia"]
+
+def test_torn_journal_tail_is_ignored():
+    storage.add_item("users", {"id": "u1", "name": "Alice"})
+    with open(storage.DB_PATH + ".journal", "ab") as f:
+        f.write(b'{"op":"put","c":"users","item":{"id":"u2"')
+
+    store = JsonStore(storage.DB_PATH, storage.INDEXES)
+    assert [u["id"] for u in store.get_all("users")] == ["u1"]
+
+def test_writes_after_a_torn_tail_survive_the_next_crash():
+    storage.add_item("users", {"id": "a"})
+    storage.reset_store()
+    with open(storage.DB_PATH + ".journal", "ab") as f:
+        f.write(b'{"op":"put","c":"users","item":{"id":"x"')
+
+    # First restart: the torn record is cut off before new appends
+    store = JsonStore(storage.DB_PATH, storage.INDEXES)
+    store.add_item("users", {"id": "b"})
+    store.add_item("users", {"id": "c"})
+    # Second crash (no compaction on the way down)
+    store._journal_file.close()
+
+    store = JsonStore(storage.DB_PATH, storage.INDEXES)
+    assert [u["id"] for u in store.get_all("users")] == ["a", "b", "c"]
+
+def test_processes_sharing_the_files_keep_each_others_writes():
+    # Two stores on the same files stand in for two worker processes
+    a = JsonStore(storage.DB_PATH, storage.INDEXES)
+    b = JsonStore(storage.DB_PATH, storage.INDEXES)
+    a.add_item("users", {"id": "a1"})
+    b.add_item("users", {"id": "b1"})  # b's journal file is now open
+    assert b.get_item_by_id("users", "a1") is not None
+    assert a.get_item_by_id("users", "b1") is not None
+
+    a.compact()  # replaces the journal b has open
+    b.add_item("users", {"id": "b2"})
+    assert b.get_item_by_id("users", "b2") is not None
+    assert a.get_item_by_id("users", "b2") is not None
+    b.compact()
+    a.add_item("users", {"id": "a2"})
+
+    restarted = JsonStore(storage.DB_PATH, storage.INDEXES)
+    assert sorted(u["id"] for u in restarted.get_all("users")) == ["a1", "a2", "b1", "b2"]
+
+def test_compaction_folds_journal_into_snapshot():
+    storage.add_item("users", {"id": "u1", "name": "Alice"})
+    storage.get_store().compact()
+
+    assert not os.path.exists(storage.DB_PATH + ".journal")
+    with open(storage.DB_PATH, encoding="utf-8") as f:
+        assert json.load(f)["users"] == [{"id": "u1", "name": "Alice"}]
+
+    storage.add_item("users", {"id": "u2", "name": "Bob"})
+    assert len(JsonStore(storage.DB_PATH, storage.INDEXES).get_all("users")) == 2
+
+def test_compaction_does_not_undo_a_concurrent_save(monkeypatch):
+    storage.add_item("users", {"id": "old"})
+    store = storage.get_store()
+    write_temp = store._write_temp
+
+    def save_meanwhile(data):
+        # save() runs while compaction serialises its (now stale) snapshot
+        path = write_temp(data)
+        monkeypatch.setattr(store, "_write_temp", write_temp)
+        store.save({"users": [{"id": "new"}], "groups": []})
+        return path
+
+    monkeypatch.setattr(store, "_write_temp", save_meanwhile)
+    store.compact()
+
+    assert [u["id"] for u in JsonStore(storage.DB_PATH, storage.INDEXES).get_all("users")] == ["new"]
+    assert not [name for name in os.listdir(os.path.dirname(storage.DB_PATH)) if name.endswith(".tmp")]
+
+def test_transaction_on_item_deleted_meanwhile_raises():
+    storage.add_item("users", {"id": "u1", "name": "Alice"})
+    with pytest.raises(storage.ItemDeletedError):
+        with storage.transaction("users", "u1") as user:
+            storage.delete_items("users", ["u1"])
+            user["name"] = "Bob"
+    assert storage.get_item_by_id("users", "u1") is None
+
+def test_size_threshold_triggers_background_compaction(tmp_path):
+    store = JsonStore(str(tmp_path / "small.json"), compact_bytes=200)
+    for i in range(20):
+        store.add_item("messages", {"id": f"m{i}", "message": "x" * 20})
+    store.close()
+
+    with open(store.path, encoding="utf-8") as f:
+        assert len(json.load(f)["messages"]) == 20
+    assert not os.path.exists(store.journal_path)
+
+def _add_messages():
+    # Inserted out of order; pages follow the timestamps
+    for i in [3, 0, 4, 1, 2]:
+        storage.add_item("messages", {"id": f"m{i}", "group_id": "g1", "timestamp": f"2024-01-01T00:00:0{i}"})
+    storage.add_item("messages", {"id": "x", "group_id": "g2", "timestamp": "2024-01-01T00:00:01"})
+
+def test_ordered_page_by_partition():
+    _add_messages()
+
+    def ids(**kwargs):
+        return [m["id"] for m in storage.ordered_page("messages", "g1", **kwargs)]
+
+    assert ids() == ["m0", "m1", "m2", "m3", "m4"]
+    assert ids(limit=2) == ["m3", "m4"]
+    assert ids(before="m3", limit=2) == ["m1", "m2"]
+    assert ids(after="m1", limit=2) == ["m2", "m3"]
+    assert ids(after="m0", before="m3") == ["m1", "m2"]
+
+    storage.update_item("messages", "m0", {"timestamp": "2024-01-01T00:00:09"})
+    storage.delete_item("messages", "m2")
+    assert ids() == ["m1", "m3", "m4", "m0"]
+
+    with pytest.raises(KeyError):
+        storage.ordered_page("messages", "g1", before="x")
+
+def test_add_items_is_one_journal_write_and_all_or_nothing(monkeypatch):
+    storage.add_item("messages", {"id": "m0", "group_id": "g1"})
+    store = storage.get_store()
+    appends = []
+    original = store._append
+    monkeypatch.setattr(store, "_append", lambda records: appends.append(len(records)) or original(records))
+
+    storage.add_items("messages", [{"id": f"m{i}", "group_id": "g1"} for i in range(1, 4)])
+    assert appends == [3]
+
+    with pytest.raises(storage.DuplicateKeyError):
+        storage.add_items("messages", [{"id": "m4", "group_id": "g1"}, {"id": "m1", "group_id": "g1"}])
+    with pytest.raises(storage.DuplicateKeyError):
+        storage.add_items("messages", [{"id": "m5", "group_id": "g1"}, {"id": "m5", "group_id": "g1"}])
+    assert appends == [3]
+    assert [m["id"] for m in storage.find_by("messages", "group_id", "g1")] == ["m0", "m1", "m2", "m3"]
+
+    # Survives a restart like single writes
+    store = JsonStore(storage.DB_PATH, storage.INDEXES)
+    assert len(store.get_all("messages")) == 4
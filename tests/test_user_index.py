@@ -0,0 +1,67 @@
+import numpy as np
+from app.data import storage
+from app.services import user_index
+from app.services.embeddings import embed
+
+def _user(user_id, interests, location="Town", **extra):
+    return {
+        "id": user_id, "name": user_id, "email": f"{user_id}@example.com", "age": 30,
+        "interests": interests, "location": location, **extra,
+    }
+
+def test_pooled_vectors_match_exact_cosine(fake_model):
+    users = [_user("u1", ["hiking", "coffee"]), _user("u2", ["chess"]), _user("u3", [])]
+    index = user_index.UserInterestIndex()
+    index.rebuild(users)
+    assert len(index) == 2 and "u3" not in index
+
+    query = user_index.interest_vector(["hiking"])
+    found = dict(index.search(query, 5))
+    expected = user_index.pool(embed(["hiking", "coffee"])) @ query
+    assert set(found) == {"u1", "u2"}
+    assert np.isclose(found["u1"], expected)
+    assert index.search(query, 5, exclude="u1")[0][0] == "u2"
+
+def test_incremental_add_change_and_remove(fake_model):
+    index = user_index.UserInterestIndex()
+    index.rebuild([])
+    for i in range(20):
+        index.add_user(_user(f"u{i}", [f"topic{i}"]))
+    index.add_user(_user("u3", ["sailing"]))
+    for i in range(0, 10, 2):
+        index.remove_user(f"u{i}")
+
+    assert len(index) == 15
+    assert index.search(user_index.interest_vector(["sailing"]), 1)[0][0] == "u3"
+    ids = [user_id for user_id, _ in index.search(user_index.interest_vector(["topic4"]), 20)]
+    assert "u4" not in ids and len(ids) == 15
+
+def test_similar_users_endpoint(fake_model, monkeypatch, client):
+    monkeypatch.setattr(user_index, "ANN_MIN_ROWS", 50)
+    for i in range(200):
+        storage.add_item("users", _user(f"u{i}", [f"topic{i}", f"theme{i % 7}"], location="Elsewhere"))
+
+    def create(email, interests, location):
+        res = client.post("/api/v1/users/", json={
+            "name": email, "email": email, "age": 30, "location": location, "interests": interests,
+        })
+        return res.json()["id"]
+
+    me = create("me@example.com", ["rock climbing", "board games"], "Town")
+    near = create("near@example.com", ["rock climbing", "board games"], "Town")
+    far = create("far@example.com", ["rock climbing", "board games"], "Elsewhere")
+
+    res = client.get(f"/api/v1/users/{me}/similar", params={"limit": 3, "nprobe": 10_000})
+    assert res.status_code == 200
+    ranked = res.json()
+    assert [u["id"] for u in ranked[:2]] == [near, far]
+    assert ranked[0]["score_breakdown"]["location"] == 50
+    assert ranked[0]["score_breakdown"]["semantic"] == ranked[1]["score_breakdown"]["semantic"]
+    assert me not in [u["id"] for u in ranked]
+    # Trained in the background; the first request was scored exactly
+    user_index.index._ivf.wait()
+    assert user_index.index._ivf.ready
+    res = client.get(f"/api/v1/users/{me}/similar", params={"limit": 3, "nprobe": 10_000})
+    assert [u["id"] for u in res.json()] == [u["id"] for u in ranked]
+
+    assert client.get("/api/v1/users/missing/similar").status_code == 404